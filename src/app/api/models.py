@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 from app.serve.ab_test.ab import ABTestMode
 
@@ -16,6 +16,8 @@ class PredictRequest(BaseModel):
 
 class PredictResponse(BaseModel):
     survived: float
+    # The A/B variant that served the request; pass it back to /ab-test/feedback in bandit mode
+    variant: str | None = None
 
 class LoadModelRequest(BaseModel):
     model_path: str
@@ -29,12 +31,37 @@ class DeployModelRequest(BaseModel):
     model_version: str
     # model_variant: Literal["deploy"]
 
+def _check_ab_weights(weights: list[float]) -> list[float]:
+    # An A/B test has exactly two variants, A and B: the request names two models and shadow mode
+    # compares B against A. The routers and the bandit take any number of arms, this API does not.
+    if len(weights) != 2 or any(weight < 0 for weight in weights) or sum(weights) <= 0:
+        raise ValueError("weights must be two non-negative numbers [A, B], not both zero")
+    return weights
+
+class RampStep(BaseModel):
+    after_seconds: float
+    weights: list[float]
+
+    @field_validator("weights")
+    @classmethod
+    def _check_weights(cls, weights: list[float]) -> list[float]:
+        return _check_ab_weights(weights)
+
 class ABTestRequest(BaseModel):
     name_a: str | None = None
     version_a: str | None = None
     name_b: str
     version_b: str
     mode: ABTestMode
+    # Traffic split [A, B] for the split and hash modes; defaults to 50/50
+    weights: list[float] | None = None
+    # Replaces `weights` with a schedule, e.g. 5% to B first, then 20% after 10 minutes
+    ramp: list[RampStep] | None = None
+
+    @field_validator("weights")
+    @classmethod
+    def _check_weights(cls, weights: list[float] | None) -> list[float] | None:
+        return weights if weights is None else _check_ab_weights(weights)
     
 class LoadModelResponse(BaseModel):
     model_name: str
@@ -50,3 +77,7 @@ class DeployModelResponse(BaseModel):
     
 class ABTestResponse(BaseModel):
     pass
+
+class BanditFeedbackRequest(BaseModel):
+    variant: str
+    reward: float
@@ -1,29 +1,171 @@
-from fastapi import APIRouter
-
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from mlflow.exceptions import MlflowException
+
+from app.serve.ab_test.routing import RampSchedule
+from app.serve.artifacts import artifact_loader
+from app.serve.control import control_plane
 from app.serve.model_server import model_hub
+from app.serve.profiler import loop_monitor, profiler
 from app.serve.inference import runner
-from app.api.models import (ABTestResponse, DeployModelResponse, 
+from app.serve.tracing import current_trace
+from app.serve.warmup import warmup_rows
+from app.api.models import (ABTestResponse, BanditFeedbackRequest, DeployModelResponse, 
                             LoadModelRequest, LoadModelResponse, 
                             PredictRequest, PredictResponse, 
                             DeployModelRequest, ABTestRequest
                             )
+from app.api.streaming import BodyStreamingResponse, iter_json_records, stream_json_page
+from app.loggers.history.base import HistoryFilter, decode_cursor, encode_cursor
 
 
 
 router = APIRouter()
 
 
-@router.post("/predict", response_model=PredictResponse)
-async def predict(request: PredictRequest, user_id: str = None):
-    response = await runner.run_inference(request, user_id)
+@router.post("/predict", response_model=PredictResponse, response_model_exclude_none=True)
+async def predict(request: PredictRequest, user_id: str = None,
+                  x_request_timeout: float | None = Header(None)):
+    """Scores one passenger. When the server is saturated it answers 429 or 503 with a Retry-After header.
+
+    `X-Request-Timeout` is how many seconds the client waits; a request still queued after that is
+    dropped instead of being scored for nobody.
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        # Reading the body and validating it into a PredictRequest
+        trace.mark("validate")
+    response = await runner.run_inference(request, user_id, timeout=x_request_timeout)
     return response
 
 
+@router.post("/predict/batch")
+async def predict_batch(request: Request, user_id: str = None):
+    """Scores a JSON array or NDJSON body of PredictRequests, streaming one NDJSON result line per row.
+
+    Rows may carry their own `user_id`, otherwise the query parameter is used. Invalid rows
+    produce an `{"error": ...}` line instead of failing the whole upload.
+    """
+    async def results():
+        records = iter_json_records(request.stream())
+        try:
+            async for result in runner.run_batch_inference(records, user_id):
+                yield json.dumps(result) + "\n"
+        except ValueError as e:
+            # Malformed body: report it as the last line, results so far were already sent
+            yield json.dumps({"error": f"Invalid request body: {e}"}) + "\n"
+
+    return BodyStreamingResponse(results(), media_type="application/x-ndjson")
+
+
+def _epoch(moment: datetime) -> float:
+    # Times without an offset are UTC, like the history's timestamps, not the server's local time
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
 @router.get("/history")
-async def history():
-    # Replace with history fetching logic
-    response = await model_hub.configs.histories[0].fetch_history()
-    return response
+async def history(model_name: str | None = None,
+                  model_version: str | None = None,
+                  variant: str | None = None,
+                  start_time: datetime | None = None,
+                  end_time: datetime | None = None,
+                  cursor: str | None = None,
+                  limit: int = Query(100, ge=1, le=10_000)):
+    """Streams one page of history records, oldest first.
+
+    Pass the returned `next_cursor` back as `cursor` to get the next page; it is null on the last one.
+    """
+    try:
+        after_id = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = HistoryFilter(model_name=model_name, model_version=model_version, variant=variant,
+                            start_time=_epoch(start_time) if start_time else None,
+                            end_time=_epoch(end_time) if end_time else None)
+    records = model_hub.configs.histories[0].iter_history(filters, after_id, limit + 1)
+    return StreamingResponse(stream_json_page(records, limit, encode_cursor), media_type="application/json")
+
+
+async def _load(payload: dict, origin: bool) -> LoadModelResponse:
+    request = LoadModelRequest(**payload)
+    version = request.version
+    name = request.name
+    try:
+        # Downloading and unpickling are blocking
+        model = await asyncio.to_thread(artifact_loader.load, request.model_path)
+        preprocessor = await asyncio.to_thread(artifact_loader.load, request.preprocessor_path)
+        # Every worker keeps its own copy in memory, but the model is registered in MLflow only once
+        _, mlflow_version = await asyncio.to_thread(model_hub.register_model, model, preprocessor, version, name,
+                                                    log_to_mlflow=origin and model_hub.configs.register_in_mlflow)
+    except (ValueError, OSError, MlflowException) as e:
+        return LoadModelResponse(model_name=name,
+                                 model_version=version,
+                                 mlflow_version=None,
+                                 status=f"Failed to push model: {e}")
+    return LoadModelResponse(model_name=name,
+                             model_version=version,
+                             mlflow_version=None if mlflow_version is None else str(mlflow_version),
+                             status="Model loaded successfully")
+
+
+async def _deploy(payload: dict, origin: bool) -> DeployModelResponse:
+    request = DeployModelRequest(**payload)
+    name = request.model_name
+    version = request.model_version
+    if not model_hub.is_model_registered(name, version):
+        return DeployModelResponse(model_name=name, model_version=version, variant=None,
+                                   status="Failed: Model in question was not registered.")
+    # Loading talks to the logging extensions and replaying reads the history; keep both off the loop
+    model = await asyncio.to_thread(model_hub.load_model, name, version)
+    rows = await asyncio.to_thread(warmup_rows, model_hub.configs.histories, runner.runner_configs.warmup_rows)
+
+    # Arbitrary choice: replace all models for the new deploy. Implementation could be different in real scenarios
+    try:
+        await runner.swap_models([model], warmup_rows=rows)
+    except ValueError as e:
+        return DeployModelResponse(model_name=name, model_version=version, variant=None, status=f"Failed: {e}")
+
+    return DeployModelResponse(
+        status="Model deployed successfully",
+        model_name=model.model_name,
+        model_version=model.version,
+        variant=model.variant
+    )
+
+
+async def _ab_test(payload: dict, origin: bool) -> ABTestResponse:
+    request = ABTestRequest(**payload)
+    # Stamped by the route, so every worker, even one replaying the command later, ramps at the same moments
+    ramp = RampSchedule([(step.after_seconds, step.weights) for step in request.ramp],
+                        started_at=payload.get("started_at")) if request.ramp else None
+    try:
+        model_A, model_B = await asyncio.to_thread(model_hub.load_ab_test_models, **request.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = await asyncio.to_thread(warmup_rows, model_hub.configs.histories, runner.runner_configs.warmup_rows)
+
+    # Arbitrary choice: replace all models for the ABTest. Implementation could be different in real scenarios
+    try:
+        await runner.swap_models([model_A, model_B], ab_test_mode=request.mode, warmup_rows=rows,
+                                 weights=request.weights, ramp=ramp)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return ABTestResponse()
+
+
+# Control-plane changes go through the control plane so that every serving process applies them
+control_plane.register("load", _load)
+control_plane.register("deploy", _deploy)
+control_plane.register("ab-test", _ab_test)
 
 
 @router.post("/load", response_model=LoadModelResponse)
@@ -31,61 +173,71 @@ async def load(request: LoadModelRequest):
     """loads a ML model and its preprocessor and registers it in the model manager.
 
     Args:
-        request (LoadModelRequest): _description_
+        request (LoadModelRequest): `model_path` and `preprocessor_path` may be `runs:/...`,
+            `models:/name/version` or local paths; they are fetched through the artifact cache.
     """
-    preprocessor = request.preprocessor_path
-    model = request.model_path
-    version = request.version
-    name = request.name
-    try:
-        _, mlflow_version = model_hub.register_model(model, preprocessor, version, name)
-    except ValueError as e:
-        return LoadModelResponse({"model_name": name, 
-                                  "model_version": version, 
-                                  "mlflow_version": None, 
-                                  "status": f"Failed to push model: {e}"})
-    return LoadModelResponse({"model_name": name, 
-                              "model_version": version, 
-                              "mlflow_version": mlflow_version, 
-                              "status": "Model loaded successfully"}
-                             )
+    return await control_plane.execute("load", request.model_dump(mode="json"))
 
 
 @router.post("/deploy", response_model=DeployModelResponse)
 async def deploy(request: DeployModelRequest):
-    name = request.name
-    version = request.version
-    if not model_hub.is_model_registered(name, version):
-        return DeployModelResponse({"model_name": name, "model_version": version, "variant": None, "status": "Failed: Model in question was not registered."})
-    model = model_hub.load_model(name, version)
-    
-    # Arbitrary choice: deprecate all models for the new deploy. Implementation could be different in real scenarios
-    runner.deprecate_current_batchers()
-    runner.new_batcher(model)
-
-    return DeployModelResponse({
-        "status": "Model deployed successfully",
-        "model_name": model.model_name,
-        "model_version": model.version,
-        "variant": model.variant
-    })
+    """Warms up a registered model and switches all traffic to it once its latency is stable."""
+    return await control_plane.execute("deploy", request.model_dump(mode="json"))
 
 
 @router.post("/ab-test", response_model=ABTestResponse)
 async def setup_ab_test(request: ABTestRequest):
-    model_A, model_B = model_hub.load_ab_test_models(**request.model_dump())
-    runner.set_configs(ab_test_mode=request.mode)
-    
-    # Arbitrary choice: deprecate all models for the ABTest. Implementation could be different in real scenarios
-    runner.deprecate_current_batchers()
-
-    runner.new_batcher(model_A)
-    runner.new_batcher(model_B)
-    
-    return ABTestResponse({
-        
-    })
-    
+    """Splits traffic between model A (the deployed model by default) and B.
+
+    In `hash` mode a user id always gets the same variant, in every worker and across restarts.
+    """
+    return await control_plane.execute("ab-test", {**request.model_dump(mode="json"), "started_at": time.time()})
+
+
+@router.post("/ab-test/feedback")
+async def ab_test_feedback(request: BanditFeedbackRequest):
+    """Credits a reward between 0 and 1 to the variant that served a request, in `bandit` mode.
+
+    Bandit counters live in each serving process; feedback updates the process that receives it,
+    or every inference daemon when they score the requests.
+    """
+    try:
+        await runner.record_feedback(request.variant, request.reward)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok"}
+
+
+@router.get("/ab-test/bandit")
+async def bandit_state():
+    """Pulls, rewards and current traffic allocation of each variant in `bandit` mode."""
+    try:
+        return await runner.bandit_state()
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/admin/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = Query(10.0, gt=0, le=300), interval: float = Query(0.005, ge=0.001, le=1),
+                  all_threads: bool = False):
+    """Samples this process's stacks for `seconds` and returns them in the collapsed-stack format.
+
+    Only the event loop thread is sampled unless `all_threads` is set. Feed the output to
+    flamegraph.pl or speedscope. Behind several workers, each request profiles one of them.
+    """
+    thread_id = None if all_threads else threading.get_ident()
+    try:
+        stacks = await asyncio.to_thread(profiler.profile, seconds, interval, thread_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(profiler.format(stacks),
+                             headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'})
+
+
+@router.get("/admin/loop-stalls")
+async def loop_stalls():
+    """The latest event loop stalls above LOOP_STALL_THRESHOLD seconds, with the stack that was running."""
+    return {"threshold": loop_monitor.threshold, "stalls": list(loop_monitor.stalls)}
 
 
 @router.get("/health")
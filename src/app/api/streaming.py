@@ -0,0 +1,155 @@
+import codecs
+import json
+import re
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import Any
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+_WHITESPACE = " \t\r\n"
+_LITERALS = ("true", "false", "null", "NaN", "Infinity", "-Infinity")
+# What the decoder leaves unparsed when the buffer ends inside a number's fraction or exponent
+_NUMBER_TAIL = re.compile(r"(\.\d*)?([eE][-+]?\d*)?")
+
+
+class StreamFormatError(ValueError):
+    pass
+
+
+async def _decode(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _cut_off(error: json.JSONDecodeError, buffer: str) -> bool:
+    """Whether `error` is explained by the buffer ending in the middle of a value, rather than by invalid JSON."""
+    rest = buffer[error.pos:]
+    return (not rest or error.msg.startswith("Unterminated string")
+            or (error.msg.startswith("Invalid \\uXXXX escape") and len(rest) <= 5)
+            or any(literal.startswith(rest) for literal in _LITERALS)
+            or _NUMBER_TAIL.fullmatch(rest) is not None)
+
+
+def _parse_line(line: str, number: int) -> Any:
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        # Lines are independent: the next one can still be parsed
+        return StreamFormatError(f"Invalid JSON on line {number}: {e}")
+
+
+async def _iter_ndjson(buffer: str, texts: AsyncIterator[str]) -> AsyncIterator[Any]:
+    number = 0
+    while True:
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield _parse_line(line, number)
+        try:
+            buffer += await anext(texts)
+        except StopAsyncIteration:
+            break
+    if buffer.strip():
+        yield _parse_line(buffer, number + 1)
+
+
+async def _iter_json_array(buffer: str, texts: AsyncIterator[str]) -> AsyncIterator[Any]:
+    decoder = json.JSONDecoder()
+    exhausted = False
+    pos = buffer.index("[") + 1
+    expect_value = True
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos < len(buffer):
+            char = buffer[pos]
+            if char == "]":
+                return
+            if char == ",":
+                if expect_value:
+                    raise StreamFormatError("Unexpected ',' in JSON array")
+                pos += 1
+                expect_value = True
+                continue
+            if expect_value:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as e:
+                    # Anything but a value cut off by the end of the buffer is invalid however much more is read
+                    if exhausted or not _cut_off(e, buffer):
+                        raise
+                else:
+                    pos = end
+                    expect_value = False
+                    yield value
+                    continue
+            else:
+                raise StreamFormatError(f"Expected ',' or ']' in JSON array, got {char!r}")
+        if exhausted:
+            raise StreamFormatError("Unterminated JSON array")
+        try:
+            # Consumed elements are only dropped here, so the buffer holds one chunk and at most one
+            # partial element, and is not copied once per element
+            buffer = buffer[pos:] + await anext(texts)
+            pos = 0
+        except StopAsyncIteration:
+            exhausted = True
+
+
+async def iter_json_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Incrementally parses a request body holding either a JSON array or NDJSON.
+
+    Values are yielded as soon as they are complete, so only one element is buffered at a time.
+    A malformed NDJSON line is yielded as a StreamFormatError and the lines after it are still
+    parsed; a malformed JSON array raises, since its remaining elements cannot be told apart.
+    """
+    texts = _decode(chunks)
+    buffer = ""
+    async for text in texts:
+        buffer += text
+        if buffer.strip():
+            break
+    if not buffer.strip():
+        return
+    parser = _iter_json_array if buffer.lstrip()[0] == "[" else _iter_ndjson
+    async for record in parser(buffer, texts):
+        yield record
+
+
+def stream_json_page(records: Iterator[dict[str, Any]], limit: int,
+                     encode_cursor: Callable[[int], str]) -> Iterator[str]:
+    """Streams `{"items": [...], "next_cursor": ...}` one record at a time.
+
+    `records` must yield up to `limit + 1` records; the extra one only tells whether another page exists.
+    """
+    yield '{"items": ['
+    last_id, count = None, 0
+    for record in records:
+        if count == limit:
+            break
+        yield ("," if count else "") + json.dumps(record)
+        last_id, count = record["id"], count + 1
+    else:
+        last_id = None
+    yield '], "next_cursor": ' + json.dumps(encode_cursor(last_id) if last_id is not None else None) + "}"
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """StreamingResponse for endpoints that keep reading the request body while they respond.
+
+    Starlette's own disconnect listener consumes `receive()` messages, which would steal the body
+    chunks from `request.stream()`. Client disconnects surface through `request.stream()` instead.
+    """
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
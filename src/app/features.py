@@ -0,0 +1,128 @@
+"""Titanic feature engineering shared by training (src/train/train.py) and serving.
+
+Both run the same `engineer` function, on DataFrame columns offline and on ColumnarBatch
+columns online, so a model never sees features computed differently from the ones it was
+trained on. String columns are factorized and each distinct value is parsed once, through
+lookup tables built at import, so repeated cabins and tickets cost a gather, not a parse;
+the numeric features are NumPy array arithmetic.
+"""
+import re
+from collections.abc import Callable, Mapping
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from app.serve.columnar import ColumnarBatch
+
+
+TITLES = ("Mr", "Mrs", "Miss", "Master", "Rare")
+DECKS = ("A", "B", "C", "D", "E", "F", "G", "T", "U")
+TICKET_PREFIXES = ("NONE", "A", "PC", "CA", "SOTON", "WC", "SC", "SO", "FC", "PP", "LINE", "OTHER")
+
+# Groups of the engineered categorical columns, in code order, like columnar.CATEGORIES
+FEATURE_CATEGORIES: dict[str, tuple[str, ...]] = {"Title": TITLES, "Deck": DECKS, "TicketPrefix": TICKET_PREFIXES}
+
+# Raw title -> group; anything else is a rare title
+_TITLE_TABLE = {
+    "Mr": "Mr", "Mrs": "Mrs", "Mme": "Mrs", "Miss": "Miss", "Mlle": "Miss", "Ms": "Miss", "Master": "Master",
+}
+# Normalized ticket prefix (upper case, without spaces, dots and slashes) -> group; others are OTHER
+_TICKET_TABLE = {
+    "": "NONE", "A4": "A", "A5": "A", "AS": "A", "AQ3": "A", "AQ4": "A", "PC": "PC", "CA": "CA", "C": "CA",
+    "SOTONOQ": "SOTON", "SOTONO2": "SOTON", "STONO": "SOTON", "STONO2": "SOTON", "CASOTON": "SOTON",
+    "WC": "WC", "SC": "SC", "SCPARIS": "SC", "SCAH": "SC", "SCAHBASLE": "SC", "SCA3": "SC", "SCA4": "SC", "SCOW": "SC",
+    "SOC": "SO", "SOP": "SO", "SOPP": "SO", "SP": "SO", "FC": "FC", "FCC": "FC", "FA": "FC",
+    "PP": "PP", "PPP": "PP", "SWPP": "PP", "WEP": "PP", "LINE": "LINE",
+}
+
+_TITLE = re.compile(r",\s*([^.]*?)\s*\.")
+# Everything before the trailing ticket number: "A/5 21171" -> "A/5", "113803" -> "", "LINE" -> "LINE"
+_TICKET = re.compile(r"^(.*?)\s*\d*$")
+_TICKET_NOISE = re.compile(r"[\s./]")
+
+
+def _codes(groups: tuple[str, ...], table: Mapping[str, str]) -> dict[str, int]:
+    """A value -> group code table for the parsers."""
+    codes = {group: code for code, group in enumerate(groups)}
+    return {value: codes[group] for value, group in table.items()}
+
+
+_TITLE_CODES = _codes(TITLES, _TITLE_TABLE)
+_DECK_CODES = {deck: code for code, deck in enumerate(DECKS) if deck != "U"}
+_TICKET_CODES = _codes(TICKET_PREFIXES, _TICKET_TABLE)
+_RARE, _UNKNOWN_DECK, _OTHER = TITLES.index("Rare"), DECKS.index("U"), TICKET_PREFIXES.index("OTHER")
+
+
+def _title(name: str) -> int:
+    match = _TITLE.search(name)
+    return _TITLE_CODES.get(match.group(1), _RARE) if match else _RARE
+
+
+def _deck(cabin: str) -> int:
+    return _DECK_CODES.get(cabin.lstrip()[:1], _UNKNOWN_DECK)
+
+
+def _normalize_ticket(prefix: str) -> str:
+    return _TICKET_NOISE.sub("", prefix).upper()
+
+
+def _ticket(ticket: str) -> int:
+    prefix = _TICKET.match(ticket.strip()).group(1)
+    code = _TICKET_CODES.get(prefix)
+    return _TICKET_CODES.get(_normalize_ticket(prefix), _OTHER) if code is None else code
+
+
+def _cabin_count(cabin: str) -> int:
+    return len(cabin.split())
+
+
+def _per_value(values: np.ndarray, *parsers: Callable[[str], int]) -> list[np.ndarray]:
+    """`parsers` applied to every row of a string column; each distinct value is parsed once, not once per row."""
+    # Offline data has NaN where a request has an empty string
+    positions, uniques = pd.factorize(pd.Series(values, copy=False).fillna(""), use_na_sentinel=False)
+    return [np.fromiter(map(parser, uniques), dtype=np.int64, count=len(uniques))[positions] for parser in parsers]
+
+
+def engineer(columns: Mapping[str, np.ndarray]) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray]]:
+    """Engineered columns of a batch of passengers, and the int8 group codes of the categorical ones.
+
+    `columns` maps PredictRequest fields to arrays, as ColumnarBatch and DataFrame columns do.
+    """
+    (title,) = _per_value(columns["Name"], _title)
+    deck, cabin_count = _per_value(columns["Cabin"], _deck, _cabin_count)
+    (prefix,) = _per_value(columns["Ticket"], _ticket)
+    family_size = np.asarray(columns["SibSp"], dtype=np.int64) + np.asarray(columns["Parch"], dtype=np.int64) + 1
+    fare = np.asarray(columns["Fare"], dtype=np.float64)
+
+    codes = {"Title": title.astype(np.int8), "Deck": deck.astype(np.int8), "TicketPrefix": prefix.astype(np.int8)}
+    engineered = {
+        field: np.asarray(FEATURE_CATEGORIES[field], dtype=object)[values] for field, values in codes.items()
+    }
+    engineered.update(
+        CabinCount=cabin_count,
+        FamilySize=family_size,
+        IsAlone=(family_size == 1).astype(np.int64),
+        FarePerPerson=fare / family_size,
+    )
+    return engineered, codes
+
+
+class TitanicFeatures(BaseEstimator, TransformerMixin):
+    """Adds the engineered columns to a DataFrame (`transform`) or a ColumnarBatch (`extend`).
+
+    Learns nothing in `fit`: the lookup tables are fixed, so the features of a passenger never
+    depend on the data the pipeline was trained on.
+    """
+    def fit(self, X: pd.DataFrame, y=None):
+        return self
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        engineered, _ = engineer({field: X[field].to_numpy() for field in ("Name", "Cabin", "Ticket", "SibSp",
+                                                                           "Parch", "Fare")})
+        return X.assign(**engineered)
+
+    def extend(self, batch: ColumnarBatch) -> ColumnarBatch:
+        """The batch with the engineered columns added; pipelines run this instead of `transform` when serving."""
+        engineered, codes = engineer(batch.columns)
+        return ColumnarBatch({**batch.columns, **engineered}, {**batch.codes, **codes})
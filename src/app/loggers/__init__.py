@@ -24,6 +24,19 @@ def log_inference(model_name: str,
             wait_time=wait_time,
             inference_time=inference_time
         )
+
+
+
+def log_batch_size(model_name: str,
+                   model_version: str,
+                   variant: str,
+                   batch_size: int,
+                   *,
+                   loggers: list[LoggingExtension] | None = None):
+    loggers = loggers or []
+    for logger in loggers:
+        logger.log_batch_size(model_name=model_name, model_version=model_version, variant=variant,
+                              batch_size=batch_size)
         
         
 def log_history(
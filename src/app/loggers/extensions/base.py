@@ -9,3 +9,11 @@ class LoggingExtension(ABC):
     @abstractmethod
     def log(self, **kwargs):
         pass
+
+    def log_batch_size(self, model_name: str, model_version: str, variant: str, batch_size: int):
+        """Called once per scored batch, after `log` has been called for each of its rows."""
+        pass
+
+    def close(self) -> None:
+        """Flush anything still buffered. Called once on shutdown."""
+        pass
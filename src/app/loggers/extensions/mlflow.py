@@ -1,9 +1,22 @@
+import logging
 import os
+import random
+import threading
+import time
+from enum import Enum
+
 import mlflow
+import numpy as np
+from mlflow.entities import Metric, RunTag
 from mlflow.tracking import MlflowClient
 
 from app.loggers.extensions.base import LoggingExtension
 
+# Run that registered each (model name, app version) from this process; the registry's own version
+# numbers are assigned by MLflow and do not match the app's
+registration_runs: dict[tuple[str, str], str] = {}
+
+
 def init_mlflow():
     mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI", "http://localhost:5000"))
     mlflow.set_experiment("production")
@@ -37,6 +50,11 @@ def log_model_to_mlflow_and_register(model, preprocessor, model_name, version, s
     return registered_model.version, run_id
 
 
+class MLFlowLogMode(str, Enum):
+    per_row = "per_row"         # One nested run per prediction, logged synchronously
+    aggregated = "aggregated"   # Windowed summaries pushed from a background thread
+
+
 class MLFlowLogger(LoggingExtension):
     def __init__(self, tracking_uri: str = None):
         self.client = MlflowClient()
@@ -47,7 +65,7 @@ class MLFlowLogger(LoggingExtension):
         mlflow.set_experiment(experiment_name)
 
     def log(self, model_name: str, model_version: str, input_data: dict, prediction: float, latency: float,
-            deployment_experiment_id: str, variant: str = None, wait_time: int | None = None, inference_time: int | None = None):
+            deployment_experiment_id: str | None = None, variant: str = None, wait_time: int | None = None, inference_time: int | None = None):
         run = self.client.get_latest_versions(model_name, stages=["Production"])[0]
         run_id = run.run_id
 
@@ -56,10 +74,153 @@ class MLFlowLogger(LoggingExtension):
             mlflow.log_metric("prediction", float(prediction))
             mlflow.log_metric("latency_microsecond", latency * 1000)
             mlflow.set_tag("model_version", model_version)
-            mlflow.set_tag("deployment_experiment_id", deployment_experiment_id)
+            if deployment_experiment_id:
+                mlflow.set_tag("deployment_experiment_id", deployment_experiment_id)
             if variant:
                 mlflow.set_tag("variant", variant)
             if wait_time is not None:
                 mlflow.log_metric("wait_time_microsecond", wait_time * 1000)
             if inference_time is not None:
                 mlflow.log_metric("inference_time_microsecond", inference_time * 1000)
+
+
+class _Window:
+    """Running summary of the rows one (model, version, variant) served during a window."""
+    def __init__(self, max_samples: int) -> None:
+        self.max_samples = max_samples
+        self.count = 0
+        self.latency_sum = 0.0
+        self.wait_time_sum = 0.0
+        self.inference_time_sum = 0.0
+        self.prediction_sum = 0.0
+        self.prediction_sq_sum = 0.0
+        self.positives = 0
+        self.latencies: list[float] = []
+
+    def add(self, prediction: float, latency: float, wait_time: float | None, inference_time: float | None) -> None:
+        self.count += 1
+        self.latency_sum += latency
+        self.wait_time_sum += wait_time or 0.0
+        self.inference_time_sum += inference_time or 0.0
+        self.prediction_sum += prediction
+        self.prediction_sq_sum += prediction * prediction
+        self.positives += prediction >= 0.5
+        # Reservoir sample keeps the percentiles unbiased with bounded memory
+        if len(self.latencies) < self.max_samples:
+            self.latencies.append(latency)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.max_samples:
+                self.latencies[slot] = latency
+
+    def metrics(self) -> dict[str, float]:
+        p50, p99 = np.percentile(self.latencies, [50, 99])
+        mean = self.prediction_sum / self.count
+        return {
+            "count": self.count,
+            "latency_ms_mean": self.latency_sum / self.count,
+            "latency_ms_p50": float(p50),
+            "latency_ms_p99": float(p99),
+            "wait_time_ms_mean": self.wait_time_sum / self.count,
+            "inference_time_ms_mean": self.inference_time_sum / self.count,
+            "prediction_mean": mean,
+            "prediction_std": max(self.prediction_sq_sum / self.count - mean * mean, 0.0) ** 0.5,
+            "prediction_positive_rate": self.positives / self.count,
+        }
+
+
+class AggregatedMLFlowLogger(LoggingExtension):
+    """Logs windowed inference summaries instead of one MLflow run per prediction.
+
+    `log` only updates an in-memory summary. Every `window` seconds a background thread turns
+    each (model, version, variant) summary into metrics prefixed with the variant and sends them
+    with one `log_batch` call to the run that registered the model version. That run is the one
+    recorded in `registration_runs`, or else the run named after the version by
+    `log_model_to_mlflow_and_register`, and is looked up once per version. A slow or unavailable
+    MLflow server delays or drops summaries, never predictions.
+    """
+    def __init__(self, client: MlflowClient | None = None, window: float = 60.0, max_samples: int = 4096) -> None:
+        self.client = client or MlflowClient()
+        self.window = window
+        self.max_samples = max_samples
+        self.failed_pushes = 0
+        self._windows: dict[tuple[str, str, str], _Window] = {}
+        self._run_ids: dict[tuple[str, str], str] = {}
+        self._step = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: threading.Thread | None = None
+
+    def new_experiment(self, experiment_name: str):
+        # Summaries go to the model's registration run, whichever experiment is active
+        pass
+
+    def log(self, model_name: str, model_version: str, input_data: dict, prediction: float, latency: float,
+            deployment_experiment_id: str | None = None, variant: str = None, wait_time: float | None = None,
+            inference_time: float | None = None):
+        self._ensure_worker()
+        key = (model_name, str(model_version), variant or "deploy")
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = _Window(self.max_samples)
+            window.add(float(prediction), latency, wait_time, inference_time)
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stop.clear()
+                self._worker = threading.Thread(target=self._push_loop, name="mlflow-aggregator", daemon=True)
+                self._worker.start()
+
+    def _push_loop(self) -> None:
+        while not self._stop.wait(self.window):
+            self.flush()
+
+    def _run_id(self, model_name: str, model_version: str) -> str:
+        key = (model_name, model_version)
+        if key not in self._run_ids:
+            run_id = registration_runs.get(key) or self._registration_run(model_name, model_version)
+            if run_id is None:
+                # Versions served without going through the registry go to the current production run,
+                # which changes with every deploy, so it is never cached
+                return self.client.get_latest_versions(model_name, stages=["Production"])[0].run_id
+            self._run_ids[key] = run_id
+        return self._run_ids[key]
+
+    def _registration_run(self, model_name: str, model_version: str) -> str | None:
+        """The newest run named by `log_model_to_mlflow_and_register`, e.g. one another worker started."""
+        experiment_ids = [experiment.experiment_id for experiment in self.client.search_experiments()]
+        run_name = f"register_{model_name}_{model_version}"
+        runs = self.client.search_runs(experiment_ids, f"attributes.run_name = '{run_name}'", max_results=1,
+                                       order_by=["attributes.start_time DESC"])
+        return runs[0].info.run_id if runs else None
+
+    def flush(self) -> None:
+        """Pushes the current window's summaries and starts a new window."""
+        with self._lock:
+            windows, self._windows = self._windows, {}
+            step = self._step
+            self._step += 1
+        timestamp = int(time.time() * 1000)
+        runs: dict[tuple[str, str], list[Metric]] = {}
+        for (model_name, model_version, variant), window in windows.items():
+            runs.setdefault((model_name, model_version), []).extend(
+                Metric(f"{variant}.{name}", float(value), timestamp, step) for name, value in window.metrics().items()
+            )
+        for (model_name, model_version), metrics in runs.items():
+            try:
+                self.client.log_batch(self._run_id(model_name, model_version), metrics=metrics,
+                                      tags=[RunTag("model_version", model_version)])
+            except Exception as e:
+                self.failed_pushes += 1
+                logging.error(f"Error pushing inference summary for {model_name}({model_version}) to MLflow: {e}")
+
+    def close(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            self._stop.set()
+            self._worker.join()
+        self._worker = None
+        self.flush()
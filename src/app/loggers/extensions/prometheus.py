@@ -1,55 +1,85 @@
-from prometheus_client import CollectorRegistry, Gauge, push_to_gateway
+from prometheus_client import REGISTRY, Counter, Histogram, push_to_gateway
 import os
-from datetime import datetime
 import logging
+import threading
 from fastapi import FastAPI
 from prometheus_fastapi_instrumentator import Instrumentator
 
+from app.loggers.extensions.base import LoggingExtension
+
 
 def setup_prometheus(app: FastAPI):
     Instrumentator().instrument(app).expose(app)
     logging.info("Prometheus metrics setup complete.")
-    
-    
 
 
-class PrometheusLogger:
-    def __init__(self, pushgateway_url=None, job_name="model_inference"):
+_LABELS = ["model_name", "model_version", "variant"]
+_LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0)
+
+# Registered once on the default registry, which is the one the Instrumentator exposes on /metrics
+INFERENCE_LATENCY = Histogram("model_inference_latency_seconds", "End-to-end latency from enqueue to prediction",
+                              _LABELS, buckets=_LATENCY_BUCKETS)
+QUEUE_WAIT = Histogram("model_inference_queue_wait_seconds", "Time spent waiting in the batcher queue",
+                       _LABELS, buckets=_LATENCY_BUCKETS)
+INFERENCE_TIME = Histogram("model_inference_time_seconds", "Time spent in model.predict for the row's batch",
+                           _LABELS, buckets=_LATENCY_BUCKETS)
+BATCH_SIZE = Histogram("model_inference_batch_size", "Rows per scored batch",
+                       _LABELS, buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+PREDICTION = Histogram("model_prediction_value", "Distribution of predicted values",
+                       _LABELS, buckets=(.1, .2, .3, .4, .5, .6, .7, .8, .9, 1.0))
+PREDICTIONS = Counter("model_predictions", "Predictions served", _LABELS)
+
+
+class PrometheusLogger(LoggingExtension):
+    """Records inference metrics in the process's Prometheus registry.
+
+    Observing a histogram is an in-memory update, so nothing here touches the network on the
+    request path. Deployments scraped through /metrics need nothing else; batch jobs that exit
+    before a scrape can set `push_interval` to also flush the registry to a Pushgateway.
+    """
+    def __init__(self, pushgateway_url=None, job_name="model_inference", push_interval: float | None = None):
         self.pushgateway_url = pushgateway_url or os.getenv("PROM_PUSHGATEWAY", "http://localhost:9091")
         self.job_name = job_name
+        self.push_interval = push_interval
+        self._stop = threading.Event()
+        self._pusher: threading.Thread | None = None
+        if push_interval:
+            self._pusher = threading.Thread(target=self._push_loop, name="prometheus-pusher", daemon=True)
+            self._pusher.start()
 
     def new_experiment(self, experiment_name: str):
         # Prometheus doesn't have a concept of "experiment" — no-op here
         pass
 
     def log(self, model_name: str, model_version: str, input_data: dict, prediction: float, latency: float,
-            deployment_experiment_id: str, variant: str = None, wait_time: int | None = None, inference_time: int | None = None):
-
-        registry = CollectorRegistry()
-
-        labels = {
-            "model_name": model_name,
-            "model_version": str(model_version),
-            "deployment_experiment_id": deployment_experiment_id,
-        }
-
-        if variant:
-            labels["variant"] = variant
-
-        # Define metrics
-        latency_gauge = Gauge("model_inference_latency_microsecond", "Inference latency", labelnames=labels.keys(), registry=registry)
-        latency_gauge.labels(**labels).set(latency * 1000)
+            deployment_experiment_id: str | None = None, variant: str = None, wait_time: float | None = None,
+            inference_time: float | None = None):
+        labels = (model_name, str(model_version), variant or "deploy")
+        # Callers report milliseconds; Prometheus convention is seconds
+        INFERENCE_LATENCY.labels(*labels).observe(latency / 1000)
+        if wait_time is not None:
+            QUEUE_WAIT.labels(*labels).observe(wait_time / 1000)
+        if inference_time is not None:
+            INFERENCE_TIME.labels(*labels).observe(inference_time / 1000)
+        PREDICTION.labels(*labels).observe(float(prediction))
+        PREDICTIONS.labels(*labels).inc()
 
-        prediction_gauge = Gauge("model_prediction_value", "Model prediction value", labelnames=labels.keys(), registry=registry)
-        prediction_gauge.labels(**labels).set(prediction)
+    def log_batch_size(self, model_name: str, model_version: str, variant: str, batch_size: int):
+        BATCH_SIZE.labels(model_name, str(model_version), variant or "deploy").observe(batch_size)
 
-        if wait_time is not None:
-            wait_gauge = Gauge("model_inference_wait_time_microsecond", "Queue wait time", labelnames=labels.keys(), registry=registry)
-            wait_gauge.labels(**labels).set(wait_time * 1000)
+    def push(self) -> None:
+        try:
+            push_to_gateway(self.pushgateway_url, job=self.job_name, registry=REGISTRY)
+        except Exception as e:
+            logging.error(f"Error pushing metrics to {self.pushgateway_url}: {e}")
 
-        if inference_time is not None:
-            inference_gauge = Gauge("model_actual_inference_time_microsecond", "Actual inference time", labelnames=labels.keys(), registry=registry)
-            inference_gauge.labels(**labels).set(inference_time * 1000)
+    def _push_loop(self) -> None:
+        while not self._stop.wait(self.push_interval):
+            self.push()
 
-        # Push to gateway
-        push_to_gateway(self.pushgateway_url, job=self.job_name, registry=registry)
+    def close(self) -> None:
+        if self._pusher is not None:
+            self._stop.set()
+            self._pusher.join()
+            self._pusher = None
+            self.push()
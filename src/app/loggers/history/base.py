@@ -1,5 +1,38 @@
+import base64
+import json
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from collections import deque
+from collections.abc import Iterator
+from typing import Any, List, Tuple
+
+from pydantic import BaseModel
+
+
+class HistoryFilter(BaseModel):
+    model_name: str | None = None
+    model_version: str | None = None
+    variant: str | None = None
+    # Unix timestamps in seconds; start inclusive, end exclusive
+    start_time: float | None = None
+    end_time: float | None = None
+
+
+def encode_cursor(last_id: int) -> str:
+    """Opaque page token. History ids only ever grow, so a page boundary stays valid across inserts."""
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> int | None:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        after = json.loads(base64.urlsafe_b64decode(padded))["after"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid history cursor: {cursor!r}") from e
+    if not isinstance(after, int):
+        raise ValueError(f"Invalid history cursor: {cursor!r}")
+    return after
 
 
 class HistoryBase(ABC):
@@ -8,11 +41,21 @@ class HistoryBase(ABC):
         """Establish a connection to the database or storage."""
         raise NotImplementedError("This method should be implemented by subclasses.")
 
-    @abstractmethod    
+    @abstractmethod
     def fetch_history(self) -> List[Tuple[str, str, str, str, int, int]]:
         """Fetch all history records."""
         raise NotImplementedError("This method should be implemented by subclasses.")
 
+    @abstractmethod
+    def iter_history(self, filters: HistoryFilter, after_id: int | None = None,
+                     limit: int | None = None) -> Iterator[dict[str, Any]]:
+        """Lazily yield matching records with an id greater than `after_id`, in id order."""
+        raise NotImplementedError("This method should be implemented by subclasses.")
+
+    def recent_history(self, limit: int) -> list[dict[str, Any]]:
+        """The newest `limit` records, oldest first. Scans every record; backends that can read backwards override it."""
+        return list(deque(self.iter_history(HistoryFilter()), maxlen=limit)) if limit > 0 else []
+
     @abstractmethod
     def insert_history(
         input_data: str,
@@ -22,4 +65,11 @@ class HistoryBase(ABC):
         variant: str,
     ) -> None:
         """Insert a new history record."""
-        raise NotImplementedError("This method should be implemented by subclasses.")
\ No newline at end of file
+        raise NotImplementedError("This method should be implemented by subclasses.")
+
+    def flush(self) -> None:
+        """Write out any buffered records. Unbuffered backends have nothing to do."""
+
+    def close(self) -> None:
+        """Flush buffered records and release background resources on shutdown."""
+        self.flush()
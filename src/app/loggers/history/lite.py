@@ -1,26 +1,107 @@
-import asyncio
+import json
 import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
+import weakref
+from collections.abc import Iterator
+from enum import Enum
 from sqlite3 import Connection, Error
 from typing import Optional, List, Tuple, Any
 
-from app.loggers.history.base import HistoryBase
+from app.loggers.history.base import HistoryBase, HistoryFilter
+
+
+class DropPolicy(Enum):
+    block = "block"
+    drop_newest = "drop_newest"
+    drop_oldest = "drop_oldest"
+
+
+_STOP = object()
+
+# Applied to every connection: WAL lets /history readers run while the writer commits,
+# and synchronous=NORMAL only fsyncs at checkpoints instead of on every commit.
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-16000;",
+)
+
+_SQL_INSERT_HISTORY = """
+INSERT INTO history (model_name, variant, model_version, input_data, prediction, created_at)
+VALUES (?, ?, ?, ?, ?, ?);
+"""
+
+_HISTORY_COLUMNS = ("id", "model_name", "variant", "model_version", "input_data", "prediction", "created_at")
+
+# Every index ends in id so that filtered keyset pages are plain index range scans
+_SQL_CREATE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_history_model ON history (model_name, model_version, id);",
+    "CREATE INDEX IF NOT EXISTS idx_history_variant ON history (variant, id);",
+    "CREATE INDEX IF NOT EXISTS idx_history_created_at ON history (created_at, id);",
+)
+
+
+def _serialize_input(input_data: Any) -> str:
+    if isinstance(input_data, str):
+        return input_data
+    if hasattr(input_data, "model_dump_json"):
+        return input_data.model_dump_json()
+    return json.dumps(input_data)
 
-lock = asyncio.Lock()
 
 class HistorySQLite(HistoryBase):
-    def __init__(self, db_file: str) -> None:
+    """SQLite history whose inserts are queued and written by a background thread.
+
+    The writer commits one `executemany` transaction per `batch_rows` records or every
+    `flush_interval` seconds, whichever comes first. When `max_queue` records are waiting,
+    `drop_policy` decides whether inserts block, or the newest/oldest records are dropped.
+    """
+    def __init__(self, db_file: str, batch_rows: int = 512, flush_interval: float = 0.05,
+                 max_queue: int = 100_000, drop_policy: DropPolicy = DropPolicy.drop_newest) -> None:
         self.db_file: str = db_file
         self.conn: Optional[Connection] = None
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self.connect()
+        # SQLite connections must not be used across fork(); forked workers open their own
+        reference = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: (history := reference()) and history._after_fork())
+
+    def _after_fork(self) -> None:
+        # The parent's writer thread did not survive the fork, and its locks may be held
+        self.conn = None
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._writer = None
+        self._writer_lock = threading.Lock()
         self.connect()
 
+    def _open(self) -> Connection:
+        directory = os.path.dirname(self.db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
     def connect(self) -> None:
         try:
-            self.conn = sqlite3.connect(self.db_file)
-        except Error as e:
+            self.conn = self._open()
+        except (Error, OSError) as e:
             logging.error(f"Error connecting to database: {e}")
 
     def close_connection(self) -> None:
+        self.close()
         if self.conn:
             self.conn.close()
             self.conn = None
@@ -37,11 +118,18 @@ class HistorySQLite(HistoryBase):
                 variant TEXT NOT NULL,
                 model_version TEXT NOT NULL,
                 input_data TEXT NOT NULL,
-                prediction FLOAT NOT NULL
+                prediction FLOAT NOT NULL,
+                created_at REAL NOT NULL DEFAULT 0
             );
             """
             cursor = self.conn.cursor()
             cursor.execute(sql_create_history_table)
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(history);")}
+            if "created_at" not in columns:
+                # Tables created before records were timestamped
+                cursor.execute("ALTER TABLE history ADD COLUMN created_at REAL NOT NULL DEFAULT 0;")
+            for sql_create_index in _SQL_CREATE_INDEXES:
+                cursor.execute(sql_create_index)
             self.conn.commit()
         except sqlite3.Error as e:
             logging.error(f"Error creating table: {e}")
@@ -57,39 +145,182 @@ class HistorySQLite(HistoryBase):
         if not self.conn:
             logging.error("No connection available.")
             return
-        
+        self._ensure_writer()
+        record = (model_name, variant, model_version, _serialize_input(input_data), float(prediction))
+        if self.drop_policy == DropPolicy.block:
+            self._queue.put(record)
+            return
         try:
-            sql_insert_history = """
-            INSERT INTO history (model_name, variant, model_version, input_data, prediction)
-            VALUES (?, ?, ?, ?, ?);
-            """
-            with lock:
-                cursor = self.conn.cursor()
-                cursor.execute(sql_insert_history, (model_name, variant, model_version, input_data, prediction))
-                self.conn.commit()
+            self._queue.put_nowait(record)
+        except queue.Full:
+            if self.drop_policy == DropPolicy.drop_oldest:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self._queue.put_nowait(record)
+                except (queue.Empty, queue.Full):
+                    pass
+            self.dropped += 1
+
+    def _ensure_writer(self) -> None:
+        # Started lazily so that importing the module (or forking workers) spawns no threads
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._writer_loop, name="history-sqlite-writer", daemon=True)
+                self._writer.start()
+
+    def _writer_loop(self) -> None:
+        try:
+            conn = self._open()
+        except (Error, OSError) as e:
+            logging.error(f"History writer could not connect to database: {e}")
+            return
+        pending: list[tuple] = []
+        deadline = 0.0
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, deadline - time.monotonic()) if pending else None
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+            while record is not None:
+                if record is _STOP:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(record)
+                if len(pending) >= self.batch_rows:
+                    break
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    record = None
+            if pending and (stopping or len(pending) >= self.batch_rows or time.monotonic() >= deadline):
+                self._write(conn, pending)
+                for _ in pending:
+                    self._queue.task_done()
+                pending = []
+        conn.close()
+
+    def _write(self, conn: Connection, rows: list[tuple]) -> None:
+        try:
+            # IMMEDIATE takes the write lock up front, so created_at can be stamped inside the
+            # transaction. Clamping to the newest stamp keeps created_at non-decreasing in id
+            # order, even with several writer processes, which lets time ranges become id ranges.
+            conn.execute("BEGIN IMMEDIATE;")
+            (newest,) = conn.execute("SELECT MAX(created_at) FROM history;").fetchone()
+            created_at = max(time.time(), newest or 0.0)
+            conn.executemany(_SQL_INSERT_HISTORY, [row + (created_at,) for row in rows])
+            conn.commit()
         except sqlite3.Error as e:
-            logging.error(f"Error inserting history: {e}")
-            self.conn.rollback()
+            logging.error(f"Error inserting {len(rows)} history records: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+
+    def flush(self) -> None:
+        """Blocks until every queued record has been written."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        """Writes out the queued records and stops the writer thread."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        self._writer = None
 
     def fetch_history(self, model_version: str|None = None) -> List[Tuple[Any, ...]]:
         if not self.conn:
             logging.error("No connection available.")
             return []
         try:
+            cursor = self.conn.cursor()
             if model_version is not None:
-                sql_fetch_history = "SELECT * FROM history WHERE model_version = ?;"
-                cursor = self.conn.cursor()
-                cursor.execute(sql_fetch_history, (model_version,))
+                cursor.execute("SELECT * FROM history WHERE model_version = ?;", (model_version,))
             else:
-                sql_fetch_history = "SELECT * FROM history;"
-    
-            cursor = self.conn.cursor()
-            cursor.execute(sql_fetch_history)
+                cursor.execute("SELECT * FROM history;")
             rows = cursor.fetchall()
             return rows
         except sqlite3.Error as e:
             logging.error(f"Error fetching history: {e}")
             return []
-        
-        
-history_sqlite = HistorySQLite("data/deploy/history.db")
\ No newline at end of file
+
+    def recent_history(self, limit: int) -> list[dict[str, Any]]:
+        try:
+            conn = self._open()
+        except (Error, OSError) as e:
+            logging.error(f"Error fetching history: {e}")
+            return []
+        try:
+            # The primary key index read backwards: cost depends on `limit`, not on the table size
+            rows = conn.execute(f"SELECT {', '.join(_HISTORY_COLUMNS)} FROM history ORDER BY id DESC LIMIT ?",
+                                (limit,)).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Error fetching history: {e}")
+            return []
+        finally:
+            conn.close()
+        return [dict(zip(_HISTORY_COLUMNS, row)) for row in reversed(rows)]
+
+    def _id_at(self, conn: Connection, timestamp: float) -> int | None:
+        """Smallest id committed at or after `timestamp`, found with a single index lookup."""
+        row = conn.execute("SELECT id FROM history WHERE created_at >= ? ORDER BY created_at, id LIMIT 1;",
+                           (timestamp,)).fetchone()
+        return row[0] if row else None
+
+    def iter_history(self, filters: HistoryFilter, after_id: int | None = None,
+                     limit: int | None = None, fetch_size: int = 500) -> Iterator[dict[str, Any]]:
+        # A connection per query: readers may run on any thread and never block the writer under WAL
+        try:
+            conn = self._open()
+        except (Error, OSError) as e:
+            logging.error(f"Error fetching history: {e}")
+            return
+        try:
+            conditions, params = [], []
+            for column in ("model_name", "model_version", "variant"):
+                value = getattr(filters, column)
+                if value is not None:
+                    conditions.append(f"{column} = ?")
+                    params.append(value)
+            # created_at never decreases with id (see _write), so a time range is an id range and
+            # the page can still be read in id order straight from the indexes
+            if filters.start_time is not None:
+                first_id = self._id_at(conn, filters.start_time)
+                if first_id is None:
+                    return
+                conditions.append("id >= ?")
+                params.append(first_id)
+            if filters.end_time is not None:
+                end_id = self._id_at(conn, filters.end_time)
+                if end_id is not None:
+                    conditions.append("id < ?")
+                    params.append(end_id)
+            if after_id is not None:
+                conditions.append("id > ?")
+                params.append(after_id)
+
+            sql = f"SELECT {', '.join(_HISTORY_COLUMNS)} FROM history"
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
+            sql += " ORDER BY id"
+            if limit is not None:
+                sql += " LIMIT ?"
+                params.append(limit)
+
+            cursor = conn.execute(sql, params)
+            while rows := cursor.fetchmany(fetch_size):
+                for row in rows:
+                    yield dict(zip(_HISTORY_COLUMNS, row))
+        except sqlite3.Error as e:
+            logging.error(f"Error fetching history: {e}")
+        finally:
+            conn.close()
+
+
+history_sqlite = HistorySQLite("data/deploy/history.db")
@@ -0,0 +1,75 @@
+import os
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+
+import boto3
+
+
+class ObjectStore(ABC):
+    """Minimal key/value blob store used by the segment history backend."""
+
+    @abstractmethod
+    def put(self, key: str, body: bytes) -> None:
+        raise NotImplementedError("This method should be implemented by subclasses.")
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        raise NotImplementedError("This method should be implemented by subclasses.")
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[str]:
+        """Yield every key starting with `prefix`."""
+        raise NotImplementedError("This method should be implemented by subclasses.")
+
+
+class S3ObjectStore(ObjectStore):
+    def __init__(self, bucket_name: str, client=None) -> None:
+        self.bucket_name = bucket_name
+        self.s3 = client or boto3.client("s3")
+
+    def put(self, key: str, body: bytes) -> None:
+        self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=body)
+
+    def get(self, key: str) -> bytes:
+        return self.s3.get_object(Bucket=self.bucket_name, Key=key)["Body"].read()
+
+    def list(self, prefix: str) -> Iterator[str]:
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"]
+
+
+class LocalObjectStore(ObjectStore):
+    """Filesystem-backed store with S3 key semantics, for local runs and tests."""
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key: str, body: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so readers never see a partial segment
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def list(self, prefix: str) -> Iterator[str]:
+        # Only walk the directories the prefix can match
+        directory = os.path.dirname(self._path(prefix)) if "/" in prefix else self.root
+        if not os.path.isdir(directory):
+            return
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                key = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    yield key
@@ -0,0 +1,284 @@
+import gzip
+import heapq
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from collections.abc import Iterator
+from datetime import datetime, timezone
+from typing import Any, List, Tuple
+from urllib.parse import quote, unquote
+
+from app.loggers.history.base import HistoryBase, HistoryFilter
+from app.loggers.history.lite import _serialize_input
+from app.loggers.history.object_store import ObjectStore
+
+
+_SEGMENT_SUFFIX = ".ndjson.gz"
+# Microseconds shifted by the writer tag still fit in a signed 64-bit integer until 2112
+_TAG_BITS = 11
+
+
+def _date(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def _id_time(record_id: int) -> float:
+    return (record_id >> _TAG_BITS) / 1e6
+
+
+class HistorySegments(HistoryBase):
+    """Append-only history stored as immutable, time-partitioned segments in an object store.
+
+    Records are buffered in memory and a background thread periodically writes one gzip NDJSON
+    segment per (model name, model version, UTC date) partition:
+
+        {prefix}/model_name={name}/model_version={version}/date={YYYY-MM-DD}/{first_id}-{last_id}-{writer}.ndjson.gz
+
+    Nothing is ever rewritten, so replicas can share a bucket without racing each other. Ids are
+    microsecond timestamps tagged with a random 11-bit per-writer tag (drawn again in forked
+    workers); they order records by time across writers and double as keyset cursors. Reads only
+    list the partitions the filters can match and skip segments whose id range is outside the query.
+
+    A record becomes readable when its segment is written, up to `flush_interval` after a newer
+    record of another writer. So that a cursor never passes over records still to come, reads stop
+    at this writer's oldest unflushed record and at records younger than `settle_time` seconds
+    (twice the flush interval by default), by which time every writer has flushed.
+    """
+    def __init__(self, store: ObjectStore, prefix: str = "history", flush_interval: float = 5.0,
+                 segment_rows: int = 10_000, max_buffered_rows: int = 1_000_000,
+                 settle_time: float | None = None) -> None:
+        self.store = store
+        self.prefix = prefix.rstrip("/")
+        self.flush_interval = flush_interval
+        self.segment_rows = segment_rows
+        self.max_buffered_rows = max_buffered_rows
+        self.settle_time = 2 * flush_interval if settle_time is None else settle_time
+        self.dropped = 0
+        self._writer_tag = random.getrandbits(_TAG_BITS)
+        self._last_micros = 0
+        self._buffers: dict[tuple[str, str, str], list[dict[str, Any]]] = {}
+        self._buffered_rows = 0
+        # First ids of the segments being uploaded right now
+        self._in_flight: list[int] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._flusher: threading.Thread | None = None
+        reference = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: (history := reference()) and history._after_fork())
+
+    def _after_fork(self) -> None:
+        # A forked worker is a new writer: it must not reuse the parent's tag (and so its ids and
+        # segment names), nor upload the records the parent buffered, and the parent's flusher is gone
+        self._writer_tag = random.getrandbits(_TAG_BITS)
+        self._buffers = {}
+        self._buffered_rows = 0
+        self._in_flight = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher = None
+
+    def connect(self) -> None:
+        # The object store client is created with the store; there is nothing to open
+        pass
+
+    def create_table(self) -> None:
+        pass
+
+    def _next_id(self, now: float) -> int:
+        micros = max(int(now * 1e6), self._last_micros + 1)
+        self._last_micros = micros
+        return (micros << _TAG_BITS) | self._writer_tag
+
+    def insert_history(
+        self,
+        model_name: str,
+        variant: str,
+        model_version: str,
+        input_data: str,
+        prediction: float
+    ) -> None:
+        self._ensure_flusher()
+        now = time.time()
+        with self._lock:
+            if self._buffered_rows >= self.max_buffered_rows:
+                self.dropped += 1
+                return
+            record = {
+                "id": self._next_id(now),
+                "model_name": model_name,
+                "variant": variant,
+                "model_version": str(model_version),
+                "input_data": _serialize_input(input_data),
+                "prediction": float(prediction),
+                "created_at": now,
+            }
+            self._buffers.setdefault((model_name, str(model_version), _date(now)), []).append(record)
+            self._buffered_rows += 1
+            if self._buffered_rows >= self.segment_rows:
+                self._wake.set()
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._stopping = False
+                self._flusher = threading.Thread(target=self._flush_loop, name="history-segments-writer", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _segment_key(self, partition: tuple[str, str, str], records: list[dict[str, Any]]) -> str:
+        model_name, model_version, date = partition
+        return (f"{self.prefix}/model_name={quote(model_name, safe='')}/model_version={quote(model_version, safe='')}"
+                f"/date={date}/{records[0]['id']:020d}-{records[-1]['id']:020d}-{self._writer_tag:03x}{_SEGMENT_SUFFIX}")
+
+    def flush(self) -> None:
+        """Writes every buffered partition out as a new segment."""
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+            self._buffered_rows = 0
+            in_flight = [records[0]["id"] for records in buffers.values()]
+            self._in_flight.extend(in_flight)
+        try:
+            for partition, records in buffers.items():
+                body = gzip.compress("".join(json.dumps(r) + "\n" for r in records).encode(), compresslevel=6)
+                try:
+                    self.store.put(self._segment_key(partition, records), body)
+                except Exception as e:
+                    logging.error(f"Error writing history segment for {partition}: {e}")
+                    with self._lock:
+                        # Keep the records for the next flush, ahead of anything buffered since
+                        self._buffers[partition] = records + self._buffers.get(partition, [])
+                        self._buffered_rows += len(records)
+        finally:
+            with self._lock:
+                for first_id in in_flight:
+                    self._in_flight.remove(first_id)
+
+    def _readable_below(self) -> int | None:
+        """Ids from here on may still be joined by older records, so no read, and no cursor, goes past it."""
+        with self._lock:
+            firsts = [records[0]["id"] for records in self._buffers.values()] + self._in_flight
+        if self.settle_time > 0:
+            firsts.append(int((time.time() - self.settle_time) * 1e6) << _TAG_BITS)
+        return min(firsts, default=None)
+
+    def close(self) -> None:
+        if self._flusher is not None and self._flusher.is_alive():
+            self._stopping = True
+            self._wake.set()
+            self._flusher.join()
+        self._flusher = None
+        self.flush()
+
+    def _list_segments(self, filters: HistoryFilter, after_id: int | None) -> list[tuple[int, int, str]]:
+        prefix = f"{self.prefix}/"
+        if filters.model_name is not None:
+            prefix += f"model_name={quote(filters.model_name, safe='')}/"
+            if filters.model_version is not None:
+                prefix += f"model_version={quote(filters.model_version, safe='')}/"
+
+        start_time = filters.start_time
+        if after_id is not None:
+            start_time = max(start_time or 0.0, _id_time(after_id))
+        first_date = _date(start_time) if start_time is not None else None
+        last_date = _date(filters.end_time) if filters.end_time is not None else None
+
+        segments = []
+        for key in self.store.list(prefix):
+            if not key.endswith(_SEGMENT_SUFFIX):
+                continue
+            *partition, filename = key[len(self.prefix) + 1:].split("/")
+            fields = dict(part.split("=", 1) for part in partition)
+            if filters.model_version is not None and unquote(fields["model_version"]) != filters.model_version:
+                continue
+            date = fields["date"]
+            if (first_date and date < first_date) or (last_date and date > last_date):
+                continue
+            first_id, last_id, _ = filename[:-len(_SEGMENT_SUFFIX)].split("-")
+            first_id, last_id = int(first_id), int(last_id)
+            if after_id is not None and last_id <= after_id:
+                continue
+            if filters.start_time is not None and _id_time(last_id) < filters.start_time:
+                continue
+            if filters.end_time is not None and _id_time(first_id) >= filters.end_time:
+                continue
+            segments.append((first_id, last_id, key))
+        segments.sort()
+        return segments
+
+    def _read_segment(self, key: str) -> Iterator[dict[str, Any]]:
+        for line in gzip.decompress(self.store.get(key)).splitlines():
+            yield json.loads(line)
+
+    def iter_history(self, filters: HistoryFilter, after_id: int | None = None,
+                     limit: int | None = None) -> Iterator[dict[str, Any]]:
+        readable_below = self._readable_below()
+        segments = [segment for segment in self._list_segments(filters, after_id)
+                    if readable_below is None or segment[0] < readable_below]
+        # k-way merge by id; a segment is only downloaded once the merge reaches its first id
+        heap: list[tuple[int, int, dict[str, Any], Iterator[dict[str, Any]]]] = []
+        next_segment, count = 0, 0
+        while heap or next_segment < len(segments):
+            while next_segment < len(segments) and (not heap or segments[next_segment][0] <= heap[0][0]):
+                records = self._read_segment(segments[next_segment][2])
+                record = next(records, None)
+                if record is not None:
+                    heapq.heappush(heap, (record["id"], next_segment, record, records))
+                next_segment += 1
+            if not heap:
+                continue
+            record_id, index, record, records = heapq.heappop(heap)
+            following = next(records, None)
+            if following is not None:
+                heapq.heappush(heap, (following["id"], index, following, records))
+            if readable_below is not None and record_id >= readable_below:
+                return
+            if not self._matches(record, filters, after_id):
+                continue
+            yield record
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+    def recent_history(self, limit: int) -> list[dict[str, Any]]:
+        # Newest segments first; stop once the rest only holds ids older than the `limit` newest so far
+        newest: list[int] = []
+        records: dict[int, dict[str, Any]] = {}
+        for _, last_id, key in sorted(self._list_segments(HistoryFilter(), None), key=lambda s: s[1], reverse=True):
+            if limit <= 0 or (len(newest) >= limit and last_id < newest[0]):
+                break
+            for record in self._read_segment(key):
+                if len(newest) < limit:
+                    heapq.heappush(newest, record["id"])
+                elif record["id"] > newest[0]:
+                    records.pop(heapq.heapreplace(newest, record["id"]), None)
+                else:
+                    continue
+                records[record["id"]] = record
+        return [records[record_id] for record_id in sorted(newest)]
+
+    @staticmethod
+    def _matches(record: dict[str, Any], filters: HistoryFilter, after_id: int | None) -> bool:
+        if after_id is not None and record["id"] <= after_id:
+            return False
+        if filters.variant is not None and record["variant"] != filters.variant:
+            return False
+        if filters.start_time is not None and record["created_at"] < filters.start_time:
+            return False
+        if filters.end_time is not None and record["created_at"] >= filters.end_time:
+            return False
+        return True
+
+    def fetch_history(self, model_version: str | None = None) -> List[Tuple[Any, ...]]:
+        return [tuple(record.values()) for record in self.iter_history(HistoryFilter(model_version=model_version))]
@@ -0,0 +1,181 @@
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+
+from prometheus_client import Counter, Gauge
+
+from app.loggers import log_batch_size, log_history, log_inference
+from app.loggers.extensions.base import LoggingExtension
+from app.loggers.history.base import HistoryBase
+
+
+QUEUE_DEPTH = Gauge("telemetry_queue_depth", "Batch records waiting for a telemetry sink", ["sink"])
+DROPPED_EVENTS = Counter("telemetry_dropped_events", "Batch records a telemetry sink never handled",
+                         ["sink", "reason"])
+
+
+class BatchRecord:
+    """Everything the loggers and history sinks need about one scored batch. Latencies are milliseconds."""
+    __slots__ = ("model_name", "model_version", "variant", "inputs", "outputs", "latencies", "wait_times",
+                 "inference_time")
+
+    def __init__(self, model_name: str, model_version: str, variant: str, inputs: list, outputs: list,
+                 latencies: list[float], wait_times: list[float], inference_time: float):
+        self.model_name = model_name
+        self.model_version = model_version
+        self.variant = variant
+        self.inputs = inputs
+        self.outputs = outputs
+        self.latencies = latencies
+        self.wait_times = wait_times
+        self.inference_time = inference_time
+
+
+def extension_handler(extension: LoggingExtension) -> Callable[[BatchRecord], list[Callable[[], None]]]:
+    def writes(r: BatchRecord) -> list[Callable[[], None]]:
+        rows = [functools.partial(log_inference, model_name=r.model_name, input_data=input_data,
+                                  prediction=prediction, latency=latency, variant=r.variant,
+                                  model_version=r.model_version, wait_time=wait_time,
+                                  inference_time=r.inference_time, loggers=[extension])
+                for input_data, prediction, latency, wait_time in zip(r.inputs, r.outputs, r.latencies, r.wait_times)]
+        return rows + [functools.partial(log_batch_size, r.model_name, r.model_version, r.variant, len(r.outputs),
+                                         loggers=[extension])]
+    return writes
+
+
+def history_handler(history: HistoryBase) -> Callable[[BatchRecord], list[Callable[[], None]]]:
+    def writes(r: BatchRecord) -> list[Callable[[], None]]:
+        return [functools.partial(log_history, model_name=r.model_name, input_data=input_data,
+                                  prediction=prediction, variant=r.variant, model_version=r.model_version,
+                                  history_loggers=[history])
+                for input_data, prediction in zip(r.inputs, r.outputs)]
+    return writes
+
+
+class SinkConsumer:
+    """Drains one sink's ring buffer from its own thread.
+
+    When the buffer is full the oldest record is overwritten, so a stalled sink only ever costs
+    `max_records` of memory and never blocks the publisher. `handler` turns a record into its
+    writes to the sink; a failed write is retried on its own with exponential backoff, so the
+    writes before it are never repeated, and after `max_retries` the rest of the batch is dropped.
+    """
+    def __init__(self, name: str, handler: Callable[[BatchRecord], list[Callable[[], None]]], max_records: int = 1024,
+                 batch_records: int = 64, flush_interval: float = 0.05, max_retries: int = 3,
+                 retry_backoff: float = 0.1):
+        self.name = name
+        self.handler = handler
+        self.batch_records = batch_records
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.dropped = 0
+        self.failed = 0
+        self._buffer: deque[BatchRecord] = deque(maxlen=max_records)
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        # Keeps `flush` from seeing the buffer idle between a publish's clear and append
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._dropped_overflow = DROPPED_EVENTS.labels(name, "overflow")
+        self._dropped_failed = DROPPED_EVENTS.labels(name, "failed")
+        QUEUE_DEPTH.labels(name).set_function(lambda: len(self._buffer))
+        self._thread = threading.Thread(target=self._consume_loop, name=f"telemetry-{name}", daemon=True)
+        self._thread.start()
+
+    def publish(self, record: BatchRecord) -> None:
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+                self._dropped_overflow.inc()
+            self._idle.clear()
+            self._buffer.append(record)
+        if len(self._buffer) >= self.batch_records:
+            self._wake.set()
+
+    def _take(self) -> list[BatchRecord]:
+        records = []
+        try:
+            while len(records) < self.batch_records:
+                records.append(self._buffer.popleft())
+        except IndexError:
+            pass
+        return records
+
+    def _handle(self, records: list[BatchRecord]) -> None:
+        for done, record in enumerate(records):
+            for write in self.handler(record):
+                if (error := self._write(write)) is not None:
+                    logging.error(f"Telemetry sink {self.name} dropped {len(records) - done} batches: {error}")
+                    self.failed += len(records) - done
+                    self._dropped_failed.inc(len(records) - done)
+                    return
+
+    def _write(self, write: Callable[[], None]) -> Exception | None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                write()
+                return None
+            except Exception as e:
+                if attempt == self.max_retries:
+                    return e
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def _consume_loop(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            while records := self._take():
+                self._handle(records)
+            with self._lock:
+                if not self._buffer:
+                    self._idle.set()
+            if self._stopping and not self._buffer:
+                return
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Waits until every published record has been handled."""
+        self._wake.set()
+        return self._idle.wait(timeout)
+
+    def close(self) -> None:
+        self._stopping = True
+        self._wake.set()
+        self._thread.join()
+
+
+class TelemetryBus:
+    """Fans each scored batch out to one SinkConsumer per logger and history sink.
+
+    `publish` only appends to in-memory ring buffers, so a slow or failing sink never adds
+    latency to inference; each sink is drained at its own pace.
+    """
+    def __init__(self, extensions: list[LoggingExtension] | None = None, histories: list[HistoryBase] | None = None,
+                 **consumer_configs):
+        self.extensions = extensions or []
+        self.histories = histories or []
+        self.consumers: list[SinkConsumer] = []
+        for sink, handler in [(e, extension_handler(e)) for e in self.extensions] + \
+                             [(h, history_handler(h)) for h in self.histories]:
+            name = type(sink).__name__
+            if any(c.name == name for c in self.consumers):
+                name = f"{name}-{len(self.consumers)}"
+            self.consumers.append(SinkConsumer(name, handler, **consumer_configs))
+
+    def publish(self, record: BatchRecord) -> None:
+        for consumer in self.consumers:
+            consumer.publish(record)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        return all(consumer.flush(timeout) for consumer in self.consumers)
+
+    def close(self) -> None:
+        """Drains every consumer, then closes the sinks themselves."""
+        for consumer in self.consumers:
+            consumer.close()
+        for sink in self.extensions + self.histories:
+            sink.close()
@@ -1,22 +1,45 @@
+import json
 import logging
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 import uvicorn
 
 from app.loggers.extensions.base import LoggingExtension
 from app.serve.model_server import model_hub, ModelServiceProviderConfigs
-from app.loggers.extensions.mlflow import MLFlowLogger, init_mlflow
+from app.loggers.extensions.mlflow import AggregatedMLFlowLogger, MLFlowLogger, MLFlowLogMode, init_mlflow
 from app.loggers.extensions.prometheus import PrometheusLogger, setup_prometheus
 from .api import routes
 from app.utils import apply_colored_formatter
 from app.loggers.history.lite import history_sqlite
 from app.loggers.history.base import HistoryBase
+from app.loggers.history.object_store import S3ObjectStore
+from app.loggers.history.segments import HistorySegments
+from app.loggers.telemetry import TelemetryBus
 from app.serve.inference import runner
+from app.serve.admission import Overloaded
+from app.serve.executor import ExecutorMode
+from app.serve.ab_test.bandit import BanditPolicy, BanditReward
+from app.serve.artifacts import artifact_loader
+from app.serve.control import control_plane
+from app.serve.supervisor import Supervisor
+from app.serve.profiler import loop_monitor
+from app.serve.tracing import TracingMiddleware, tracer
 
 
 
 app = FastAPI()
 app.include_router(routes.router)
+app.add_middleware(TracingMiddleware)
+# Middleware can only be added before the app starts, so this cannot wait for configure()
+if os.getenv("USE_PROMETHEUS", "false").lower() == "true":
+    setup_prometheus(app)
+
+
+@app.exception_handler(Overloaded)
+async def shed_request(request: Request, exc: Overloaded):
+    return JSONResponse({"detail": str(exc)}, status_code=exc.status_code,
+                        headers={"Retry-After": str(exc.retry_after)})
 
 
 @app.on_event("startup")
@@ -26,34 +49,153 @@ def configure():
     histories: list[HistoryBase] = []
     if use_mlflow:
         init_mlflow()
-        loggers.append(MLFlowLogger())
+        mlflow_log_mode = MLFlowLogMode(os.getenv("MLFLOW_LOG_MODE", "aggregated").lower())
+        if mlflow_log_mode == MLFlowLogMode.aggregated:
+            loggers.append(AggregatedMLFlowLogger(window=float(os.getenv("MLFLOW_LOG_WINDOW", "60"))))
+        else:
+            loggers.append(MLFlowLogger())
     use_prometheus = os.getenv("USE_PROMETHEUS", "false").lower() == "true"
     if use_prometheus:
-        setup_prometheus(app)
-        loggers.append(PrometheusLogger())
+        # Only needed for short-lived batch jobs; served instances are scraped through /metrics
+        push_interval = float(os.getenv("PROM_PUSH_INTERVAL", "0")) or None
+        loggers.append(PrometheusLogger(push_interval=push_interval))
     
     use_sqlite_history = os.getenv("HISTORY_SQLITE", "true").lower() == "true"
     if use_sqlite_history:
+        history_sqlite.create_table()
         histories.append(history_sqlite)
 
+    s3_history_bucket = os.getenv("HISTORY_S3_BUCKET")
+    if s3_history_bucket:
+        histories.append(HistorySegments(
+            S3ObjectStore(s3_history_bucket),
+            prefix=os.getenv("HISTORY_S3_PREFIX", "history"),
+            flush_interval=float(os.getenv("HISTORY_S3_FLUSH_INTERVAL", "5.0")),
+        ))
+
     batch_size = int(os.getenv("BATCH_SIZE", "16"))
     batch_timeout = float(os.getenv("BATCH_TIMEOUT", "0.05"))
+    executor_mode = ExecutorMode(os.getenv("INFERENCE_EXECUTOR", "inline").lower())
+    executor_workers = int(os.getenv("INFERENCE_WORKERS", "0")) or None
+    max_in_flight_batches = int(os.getenv("MAX_IN_FLIGHT_BATCHES", "1"))
+    adaptive_batching = os.getenv("ADAPTIVE_BATCHING", "false").lower() == "true"
+    latency_slo = float(os.getenv("LATENCY_SLO", "0.1"))
+    max_batch_size = int(os.getenv("MAX_BATCH_SIZE", "256"))
+    prediction_cache_size = int(os.getenv("PREDICTION_CACHE_SIZE", "0"))
+    prediction_cache_ttl = float(os.getenv("PREDICTION_CACHE_TTL", "300"))
+    warmup = os.getenv("WARMUP", "true").lower() == "true"
+    warmup_rows = int(os.getenv("WARMUP_ROWS", "64"))
+    warmup_max_rounds = int(os.getenv("WARMUP_MAX_ROUNDS", "200"))
+    shadow_sample_rate = float(os.getenv("SHADOW_SAMPLE_RATE", "1.0"))
+    shadow_max_pending = int(os.getenv("SHADOW_MAX_PENDING", "256"))
+    bandit_policy = BanditPolicy(os.getenv("BANDIT_POLICY", "thompson").lower())
+    bandit_reward = BanditReward(os.getenv("BANDIT_REWARD", "feedback").lower())
+    max_queue_size = int(os.getenv("MAX_QUEUE_SIZE", "1024"))
+    request_timeout = float(os.getenv("REQUEST_TIMEOUT", "0")) or None
+    # Comma-separated Unix sockets of inference daemons (python -m app.serve.daemon) that own the models
+    inference_daemon = [path for path in os.getenv("INFERENCE_DAEMON", "").split(",") if path]
+    # Per-stage spans of /predict, exported as the request_stage_seconds histogram
+    tracing = os.getenv("TRACING", "false").lower() == "true"
+    server_timing = os.getenv("SERVER_TIMING", "false").lower() == "true"
+    # Event loop stalls longer than this many seconds are recorded with their stack (0 = off)
+    loop_stall_threshold = float(os.getenv("LOOP_STALL_THRESHOLD", "0.1"))
+
+    # Compile supported sklearn pipelines to NumPy scorers when they are registered
+    compile_models = os.getenv("COMPILE_MODELS", "false").lower() == "true"
+
+    # Feed loggers and histories from background consumers so a slow sink never delays /predict
+    use_telemetry_bus = os.getenv("TELEMETRY_BUS", "true").lower() == "true"
+    telemetry = TelemetryBus(
+        loggers,
+        histories,
+        max_records=int(os.getenv("TELEMETRY_MAX_RECORDS", "1024")),
+        max_retries=int(os.getenv("TELEMETRY_MAX_RETRIES", "3")),
+    ) if use_telemetry_bus else None
 
     model_hub.set_configs(
         ModelServiceProviderConfigs(
             extensions=loggers,
-            histories=histories
+            histories=histories,
+            telemetry=telemetry,
+            register_in_mlflow=use_mlflow,
+            compile_models=compile_models
         )
     )
     
     runner.set_configs(
         batch_size=batch_size,
-        batch_timeout=batch_timeout
+        batch_timeout=batch_timeout,
+        executor_mode=executor_mode,
+        executor_workers=executor_workers,
+        max_in_flight_batches=max_in_flight_batches,
+        adaptive_batching=adaptive_batching,
+        latency_slo=latency_slo,
+        max_batch_size=max_batch_size,
+        prediction_cache_size=prediction_cache_size,
+        prediction_cache_ttl=prediction_cache_ttl,
+        warmup=warmup,
+        warmup_rows=warmup_rows,
+        warmup_max_rounds=warmup_max_rounds,
+        shadow_sample_rate=shadow_sample_rate,
+        shadow_max_pending=shadow_max_pending,
+        bandit_policy=bandit_policy,
+        bandit_reward=bandit_reward,
+        max_queue_size=max_queue_size,
+        request_timeout=request_timeout,
+        inference_daemon=inference_daemon
     )
+    control_plane.forward_to(runner.daemon.control if runner.daemon is not None else None)
+    tracer.set_configs(enabled=tracing or server_timing, server_timing=server_timing)
+    loop_monitor.set_configs(threshold=loop_stall_threshold)
+
+
+@app.on_event("startup")
+async def start_control_plane():
+    # In a supervised worker this replays the control-plane log, so it must run after configure()
+    await control_plane.start()
 
 
+@app.on_event("startup")
+async def start_loop_monitor():
+    if loop_monitor.threshold > 0:
+        loop_monitor.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    loop_monitor.stop()
+    # Buffered history writers and loggers must flush before the process exits
+    if model_hub.configs.telemetry is not None:
+        # Drains the bus first, then closes the sinks it feeds
+        model_hub.configs.telemetry.close()
+        return
+    for history in model_hub.configs.histories:
+        history.close()
+    for extension in model_hub.configs.extensions:
+        extension.close()
+
+
+def preload_models(supervisor: Supervisor, specs: list[dict]) -> None:
+    """Registers models in the supervisor so the forked workers share them, and deploys the last one."""
+    log_to_mlflow = os.getenv("USE_MLFLOW", "true").lower() == "true"
+    if log_to_mlflow:
+        init_mlflow()
+    for spec in specs:
+        model = artifact_loader.load(spec["model_path"])
+        preprocessor = artifact_loader.load(spec["preprocessor_path"])
+        model_hub.register_model(model, preprocessor, spec["version"], spec["name"], log_to_mlflow=log_to_mlflow)
+    if specs:
+        supervisor.broadcast("deploy", {"model_name": specs[-1]["name"], "model_version": specs[-1]["version"]})
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     apply_colored_formatter()
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1:
+        supervisor = Supervisor(app, host="0.0.0.0", port=8000, workers=workers)
+        # e.g. [{"name": "titanic", "version": "1", "model_path": "models:/titanic/1", "preprocessor_path": "..."}]
+        preload_models(supervisor, json.loads(os.getenv("PRELOAD_MODELS", "[]")))
+        supervisor.run()
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
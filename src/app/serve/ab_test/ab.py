@@ -1,52 +1,50 @@
+from __future__ import annotations
+
+from collections.abc import Awaitable
 from enum import Enum
-import random
+from typing import TYPE_CHECKING
+
+from app.serve.ab_test.bandit import BanditPolicy, BanditRouter
+from app.serve.ab_test.routing import RampSchedule, TrafficRouter
 
-from app.api.models import PredictRequest, PredictResponse
-from app.serve.batcher import Batcher
+if TYPE_CHECKING:
+    from app.api.models import PredictRequest
+    from app.serve.batcher import Batcher
 
 
 class ABTestMode(Enum):
     split = "split"
     shadow = "shadow"
     hash_split = "hash"
-    
-
-def _choose_variant_hash(user_id: str = None) -> str:
-    if user_id:
-        return "A" if hash(user_id) % 2 == 0 else "B"
-    return "A" if random.random() < 0.5 else "B"
-
-def _choose_variant_split(user_id: str = None) -> str:
-    return "A" if random.random() < 0.5 else "B"
-
-def _choose_variant_shadow(user_id: str = None) -> tuple[str, str]:
-    return "A", "B"
-    
-
-def route_variant(user_id: str|None = None, *, ab_test_type: ABTestMode = ABTestMode.split) -> str | tuple[str, str]:
-    if ab_test_type == ABTestMode.split:
-        return _choose_variant_split(user_id)
-    elif ab_test_type == ABTestMode.hash_split:
-        return _choose_variant_hash(user_id)
-    elif ab_test_type == ABTestMode.shadow:
-        return _choose_variant_shadow(user_id)
-    
+    bandit = "bandit"
+
+
+def make_router(ab_test_mode: ABTestMode, weights: list[float] | None = None, salt: str = "",
+                schedule: RampSchedule | None = None,
+                bandit_policy: BanditPolicy = BanditPolicy.thompson) -> TrafficRouter | BanditRouter:
+    weights = weights or [1.0, 1.0]
+    if ab_test_mode == ABTestMode.bandit:
+        # Starts from no prior: the weights only give the number of variants
+        return BanditRouter(len(weights), bandit_policy)
+    # `hash` keeps each user on one variant; `split` draws a variant per request
+    return TrafficRouter(weights, sticky=ab_test_mode == ABTestMode.hash_split, salt=salt, schedule=schedule)
+
+
 class ABTestWrapper:
-    def __init__(self, batcher_A: Batcher, batcher_B: Batcher, ab_test_mode: ABTestMode) -> None:
-        self._batcher_A = batcher_A
-        self._batcher_B = batcher_B
+    """Routes requests between the variant batchers of one A/B test. Built once per test, not per request."""
+    def __init__(self, batchers: list[Batcher], ab_test_mode: ABTestMode,
+                 router: TrafficRouter | BanditRouter | None = None) -> None:
+        self.batchers = batchers
         self._ab_test_mode = ab_test_mode
-    
-    def infer(self, request: PredictRequest, user_id: str) -> tuple[tuple[PredictResponse | None, PredictResponse | None], int]:
-        variant = route_variant(user_id, ab_test_type=self._ab_test_mode)
-        if isinstance(variant, tuple):
-            response_A = self._batcher_A.queue_request(request)
-            response_B = self._batcher_B.queue_request(request)            
-            return (response_A, response_B), 0
-        else:
-            if variant == "A":
-                response_A = self._batcher_A.queue_request(request)
-                return (response_A, None), 0
-            else:
-                response_B = self._batcher_B.queue_request(request)
-                return (None, response_B), 1
\ No newline at end of file
+        self.router = router or make_router(ab_test_mode, [1.0] * len(batchers))
+
+    def infer(self, request: PredictRequest, user_id: str | None, **queue_options) -> tuple[Awaitable, int]:
+        """Queues the request with the chosen variant; returns the pending prediction and the variant's index.
+
+        `queue_options` (priority, deadline) are passed on to Batcher.queue_request.
+        """
+        if self._ab_test_mode == ABTestMode.shadow:
+            # Only A is on the critical path; the caller hands B to a ShadowScorer afterwards
+            return self.batchers[0].queue_request(request, **queue_options), 0
+        choice = self.router.route(user_id)
+        return self.batchers[choice].queue_request(request, **queue_options), choice
@@ -0,0 +1,88 @@
+import math
+import random
+from enum import Enum
+
+
+class BanditPolicy(str, Enum):
+    thompson = "thompson"
+    ucb = "ucb"
+
+
+class BanditReward(str, Enum):
+    # Rewards posted to /ab-test/feedback, e.g. whether the prediction turned out right
+    feedback = "feedback"
+    # Every request whose end-to-end latency is within the runner's latency SLO earns 1
+    latency = "latency"
+
+
+class BanditRouter:
+    """Shifts traffic between variants towards the one earning the most reward.
+
+    Rewards are in [0, 1]. Each variant keeps a pull count and a reward sum, so choosing and
+    updating are O(1) per request whatever the traffic. Thompson sampling draws from each variant's
+    Beta(1 + rewards, 1 + failures) posterior; UCB1 adds an exploration bonus to the mean reward,
+    after taking turns between the variants until each has some feedback. It has the same `route`
+    method as TrafficRouter, so it plugs into ABTestWrapper.
+    """
+    def __init__(self, variants: int, policy: BanditPolicy = BanditPolicy.thompson):
+        self.policy = policy
+        self.pulls = [0] * variants
+        self.rewards = [0.0] * variants
+        self.feedback = [0] * variants
+        self._total_feedback = 0
+
+    def _scores(self) -> list[float]:
+        if self.policy == BanditPolicy.thompson:
+            return [random.betavariate(1.0 + reward, 1.0 + count - reward)
+                    for reward, count in zip(self.rewards, self.feedback)]
+        log_total = math.log(max(self._total_feedback, 1))
+        return [reward / count + math.sqrt(2.0 * log_total / count)
+                for reward, count in zip(self.rewards, self.feedback)]
+
+    def _exploring(self) -> bool:
+        """Whether UCB1 still waits for the first reward of some variant."""
+        return self.policy == BanditPolicy.ucb and not all(self.feedback)
+
+    def route(self, user_id: str | None = None) -> int:
+        if self._exploring():
+            # Feedback arrives late: take turns between all variants rather than sending all traffic to one
+            choice = self.pulls.index(min(self.pulls))
+        else:
+            scores = self._scores()
+            choice = scores.index(max(scores))
+        self.pulls[choice] += 1
+        return choice
+
+    def record(self, variant: int, reward: float) -> None:
+        if not 0.0 <= reward <= 1.0:
+            raise ValueError("Bandit rewards must be between 0 and 1.")
+        self.rewards[variant] += reward
+        self.feedback[variant] += 1
+        self._total_feedback += 1
+
+    def allocation(self, draws: int = 1000) -> list[float]:
+        """Share of traffic each variant would get now; estimated from `draws` samples for Thompson sampling."""
+        if self._exploring():
+            return [1.0 / len(self.pulls)] * len(self.pulls)
+        wins = [0] * len(self.pulls)
+        for _ in range(draws if self.policy == BanditPolicy.thompson else 1):
+            scores = self._scores()
+            wins[scores.index(max(scores))] += 1
+        return [count / sum(wins) for count in wins]
+
+    def state(self, variants: list[str]) -> dict:
+        allocation = self.allocation()
+        return {
+            "policy": self.policy.value,
+            "variants": [
+                {
+                    "variant": variant,
+                    "pulls": self.pulls[index],
+                    "feedback": self.feedback[index],
+                    "reward_sum": self.rewards[index],
+                    "reward_mean": self.rewards[index] / self.feedback[index] if self.feedback[index] else None,
+                    "allocation": allocation[index],
+                }
+                for index, variant in enumerate(variants)
+            ],
+        }
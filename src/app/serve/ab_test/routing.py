@@ -0,0 +1,94 @@
+import random
+import time
+import zlib
+from collections.abc import Sequence
+
+
+BUCKETS = 10_000
+
+
+def stable_hash(key: str, seed: int = 0) -> int:
+    """32-bit hash of `key` that is the same in every process and across restarts, unlike `hash`."""
+    h = zlib.crc32(key.encode(), seed)
+    # murmur3's finalizer: CRC is linear, so mix every input bit into the low bits used for bucketing
+    h = ((h ^ (h >> 16)) * 0x85EBCA6B) & 0xFFFFFFFF
+    h = ((h ^ (h >> 13)) * 0xC2B2AE35) & 0xFFFFFFFF
+    return h ^ (h >> 16)
+
+
+def bucket_table(weights: Sequence[float], buckets: int = BUCKETS) -> bytes:
+    """Maps each of `buckets` buckets to a variant index, giving variant i a contiguous `weights[i]` share.
+
+    The ranges are laid out in variant order, so moving weight from one variant to the next only
+    reassigns the buckets at their border: a user who is in the variant that grows stays there.
+    """
+    if not weights or len(weights) > 256:
+        raise ValueError("An A/B test needs between 1 and 256 variants.")
+    if any(weight < 0 for weight in weights) or sum(weights) <= 0:
+        raise ValueError("Variant weights must be non-negative and not all zero.")
+    total = sum(weights)
+    table = bytearray()
+    cumulative = 0.0
+    for index, weight in enumerate(weights):
+        cumulative += weight
+        table.extend([index] * (round(cumulative / total * buckets) - len(table)))
+    return bytes(table)
+
+
+class RampSchedule:
+    """Weights that change over time, e.g. `[(0, [95, 5]), (600, [80, 20]), (3600, [50, 50])]`.
+
+    Each step gives the weights in effect from `after` seconds past `started_at` (a wall-clock
+    timestamp, so every worker ramps at the same moments, even one that was restarted).
+    """
+    def __init__(self, steps: Sequence[tuple[float, Sequence[float]]], started_at: float | None = None):
+        if not steps:
+            raise ValueError("A ramp schedule needs at least one step.")
+        self.steps = sorted((float(after), list(weights)) for after, weights in steps)
+        self.started_at = time.time() if started_at is None else started_at
+
+    def current(self, now: float) -> tuple[list[float], float | None]:
+        """The weights in effect at `now`, and when they next change (None after the last step)."""
+        weights = self.steps[0][1]
+        for after, step_weights in self.steps:
+            if now < self.started_at + after:
+                return weights, self.started_at + after
+            weights = step_weights
+        return weights, None
+
+
+class TrafficRouter:
+    """Picks a variant index per request from a precomputed bucket table.
+
+    With `sticky`, the bucket is a stable hash of the user id salted with `salt` (the experiment),
+    so a user always gets the same variant, in every worker and after restarts; requests without
+    a user id, and every request when not sticky, get a random bucket.
+    """
+    def __init__(self, weights: Sequence[float], *, sticky: bool = True, salt: str = "",
+                 schedule: RampSchedule | None = None, buckets: int = BUCKETS):
+        self.sticky = sticky
+        self.buckets = buckets
+        self.schedule = schedule
+        self._seed = zlib.crc32(salt.encode())
+        self._next_change: float | None = None
+        if schedule is not None:
+            weights, self._next_change = schedule.current(time.time())
+        self.weights = list(weights)
+        self._table = bucket_table(self.weights, buckets)
+
+    def _advance(self) -> None:
+        weights, self._next_change = self.schedule.current(time.time())
+        if weights != self.weights:
+            self.weights = list(weights)
+            self._table = bucket_table(self.weights, self.buckets)
+
+    def route(self, user_id: str | None = None) -> int:
+        if self._next_change is not None and time.time() >= self._next_change:
+            self._advance()
+        if self.sticky and user_id:
+            # stable_hash, inlined: this runs on every request
+            h = zlib.crc32(user_id.encode(), self._seed)
+            h = ((h ^ (h >> 16)) * 0x85EBCA6B) & 0xFFFFFFFF
+            h = ((h ^ (h >> 13)) * 0xC2B2AE35) & 0xFFFFFFFF
+            return self._table[(h ^ (h >> 16)) % self.buckets]
+        return self._table[int(random.random() * self.buckets)]
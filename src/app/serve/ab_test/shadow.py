@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from typing import TYPE_CHECKING
+
+from prometheus_client import Counter, Histogram
+
+from app.serve.admission import Overloaded, Priority
+
+if TYPE_CHECKING:
+    from app.api.models import PredictRequest
+    from app.serve.batcher import Batcher
+
+
+_LABELS = ["model_name", "model_version", "shadow_model_name", "shadow_model_version"]
+
+SHADOW_REQUESTS = Counter("shadow_requests", "Requests offered to the shadow variant, by outcome",
+                          _LABELS + ["outcome"])
+SHADOW_DIVERGENCE = Histogram("shadow_prediction_divergence", "Absolute difference between the shadow and live prediction",
+                              _LABELS, buckets=(0.001, 0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0))
+SHADOW_DISAGREEMENTS = Counter("shadow_prediction_disagreements",
+                               "Requests whose shadow prediction lands on the other side of the threshold", _LABELS)
+
+
+class ShadowScorer:
+    """Scores the shadow variant off the critical path and compares it to the live one in aggregate.
+
+    A request is offered only after the live prediction was returned. Only `sample_rate` of the
+    requests are scored, and when `max_pending` shadow requests are already queued or running,
+    new ones are shed instead of queueing behind them. The shadow predictions are not written
+    to the loggers or the history; the divergence from the live prediction is aggregated here.
+    """
+    def __init__(self, sample_rate: float = 1.0, max_pending: int = 256, threshold: float = 0.5):
+        self.sample_rate = sample_rate
+        self.max_pending = max_pending
+        self.threshold = threshold
+        self.pending = 0
+        self.scored = 0
+        self.shed = 0
+        self.failed = 0
+        self.disagreements = 0
+        self._divergence_sum = 0.0
+        self._divergence_max = 0.0
+        self._tasks: set[asyncio.Task] = set()
+
+    @staticmethod
+    def _labels(live: Batcher, shadow: Batcher) -> tuple[str, str, str, str]:
+        return live.model.model_name, live.model.version, shadow.model.model_name, shadow.model.version
+
+    def submit(self, live: Batcher, shadow: Batcher, request: PredictRequest, prediction: float) -> None:
+        labels = self._labels(live, shadow)
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            SHADOW_REQUESTS.labels(*labels, "sampled_out").inc()
+            return
+        if self.pending >= self.max_pending:
+            # The shadow fell behind; catching up would take CPU from live traffic
+            self.shed += 1
+            SHADOW_REQUESTS.labels(*labels, "shed").inc()
+            return
+        self.pending += 1
+        task = asyncio.create_task(self._score(shadow, request, float(prediction), labels))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _score(self, shadow: Batcher, request: PredictRequest, prediction: float, labels: tuple) -> None:
+        try:
+            # Let the live responses that are ready go out first
+            await asyncio.sleep(0)
+            output = float(await shadow.queue_request(request, Priority.shadow))
+        except Overloaded:
+            self.shed += 1
+            SHADOW_REQUESTS.labels(*labels, "shed").inc()
+            return
+        except Exception as e:
+            self.failed += 1
+            SHADOW_REQUESTS.labels(*labels, "failed").inc()
+            logging.error(f"Shadow prediction failed: {e}")
+            return
+        finally:
+            self.pending -= 1
+        divergence = abs(output - prediction)
+        self.scored += 1
+        self._divergence_sum += divergence
+        self._divergence_max = max(self._divergence_max, divergence)
+        SHADOW_REQUESTS.labels(*labels, "scored").inc()
+        SHADOW_DIVERGENCE.labels(*labels).observe(divergence)
+        if (output >= self.threshold) != (prediction >= self.threshold):
+            self.disagreements += 1
+            SHADOW_DISAGREEMENTS.labels(*labels).inc()
+
+    async def wait_idle(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "scored": self.scored,
+            "shed": self.shed,
+            "failed": self.failed,
+            "pending": self.pending,
+            "divergence_mean": self._divergence_sum / self.scored if self.scored else None,
+            "divergence_max": self._divergence_max,
+            "disagreement_rate": self.disagreements / self.scored if self.scored else None,
+        }
@@ -0,0 +1,137 @@
+import math
+import time
+import weakref
+
+from prometheus_client import Gauge
+
+
+_LABELS = ["model_name", "model_version", "variant"]
+
+BATCH_SIZE_GAUGE = Gauge("batcher_adaptive_batch_size", "Batch size chosen by the adaptive controller", _LABELS)
+BATCH_TIMEOUT_GAUGE = Gauge("batcher_adaptive_batch_timeout_seconds", "Batch wait window chosen by the adaptive controller", _LABELS)
+ARRIVAL_RATE_GAUGE = Gauge("batcher_arrival_rate_per_second", "Smoothed request arrival rate", _LABELS)
+INFERENCE_TIME_GAUGE = Gauge("batcher_estimated_inference_seconds", "Estimated inference time of the chosen batch size", _LABELS)
+_GAUGES = (BATCH_SIZE_GAUGE, BATCH_TIMEOUT_GAUGE, ARRIVAL_RATE_GAUGE, INFERENCE_TIME_GAUGE)
+
+# Controller whose decisions the gauges report, by label values, as for the Batcher's queue depth
+_OWNERS: weakref.WeakValueDictionary[tuple, "AdaptiveBatchController"] = weakref.WeakValueDictionary()
+
+
+class AdaptiveBatchController:
+    """Picks the Batcher's batch size and wait window from the observed traffic.
+
+    Per-batch inference time is fitted online as `fixed + per_item * n` (exponentially decayed
+    least squares) and the arrival rate is an EWMA of inter-arrival times. The batch size is the
+    smallest one that keeps the scorer below `target_utilization`:
+
+        rate * (fixed + per_item * n) / n <= target_utilization
+
+    capped by the largest batch that can still be filled and scored within `latency_slo`
+    (`n - 1 = rate * wait`, `wait = latency_slo - (fixed + per_item * n)`). Under low traffic
+    this stops waiting altogether; under bursts it grows the batch, up to `max_batch_size`,
+    to amortize the per-batch overhead.
+    """
+    def __init__(self, latency_slo: float = 0.1, min_batch_size: int = 1, max_batch_size: int = 256,
+                 max_batch_timeout: float | None = None, target_utilization: float = 0.7,
+                 arrival_smoothing: float = 0.1, cost_decay: float = 0.9, labels: dict[str, str] | None = None):
+        self.latency_slo = latency_slo
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_batch_timeout = latency_slo if max_batch_timeout is None else max_batch_timeout
+        self.target_utilization = target_utilization
+        self.arrival_smoothing = arrival_smoothing
+        self.cost_decay = cost_decay
+        self.labels = labels or {"model_name": "", "model_version": "", "variant": ""}
+        # A redeploy of the same version takes the series over from the controller it replaces
+        self._label_values = tuple(self.labels[name] for name in _LABELS)
+        _OWNERS[self._label_values] = self
+
+        self.batch_size = min_batch_size
+        self.batch_timeout = 0.0
+        self._last_arrival: float | None = None
+        self._interarrival: float | None = None
+        # Decayed sums for the least squares fit of inference time against batch size
+        self._s0 = self._s1 = self._s2 = self._t = self._nt = 0.0
+
+    @property
+    def arrival_rate(self) -> float:
+        if not self._interarrival:
+            return 0.0
+        return 1.0 / self._interarrival
+
+    def observe_arrival(self, now: float | None = None) -> None:
+        now = time.perf_counter() if now is None else now
+        if self._last_arrival is not None:
+            gap = now - self._last_arrival
+            if self._interarrival is None:
+                self._interarrival = gap
+            else:
+                self._interarrival += self.arrival_smoothing * (gap - self._interarrival)
+        self._last_arrival = now
+
+    def observe_batch(self, batch_size: int, inference_time: float) -> None:
+        d = self.cost_decay
+        self._s0 = d * self._s0 + 1
+        self._s1 = d * self._s1 + batch_size
+        self._s2 = d * self._s2 + batch_size * batch_size
+        self._t = d * self._t + inference_time
+        self._nt = d * self._nt + batch_size * inference_time
+
+    def inference_cost(self) -> tuple[float, float]:
+        """Returns the fitted (fixed, per_item) inference cost in seconds."""
+        if not self._s0:
+            return 0.0, 0.0
+        det = self._s0 * self._s2 - self._s1 * self._s1
+        if det <= 1e-9 * self._s0 * self._s2:
+            # Every observed batch had the same size: attribute the whole cost to the batch
+            return self._t / self._s0, 0.0
+        per_item = max(0.0, (self._s0 * self._nt - self._s1 * self._t) / det)
+        fixed = max(0.0, (self._t - per_item * self._s1) / self._s0)
+        return fixed, per_item
+
+    def estimate_inference_time(self, batch_size: int) -> float:
+        fixed, per_item = self.inference_cost()
+        return fixed + per_item * batch_size
+
+    def update(self) -> tuple[int, float]:
+        """Recomputes and returns the (batch_size, batch_timeout) decision."""
+        rate = self.arrival_rate
+        fixed, per_item = self.inference_cost()
+
+        if rate > 0:
+            headroom = self.target_utilization - rate * per_item
+            needed = rate * fixed / headroom if headroom > 0 else math.inf
+            within_slo = (1 + rate * (self.latency_slo - fixed)) / (1 + rate * per_item)
+            n = math.floor(within_slo)
+            if needed < n:
+                n = math.ceil(needed)
+            batch_size = max(self.min_batch_size, min(self.max_batch_size, n))
+        else:
+            batch_size = self.min_batch_size
+
+        budget = max(0.0, self.latency_slo - (fixed + per_item * batch_size))
+        fill_time = (batch_size - 1) / rate if rate > 0 else 0.0
+        batch_timeout = min(budget, fill_time, self.max_batch_timeout)
+
+        self.batch_size, self.batch_timeout = batch_size, batch_timeout
+        self._export(rate, fixed + per_item * batch_size)
+        return batch_size, batch_timeout
+
+    def _export(self, rate: float, inference_time: float) -> None:
+        if _OWNERS.get(self._label_values) is not self:
+            return
+        BATCH_SIZE_GAUGE.labels(**self.labels).set(self.batch_size)
+        BATCH_TIMEOUT_GAUGE.labels(**self.labels).set(self.batch_timeout)
+        ARRIVAL_RATE_GAUGE.labels(**self.labels).set(rate)
+        INFERENCE_TIME_GAUGE.labels(**self.labels).set(inference_time)
+
+    def release(self) -> None:
+        """Drops the series of a retired batcher's controller, unless a newer controller took them over."""
+        if _OWNERS.get(self._label_values) is not self:
+            return
+        del _OWNERS[self._label_values]
+        for gauge in _GAUGES:
+            try:
+                gauge.remove(*self._label_values)
+            except KeyError:
+                pass
@@ -0,0 +1,79 @@
+import asyncio
+from collections import deque
+from enum import IntEnum
+
+from prometheus_client import Counter, Gauge
+
+
+_LABELS = ["model_name", "model_version", "variant", "priority"]
+
+QUEUE_DEPTH = Gauge("batcher_queue_depth", "Requests waiting in a batcher, by priority lane", _LABELS)
+SHED_REQUESTS = Counter("batcher_shed_requests", "Requests rejected by admission control", _LABELS + ["reason"])
+
+
+class Priority(IntEnum):
+    # Lower values are served first
+    interactive = 0
+    bulk = 1
+    shadow = 2
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; the API answers with `status_code` and a Retry-After header."""
+    def __init__(self, status_code: int, retry_after: int, reason: str):
+        super().__init__(f"Request shed ({reason}); retry after {retry_after}s.")
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class LaneQueue:
+    """Bounded FIFO lanes, one per Priority, behind the part of asyncio.Queue that Batcher uses.
+
+    `get` serves the highest-priority lane that has requests. Interactive requests are admitted up
+    to `max_size` queued requests in total, the other lanes only up to half of it, so bulk and
+    shadow traffic can never take the room interactive traffic needs. `max_size=0` means unbounded.
+    """
+    def __init__(self, max_size: int = 0):
+        self.max_size = max_size
+        self._lanes = [deque() for _ in Priority]
+        self._size = 0
+        self._not_empty = asyncio.Event()
+
+    def limit(self, priority: Priority) -> int:
+        return self.max_size if priority == Priority.interactive else self.max_size // 2
+
+    def put_nowait(self, item, priority: Priority = Priority.interactive) -> None:
+        if self.max_size and self._size >= self.limit(priority):
+            raise asyncio.QueueFull
+        self._lanes[priority].append(item)
+        self._size += 1
+        self._not_empty.set()
+
+    def put_last(self, item) -> None:
+        """Queues `item` behind everything queued so far, ignoring the bound (e.g. a drain marker)."""
+        self._lanes[-1].append(item)
+        self._size += 1
+        self._not_empty.set()
+
+    async def get(self):
+        while not self._size:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    def get_nowait(self):
+        for lane in self._lanes:
+            if lane:
+                self._size -= 1
+                return lane.popleft()
+        raise asyncio.QueueEmpty
+
+    def depth(self, priority: Priority) -> int:
+        return len(self._lanes[priority])
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return not self._size
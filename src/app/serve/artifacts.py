@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any
+from urllib.parse import quote
+
+import joblib
+import mlflow
+from mlflow.models import Model as MLflowModel
+
+
+_CHUNK = 1 << 20
+
+
+def _is_immutable(uri: str) -> bool:
+    # Runs never change and registry versions are immutable; stages and aliases move
+    if uri.startswith("runs:/"):
+        return True
+    if uri.startswith("models:/"):
+        parts = uri[len("models:/"):].strip("/").split("/")
+        return len(parts) == 2 and parts[1].isdigit()
+    return False
+
+
+def _digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _write_text(path: str, text: str) -> None:
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def _artifact_file(path: str) -> str:
+    """The serialized estimator inside an MLflow sklearn model directory, or `path` itself for plain files."""
+    if not os.path.isdir(path):
+        return path
+    mlmodel = os.path.join(path, "MLmodel")
+    if os.path.exists(mlmodel):
+        flavors = MLflowModel.load(mlmodel).flavors
+        if "sklearn" in flavors:
+            return os.path.join(path, flavors["sklearn"]["pickled_model"])
+    for name in ("model.pkl", "model.joblib"):
+        if os.path.exists(os.path.join(path, name)):
+            return os.path.join(path, name)
+    raise ValueError(f"No serialized model found in {path}.")
+
+
+def _load_estimator(path: str) -> Any:
+    if os.path.exists(os.path.join(path, "MLmodel")):
+        # MLflow picks the right deserializer (pickle, cloudpickle or skops)
+        return mlflow.sklearn.load_model(path)
+    return joblib.load(_artifact_file(path))
+
+
+class ArtifactLoader:
+    """Loads estimators from `runs:/...`, `models:/name/version` or local paths through an on-disk cache.
+
+    Every artifact is stored once under `{root}/objects/{sha256 of the serialized estimator}.joblib`,
+    re-dumped uncompressed so joblib can memory-map its numpy arrays: worker processes that load
+    the same artifact share those pages instead of each holding a copy. Immutable MLflow URIs
+    are also recorded under `{root}/refs`, so a replica that has seen one never downloads it again.
+    """
+    def __init__(self, root: str, mmap_mode: str | None = "r"):
+        self.root = root
+        self.mmap_mode = mmap_mode
+        # (path, size, mtime) -> digest, so unchanged local files are not hashed again
+        self._local_digests: dict[tuple[str, int, int], str] = {}
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", f"{digest}.joblib")
+
+    def _ref_path(self, uri: str) -> str:
+        return os.path.join(self.root, "refs", quote(uri, safe=""))
+
+    def _read_ref(self, uri: str) -> str | None:
+        try:
+            with open(self._ref_path(uri)) as f:
+                digest = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return digest if os.path.exists(self._object_path(digest)) else None
+
+    @staticmethod
+    def _write_atomic(path: str, write) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _local_digest(self, path: str) -> str:
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = self._local_digests.get(memo_key)
+        if digest is None:
+            digest = self._local_digests[memo_key] = _digest(path)
+        return digest
+
+    def _store(self, source: str, digest: str) -> str:
+        """Adds the estimator at `source` to the object store, under `digest`, and returns the digest."""
+        target = self._object_path(digest)
+        if not os.path.exists(target):
+            obj = _load_estimator(source)
+            self._write_atomic(target, lambda path: joblib.dump(obj, path))
+        return digest
+
+    def fetch(self, uri: str) -> str:
+        """Resolves `uri` to an object in the cache and returns its path."""
+        immutable = _is_immutable(uri)
+        if immutable and (digest := self._read_ref(uri)) is not None:
+            return self._object_path(digest)
+
+        if uri.startswith(("runs:/", "models:/")):
+            download_dir = tempfile.mkdtemp(dir=self._ensure_dir("downloads"))
+            try:
+                local = mlflow.artifacts.download_artifacts(artifact_uri=uri, dst_path=download_dir)
+                digest = self._store(local, _digest(_artifact_file(local)))
+            finally:
+                shutil.rmtree(download_dir, ignore_errors=True)
+        else:
+            digest = self._store(uri, self._local_digest(_artifact_file(uri)))
+
+        if immutable:
+            self._write_atomic(self._ref_path(uri), lambda path: _write_text(path, digest))
+        return self._object_path(digest)
+
+    def _ensure_dir(self, name: str) -> str:
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def load(self, uri: str) -> Any:
+        path = self.fetch(uri)
+        logging.info(f"Loading {uri} from {path}")
+        return joblib.load(path, mmap_mode=self.mmap_mode)
+
+
+artifact_loader = ArtifactLoader("data/artifacts")
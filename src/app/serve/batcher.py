@@ -1,49 +1,166 @@
 import asyncio
+import functools
 import logging
+import math
 import time
-import pandas as pd
+import weakref
 
 from app.api.models import PredictRequest
+from app.serve.adaptive import AdaptiveBatchController
+from app.serve.admission import QUEUE_DEPTH, SHED_REQUESTS, LaneQueue, Overloaded, Priority
+from app.serve.cache import PredictionCache
+from app.serve.executor import ExecutorShutdown, InferenceExecutor
 from app.serve.model import Model, RequestItem
 
 
+# Queued by `drain`; everything queued before it is still scored
+_DRAIN = object()
+
+# Batcher whose lanes the queue depth gauge reports, by label values. Held weakly: the
+# registry must not keep retired batchers (and their models) alive.
+_DEPTH_OWNERS: weakref.WeakValueDictionary[tuple, "Batcher"] = weakref.WeakValueDictionary()
+
+
+def _queue_depth(labels: tuple, lane: Priority) -> int:
+    batcher = _DEPTH_OWNERS.get(labels)
+    return 0 if batcher is None else batcher.queue.depth(lane)
+
+
 class Batcher:
-    def __init__(self, model: Model, batch_size: int = 16, 
-                 batch_timeout: float = 0.05):
-        self.queue: list[RequestItem] = []
+    def __init__(self, model: Model, batch_size: int = 16,
+                 batch_timeout: float = 0.05, executor: InferenceExecutor | None = None,
+                 controller: AdaptiveBatchController | None = None, cache: PredictionCache | None = None,
+                 max_queue_size: int = 0):
+        self.queue = LaneQueue(max_queue_size)
         self.batch_size = batch_size
         self.batch_timeout = batch_timeout
         self.model = model
+        self.executor = executor or InferenceExecutor(model)
+        # In adaptive mode the controller overrides batch_size/batch_timeout before every batch
+        self.controller = controller
+        if controller is not None:
+            self.executor.batch_observer = controller.observe_batch
+        # Repeated requests are answered from here without being queued
+        self.cache = cache
+        # Set by queue_request once a full batch is waiting, so the loop wakes up
+        # immediately instead of sitting out the rest of the timeout.
+        self._batch_ready = asyncio.Event()
+        self._collected = 0
+        self._draining = False
+        # Smoothed seconds per batch, to tell shed clients when to come back
+        self._batch_seconds = batch_timeout
+        labels = self._labels = (model.model_name, model.version, model.variant)
+        # A redeploy of the same version takes the series over from the batcher it replaces
+        _DEPTH_OWNERS[labels] = self
+        for priority in Priority:
+            QUEUE_DEPTH.labels(*labels, priority.name).set_function(functools.partial(_queue_depth, labels, priority))
+        self._shed = {(priority, reason): SHED_REQUESTS.labels(*labels, priority.name, reason)
+                      for priority in Priority for reason in ("queue_full", "deadline")}
         self._safe_batch_loop()
 
-    async def queue_request(self, input_data: PredictRequest):
-        item = RequestItem(input_data.model_dump())
-        self.queue.append(item)
-        return await item.future
+    async def queue_request(self, input_data: PredictRequest, priority: Priority = Priority.interactive,
+                            deadline: float | None = None):
+        """Scores `input_data`; raises Overloaded if its lane is full or `deadline` (time.monotonic()) passes first."""
+        if self.cache is not None:
+            return await self.cache.fetch(self.cache.key(self.model, input_data),
+                                          lambda: self._enqueue(input_data, priority, deadline))
+        return await self._enqueue(input_data, priority, deadline)
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.queue.qsize() / max(self.batch_size, 1) * self._batch_seconds))
+
+    def _reject(self, priority: Priority, reason: str) -> Overloaded:
+        self._shed[priority, reason].inc()
+        # Full queue: the client should back off; expired deadline: the server was too slow
+        return Overloaded(429 if reason == "queue_full" else 503, self._retry_after(), reason)
+
+    async def _enqueue(self, input_data: PredictRequest, priority: Priority = Priority.interactive,
+                       deadline: float | None = None):
+        if deadline is not None and time.monotonic() >= deadline:
+            raise self._reject(priority, "deadline")
+        item = RequestItem(input_data, priority, deadline)
+        try:
+            self.queue.put_nowait(item, priority)
+        except asyncio.QueueFull:
+            raise self._reject(priority, "queue_full")
+        if self.controller is not None:
+            self.controller.observe_arrival()
+        if self._is_batch_full():
+            self._batch_ready.set()
+        try:
+            return await item.future
+        except ExecutorShutdown:
+            # The batcher was closed under the request; another one may serve it once it is retried
+            raise Overloaded(503, self._retry_after(), "shutdown")
+
+    def _is_batch_full(self) -> bool:
+        # Items already pulled off the queue by the loop count towards the batch
+        return self._collected + self.queue.qsize() >= self.batch_size
 
     async def _await_batch_timeout(self):
-        start_time = time.perf_counter()
-        while len(self.queue) < self.batch_size and (time.perf_counter() - start_time) < self.batch_timeout: pass
+        """Wait until a full batch is queued or `batch_timeout` runs out, whichever comes first."""
+        if self._is_batch_full() or self.batch_timeout <= 0 or self._draining:
+            return
+        self._batch_ready.clear()
+        try:
+            await asyncio.wait_for(self._batch_ready.wait(), self.batch_timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _expired(self, item: RequestItem, now: float) -> bool:
+        """Fails items whose client already gave up, so no batch slot is spent on them."""
+        if item.future.done():
+            # Cancelled by its caller, e.g. a bulk upload whose client disconnected
+            return True
+        if item.deadline is None or now < item.deadline:
+            return False
+        if not item.future.done():
+            item.future.set_exception(self._reject(item.priority, "deadline"))
+        return True
 
     async def _get_new_batch(self):
-        await self._await_batch_timeout()
-        if not self.queue:
-            return 
-        batch = self.queue[:self.batch_size]
-        del self.queue[:len(batch)]
+        # Blocks without spinning until the first request of the batch arrives
+        first = await self.queue.get()
+        if first is _DRAIN:
+            self._draining = True
+            return []
+        if self._expired(first, time.monotonic()):
+            return []
+        batch = [first]
+        if self.controller is not None:
+            self.batch_size, self.batch_timeout = self.controller.update()
+        self._collected = 1
+        try:
+            await self._await_batch_timeout()
+        finally:
+            self._collected = 0
+        # The wait may have outlasted some deadlines, the first request's included
+        now = time.monotonic()
+        batch = [item for item in batch if not self._expired(item, now)]
+        while len(batch) < self.batch_size and not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is _DRAIN:
+                self._draining = True
+                continue
+            if not self._expired(item, now):
+                batch.append(item)
         return batch
-    
+
     def is_running(self):
         return bool(self.model)
-            
+
     def _safe_batch_loop(self):
-        try: 
-            asyncio.create_task(self._batch_loop())
+        try:
+            self._task = asyncio.create_task(self._batch_loop())
         except Exception as e:
             print(f"Error in batch processing: {e}")
-            self.queue.clear()
+            self._clear_queue()
             raise e
 
+    def _clear_queue(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
     async def _batch_loop(self):
         while True:
             if not self.is_running():
@@ -51,15 +168,47 @@ class Batcher:
                 await asyncio.sleep(1)
                 continue
             batch = await self._get_new_batch()
-            if not batch:
-                continue
-            
-            inputs = pd.DataFrame([item.input_data for item in batch])
-            
-            self.model.predict(inputs)
-            
+            if batch:
+                started = time.perf_counter()
+                await self.executor.submit(batch)
+                self._batch_seconds = 0.8 * self._batch_seconds + 0.2 * (time.perf_counter() - started)
+            if self._draining and self.queue.empty():
+                return
+
+    async def drain(self):
+        """Scores every request queued so far, then stops the batch loop and the executor.
+
+        The batcher must no longer receive traffic; requests queued after `drain` are scored too,
+        but only until the queue first runs empty.
+        """
+        self.queue.put_last(_DRAIN)
+        # Don't sit out the wait window of a batch that is being collected
+        self._batch_ready.set()
+        await self._task
+        await self.executor.wait_idle()
+        self.executor.shutdown()
+        self._release_gauges()
+
+    def close(self):
+        self._task.cancel()
+        self.executor.shutdown()
+        self._release_gauges()
+
+    def _release_gauges(self):
+        """Drops the queue depth and controller series of a retired batcher, unless a newer batcher took them over."""
+        if self.controller is not None:
+            self.controller.release()
+        if _DEPTH_OWNERS.get(self._labels) is not self:
+            return
+        del _DEPTH_OWNERS[self._labels]
+        for priority in Priority:
+            try:
+                QUEUE_DEPTH.remove(*self._labels, priority.name)
+            except KeyError:
+                pass
+
     def __repr__(self):
         return f"Batcher<{self.model.model_name}({self.model.version})>"
-    
+
     def is_empty(self):
-        return len(self.batcher.queue) == 0
+        return self.queue.empty()
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+from prometheus_client import Counter, Gauge
+
+from app.api.models import PredictRequest
+from app.serve.columnar import _row_getter
+from app.serve.model import Model
+
+
+CACHE_HITS = Counter("prediction_cache_hits", "Predictions served from the cache")
+CACHE_MISSES = Counter("prediction_cache_misses", "Predictions the cache had to compute")
+CACHE_EVICTIONS = Counter("prediction_cache_evictions", "Entries removed from the cache", ["reason"])
+CACHE_ENTRIES = Gauge("prediction_cache_entries", "Entries currently in the prediction cache")
+
+
+class PredictionCache:
+    """LRU cache of predictions with a TTL, shared by every Batcher of the runner.
+
+    Keys are the model's name, version and variant plus a 128-bit digest of the request's fields,
+    so each entry has a fixed size and `max_entries` bounds the memory used. Identical requests
+    that arrive while the first one is still being scored wait for that prediction instead of
+    queueing again; if the first caller is cancelled, one of them scores it instead.
+    """
+    def __init__(self, max_entries: int = 100_000, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[float, float]] = OrderedDict()
+        self._pending: dict[tuple, asyncio.Future] = {}
+        # Bumped on every clear, so predictions still in flight from swapped-out models are not stored
+        self._generation = 0
+        self._evicted_capacity = CACHE_EVICTIONS.labels("capacity")
+        self._evicted_expired = CACHE_EVICTIONS.labels("expired")
+        CACHE_ENTRIES.set_function(lambda: len(self._entries))
+
+    @staticmethod
+    def key(model: Model, request: PredictRequest) -> tuple:
+        # pydantic has already coerced every field to its declared type, so equal requests print the same
+        fields = "\x1f".join(map(str, _row_getter(request)))
+        return model.model_name, model.version, model.variant, hashlib.blake2b(fields.encode(), digest_size=16).digest()
+
+    def get(self, key: tuple) -> float | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self._evicted_expired.inc()
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: tuple, value: float) -> None:
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evicted_capacity.inc()
+
+    async def fetch(self, key: tuple, compute: Callable[[], Awaitable[float]]) -> float:
+        while True:
+            value = self.get(key)
+            if value is not None:
+                CACHE_HITS.inc()
+                return value
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            try:
+                value = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Only the caller computing it was cancelled: wait for the next one or compute it here
+                if not pending.cancelled():
+                    raise
+            else:
+                CACHE_HITS.inc()
+                return value
+
+        CACHE_MISSES.inc()
+        generation = self._generation
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't warn about an unretrieved exception
+            future.exception()
+            raise
+        else:
+            if generation == self._generation:
+                self.put(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._pending.clear()
+        self._generation += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,95 @@
+from operator import attrgetter
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from app.api.models import PredictRequest
+
+
+FIELDS: tuple[str, ...] = tuple(PredictRequest.model_fields)
+
+DTYPES: dict[str, Any] = {
+    "Pclass": np.int64,
+    "Name": object,
+    "Sex": object,
+    "Age": np.int64,
+    "SibSp": np.int64,
+    "Parch": np.int64,
+    "Ticket": object,
+    "Fare": np.float64,
+    "Cabin": object,
+    "Embarked": object,
+}
+
+# Known categories, in code order. Values outside them are encoded as -1.
+CATEGORIES: dict[str, tuple] = {
+    "Pclass": (1, 2, 3),
+    "Sex": ("male", "female"),
+    "Embarked": ("C", "Q", "S"),
+}
+
+_CODE_TABLES: dict[str, dict] = {field: {value: code for code, value in enumerate(values)}
+                                 for field, values in CATEGORIES.items()}
+_row_getter = attrgetter(*FIELDS)
+
+
+class ColumnarBatch:
+    """A batch of PredictRequests stored column by column.
+
+    `columns` holds one NumPy array per PredictRequest field and `codes` the int8 category codes
+    of the fields in CATEGORIES, so preprocessors never need to re-parse them.
+    """
+    __slots__ = ("columns", "codes", "size")
+
+    def __init__(self, columns: dict[str, np.ndarray], codes: dict[str, np.ndarray]) -> None:
+        self.columns = columns
+        self.codes = codes
+        self.size = len(next(iter(columns.values()))) if columns else 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.columns[field]
+
+    def to_frame(self) -> pd.DataFrame:
+        """Wraps the columns in a DataFrame without copying them, for preprocessors that need one."""
+        return pd.DataFrame(self.columns, copy=False)
+
+
+def build_batch(inputs: list[PredictRequest]) -> ColumnarBatch:
+    n = len(inputs)
+    columns = {field: np.empty(n, dtype=DTYPES[field]) for field in FIELDS}
+    codes = {field: np.empty(n, dtype=np.int8) for field in CATEGORIES}
+    if not n:
+        return ColumnarBatch(columns, codes)
+
+    # One attribute fetch per row, then a single C-level copy per column
+    for field, values in zip(FIELDS, zip(*map(_row_getter, inputs))):
+        columns[field][:] = values
+        table = _CODE_TABLES.get(field)
+        if table is not None:
+            codes[field][:] = [table.get(value, -1) for value in values]
+    return ColumnarBatch(columns, codes)
+
+
+def transform_batch(preprocessor: Any, batch: ColumnarBatch) -> Any:
+    """Feeds a batch to the preprocessor, natively when it understands columnar batches.
+
+    The leading steps of a Pipeline that can `extend` a batch (see app.features) are run on the
+    columns, and only the rest of the Pipeline gets a DataFrame.
+    """
+    steps = getattr(preprocessor, "steps", None)
+    if steps and hasattr(steps[0][1], "extend"):
+        leading = 0
+        while leading < len(steps) and hasattr(steps[leading][1], "extend"):
+            batch = steps[leading][1].extend(batch)
+            leading += 1
+        if leading == len(steps):
+            return batch.to_frame()
+        preprocessor = preprocessor[leading:]
+    transform_columns = getattr(preprocessor, "transform_columns", None)
+    if transform_columns is not None:
+        return transform_columns(batch)
+    return preprocessor.transform(batch.to_frame())
@@ -0,0 +1,444 @@
+import logging
+import threading
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import (ExtraTreesClassifier, ExtraTreesRegressor, GradientBoostingClassifier,
+                              GradientBoostingRegressor, RandomForestClassifier, RandomForestRegressor)
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model._base import LinearClassifierMixin, LinearModel
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import (FunctionTransformer, MaxAbsScaler, MinMaxScaler, OneHotEncoder, OrdinalEncoder,
+                                   RobustScaler, StandardScaler)
+from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+
+from app.api.models import PredictRequest
+from app.features import FEATURE_CATEGORIES
+from app.serve.columnar import CATEGORIES, ColumnarBatch, build_batch, transform_batch
+
+
+class UnsupportedPipeline(ValueError):
+    pass
+
+
+class _Scale:
+    """X -= center; X /= scale, in place, as the standard, robust and max-abs scalers do."""
+    def __init__(self, center: np.ndarray | None, scale: np.ndarray | None):
+        self.center = center
+        self.scale = scale
+
+    def __call__(self, X: np.ndarray) -> None:
+        if self.center is not None:
+            X -= self.center
+        if self.scale is not None:
+            X /= self.scale
+
+
+class _MinMax:
+    def __init__(self, scaler: MinMaxScaler):
+        self.scale = scaler.scale_
+        self.min = scaler.min_
+        self.clip = scaler.feature_range if scaler.clip else None
+
+    def __call__(self, X: np.ndarray) -> None:
+        X *= self.scale
+        X += self.min
+        if self.clip is not None:
+            np.clip(X, *self.clip, out=X)
+
+
+class _Impute:
+    def __init__(self, statistics: np.ndarray):
+        self.statistics = statistics.astype(np.float64)
+
+    def __call__(self, X: np.ndarray) -> None:
+        missing = np.isnan(X)
+        if missing.any():
+            np.copyto(X, np.broadcast_to(self.statistics, X.shape), where=missing)
+
+
+# In-place operations on a float64 block of the feature matrix; classes rather than closures so they pickle
+MatrixOp = _Scale | _MinMax | _Impute
+
+
+def _matrix_op(step: Any) -> MatrixOp:
+    """The fitted numeric step as an in-place operation, with sklearn's exact arithmetic."""
+    if isinstance(step, StandardScaler):
+        return _Scale(step.mean_ if step.with_mean else None, step.scale_ if step.with_std else None)
+    if isinstance(step, RobustScaler):
+        return _Scale(step.center_, step.scale_)
+    if isinstance(step, MaxAbsScaler):
+        return _Scale(None, step.scale_)
+    if isinstance(step, MinMaxScaler):
+        return _MinMax(step)
+    if isinstance(step, SimpleImputer):
+        return _Impute(_imputer_statistics(step))
+    raise UnsupportedPipeline(f"{type(step).__name__} is not supported.")
+
+
+def _imputer_statistics(imputer: SimpleImputer) -> np.ndarray:
+    if imputer.add_indicator or not (isinstance(imputer.missing_values, float) and np.isnan(imputer.missing_values)):
+        raise UnsupportedPipeline("Only imputers of NaN without indicator columns are supported.")
+    if pd.isna(imputer.statistics_).any() and not imputer.keep_empty_features:
+        # sklearn drops these columns, which would shift every later feature
+        raise UnsupportedPipeline("Imputers with all-missing columns are not supported.")
+    return imputer.statistics_
+
+
+class _Encoding:
+    """Maps the values of one input column to positions in a fitted encoder's categories (-1 if unknown)."""
+    def __init__(self, column: str, categories: np.ndarray):
+        self.column = column
+        self.index = pd.Index(categories)
+        # Codes the batch already carries (see CATEGORIES) looked up in a table; the last entry is for code -1
+        known = CATEGORIES.get(column, FEATURE_CATEGORIES.get(column))
+        self.table = None if known is None else np.append(self.index.get_indexer(list(known)), -1)
+
+    def positions(self, batch: ColumnarBatch, values: np.ndarray, imputed: bool) -> np.ndarray:
+        codes = None if imputed else batch.codes.get(self.column)
+        if codes is None or self.table is None:
+            return self.index.get_indexer(values)
+        positions = self.table[codes]
+        unknown = codes < 0
+        if unknown.any():
+            # Not a known category of the request model, but maybe of the encoder
+            positions[unknown] = self.index.get_indexer(values[unknown])
+        return positions
+
+
+class _Block:
+    """Writes the output of one ColumnTransformer entry into its columns of the feature matrix."""
+    def __init__(self, columns: list[str], steps: list[Any]):
+        self.columns = columns
+        # Steps before the encoder replace missing values in the raw column; later ones act on the encoded block
+        self.fills: list[np.ndarray] = []
+        self.encoder: OneHotEncoder | OrdinalEncoder | None = None
+        ops: list[MatrixOp] = []
+        for step in steps:
+            if self.encoder is None and isinstance(step, (OneHotEncoder, OrdinalEncoder)):
+                if ops:
+                    raise UnsupportedPipeline("Only imputers are supported before an encoder.")
+                self.encoder = step
+            elif self.encoder is None and isinstance(step, SimpleImputer) and not ops:
+                self.fills.append(_imputer_statistics(step))
+            else:
+                ops.append(_matrix_op(step))
+        if self.encoder is None and self.fills:
+            # Numeric block: impute on the matrix like any other step
+            ops = [_matrix_op(step) for step in steps]
+            self.fills = []
+        self.ops = ops
+        self.width = len(columns)
+        if isinstance(self.encoder, OneHotEncoder):
+            self._compile_one_hot(self.encoder)
+        elif isinstance(self.encoder, OrdinalEncoder):
+            self._compile_ordinal(self.encoder)
+
+    def _compile_one_hot(self, encoder: OneHotEncoder) -> None:
+        if getattr(encoder, "_infrequent_enabled", False):
+            raise UnsupportedPipeline("One-hot encoders with infrequent categories are not supported.")
+        self.encodings = [_Encoding(column, categories) for column, categories in zip(self.columns, encoder.categories_)]
+        drop = encoder.drop_idx_ if encoder.drop_idx_ is not None else [None] * len(self.columns)
+        # Output column of each category position, -1 for the dropped one; the last entry is for unknown values
+        self.output_columns = []
+        offset = 0
+        for encoding, dropped in zip(self.encodings, drop):
+            targets = np.full(len(encoding.index) + 1, -1, dtype=np.intp)
+            kept = [position for position in range(len(encoding.index)) if position != dropped]
+            targets[kept] = offset + np.arange(len(kept))
+            offset += len(kept)
+            self.output_columns.append(targets)
+        self.width = offset
+
+    def _compile_ordinal(self, encoder: OrdinalEncoder) -> None:
+        if any(pd.isna(categories).any() for categories in encoder.categories_):
+            raise UnsupportedPipeline("Ordinal encoders with a missing-value category are not supported.")
+        if getattr(encoder, "_infrequent_enabled", False):
+            raise UnsupportedPipeline("Ordinal encoders with infrequent categories are not supported.")
+        self.encodings = [_Encoding(column, categories) for column, categories in zip(self.columns, encoder.categories_)]
+
+    def _values(self, batch: ColumnarBatch, j: int) -> np.ndarray:
+        values = batch[self.columns[j]]
+        for statistics in self.fills:
+            missing = pd.isna(values)
+            if missing.any():
+                values = np.where(missing, statistics[j], values)
+        return values
+
+    def _unknown(self, j: int, values: np.ndarray, positions: np.ndarray) -> None:
+        unknown = np.unique(values[positions < 0])
+        raise ValueError(f"Found unknown categories {list(unknown)} in column {j} during transform")
+
+    def write(self, batch: ColumnarBatch, out: np.ndarray) -> None:
+        if self.encoder is None:
+            for j, column in enumerate(self.columns):
+                out[:, j] = batch[column]
+        elif isinstance(self.encoder, OneHotEncoder):
+            out[:] = 0.0
+            rows = np.arange(len(batch))
+            for j, (encoding, targets) in enumerate(zip(self.encodings, self.output_columns)):
+                values = self._values(batch, j)
+                positions = encoding.positions(batch, values, bool(self.fills))
+                if self.encoder.handle_unknown == "error" and (positions < 0).any():
+                    self._unknown(j, values, positions)
+                columns = targets[positions]
+                hit = columns >= 0
+                out[rows[hit], columns[hit]] = 1.0
+        else:
+            for j, encoding in enumerate(self.encodings):
+                values = self._values(batch, j)
+                positions = encoding.positions(batch, values, bool(self.fills))
+                out[:, j] = positions
+                unknown = positions < 0
+                if unknown.any():
+                    if self.encoder.handle_unknown != "use_encoded_value":
+                        self._unknown(j, values, positions)
+                    out[unknown, j] = self.encoder.unknown_value
+        for op in self.ops:
+            op(out)
+
+
+def _is_passthrough(step: Any) -> bool:
+    # Fitted column transformers hold "passthrough" as an identity FunctionTransformer
+    return step is None or (isinstance(step, str) and step == "passthrough") or \
+        (isinstance(step, FunctionTransformer) and step.func is None)
+
+
+def _steps(transformer: Any) -> list[Any]:
+    steps = [step for _, step in transformer.steps] if isinstance(transformer, Pipeline) else [transformer]
+    return [step for step in steps if not _is_passthrough(step)]
+
+
+def _column_blocks(transformer: ColumnTransformer) -> list[_Block]:
+    names = getattr(transformer, "feature_names_in_", None)
+    if names is None:
+        raise UnsupportedPipeline("Only column transformers fitted on DataFrames are supported.")
+    blocks = []
+    for _, step, columns in transformer.transformers_:
+        if isinstance(columns, str):
+            columns = [columns]
+        columns = [names[column] if isinstance(column, (int, np.integer)) else column for column in columns]
+        if (isinstance(step, str) and step == "drop") or not columns:
+            continue
+        blocks.append(_Block(columns, _steps(step)))
+    return blocks
+
+
+class CompiledPreprocessor:
+    """A fitted ColumnTransformer (or Pipeline of supported steps) compiled to NumPy over columnar batches.
+
+    Feature steps that `extend` the batch (see app.features) run first. Each block then writes
+    its encoded or scaled columns straight into a preallocated float64 feature matrix, one per
+    thread, that grows with the largest batch seen. The matrix is only valid until the thread's
+    next call, which is all `score` needs.
+    """
+    def __init__(self, blocks: list[_Block], ops: list[MatrixOp], features: list[Any] | None = None):
+        self.features = features or []
+        self.blocks = blocks
+        self.ops = ops
+        self.width = sum(block.width for block in blocks)
+        self._buffers = threading.local()
+
+    def __getstate__(self) -> dict:
+        return {"features": self.features, "blocks": self.blocks, "ops": self.ops, "width": self.width}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._buffers = threading.local()
+
+    def _matrix(self, rows: int) -> np.ndarray:
+        buffer = getattr(self._buffers, "matrix", None)
+        if buffer is None or len(buffer) < rows:
+            buffer = self._buffers.matrix = np.empty((max(rows, 16), self.width), dtype=np.float64)
+        return buffer[:rows]
+
+    def transform_columns(self, batch: ColumnarBatch) -> np.ndarray:
+        for step in self.features:
+            batch = step.extend(batch)
+        out = self._matrix(len(batch))
+        offset = 0
+        for block in self.blocks:
+            block.write(batch, out[:, offset:offset + block.width])
+            offset += block.width
+        for op in self.ops:
+            op(out)
+        return out
+
+    def transform(self, data: pd.DataFrame) -> np.ndarray:
+        batch = ColumnarBatch({column: data[column].to_numpy() for column in data.columns}, {})
+        return self.transform_columns(batch).copy()
+
+
+def compile_preprocessor(preprocessor: Any) -> CompiledPreprocessor:
+    steps = _steps(preprocessor)
+    features = []
+    while steps and hasattr(steps[0], "extend"):
+        features.append(steps.pop(0))
+    if not steps:
+        raise UnsupportedPipeline("A preprocessor of feature steps only is not supported.")
+    if isinstance(steps[0], ColumnTransformer):
+        return CompiledPreprocessor(_column_blocks(steps[0]), [_matrix_op(step) for step in steps[1:]], features)
+    names = getattr(steps[0], "feature_names_in_", None)
+    if names is None:
+        raise UnsupportedPipeline(f"{type(steps[0]).__name__} is not supported.")
+    # A pipeline over every input column is one block
+    return CompiledPreprocessor([_Block(list(names), steps)], [], features)
+
+
+class CompiledLinearModel:
+    """Linear classifiers and regressors: the decision function and label choice of sklearn's linear models."""
+    def __init__(self, model: LinearModel | LinearClassifierMixin):
+        self.coef = model.coef_
+        self.intercept = model.intercept_
+        self.classes = getattr(model, "classes_", None) if isinstance(model, LinearClassifierMixin) else None
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        scores = X @ self.coef.T + self.intercept
+        if self.classes is None:
+            return scores
+        if scores.ndim > 1 and scores.shape[1] == 1:
+            scores = scores.reshape(-1)
+        indices = (scores > 0).astype(int) if scores.ndim == 1 else scores.argmax(axis=1)
+        return self.classes.take(indices)
+
+
+class CompiledTreeEnsemble:
+    """Decision trees, random forests, extra trees and gradient boosting, evaluated in NumPy.
+
+    Every tree of the ensemble is flattened into shared node arrays in which leaves point to
+    themselves, so all rows walk all trees in lockstep, one level per step. Features are cast to
+    float32 and leaf values summed in tree order like sklearn does, which keeps the output
+    identical, ties included.
+    """
+    def __init__(self, model: Any):
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise UnsupportedPipeline("Multi-output trees are not supported.")
+        if isinstance(model, (GradientBoostingClassifier, GradientBoostingRegressor)):
+            self.kind = "boosting"
+            trees = [tree for stage in model.estimators_ for tree in stage]
+            self.trees_per_stage = model.estimators_.shape[1]
+            self.learning_rate = model.learning_rate
+            if not (model.init_ == "zero" or type(model.init_).__name__ in ("DummyClassifier", "DummyRegressor")):
+                raise UnsupportedPipeline("Gradient boosting with a custom init estimator is not supported.")
+            # The init estimator predicts a constant; sklearn has no public way to get it
+            self.baseline = model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32))[0]
+        elif isinstance(model, (DecisionTreeClassifier, DecisionTreeRegressor)):
+            self.kind = "tree"
+            trees = [model]
+        else:
+            self.kind = "forest"
+            trees = list(model.estimators_)
+        self.classes = getattr(model, "classes_", None) if not isinstance(model, GradientBoostingRegressor) else None
+        self.n_features = model.n_features_in_
+
+        lefts, rights, features, thresholds, values, missing_left, roots = [], [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            tree = tree.tree_
+            nodes = np.arange(offset, offset + tree.node_count)
+            leaf = tree.children_left == -1
+            lefts.append(np.where(leaf, nodes, tree.children_left + offset))
+            rights.append(np.where(leaf, nodes, tree.children_right + offset))
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            missing_left.append(tree.missing_go_to_left.astype(bool))
+            value = tree.value[:, 0, :]
+            if self.kind == "forest" and self.classes is not None:
+                # A forest averages each tree's normalized class probabilities
+                normalizer = value.sum(axis=1, keepdims=True)
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+            elif self.classes is None or self.kind == "boosting":
+                value = value[:, 0]
+            values.append(value)
+            roots.append(offset)
+            offset += tree.node_count
+        self.left = np.concatenate(lefts)
+        self.right = np.concatenate(rights)
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds)
+        self.missing_left = np.concatenate(missing_left)
+        self.has_missing = bool(self.missing_left.any())
+        self.values = np.concatenate(values)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.depth = max(tree.tree_.max_depth for tree in trees)
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf node of every (tree, row) pair."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        flat = X.reshape(-1)
+        offsets = np.arange(len(X), dtype=np.intp) * X.shape[1]
+        nodes = np.repeat(self.roots[:, None], len(X), axis=1)
+        for _ in range(self.depth):
+            x = flat[offsets + self.feature[nodes]]
+            go_left = x <= self.threshold[nodes]
+            if self.has_missing:
+                go_left |= np.isnan(x) & self.missing_left[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        values = self.values[self.leaves(X)]
+        if self.kind == "tree":
+            prediction = values[0]
+            return prediction if self.classes is None else self.classes.take(prediction.argmax(axis=1))
+        if self.kind == "forest":
+            # Reducing over the tree axis adds one tree after the other, as sklearn accumulates them
+            prediction = np.add.reduce(values, axis=0) / len(self.roots)
+            return prediction if self.classes is None else self.classes.take(prediction.argmax(axis=1))
+        stages = (self.learning_rate * values).reshape(-1, self.trees_per_stage, len(X)).transpose(0, 2, 1)
+        raw = np.add.reduce(np.concatenate([np.broadcast_to(self.baseline, (1, *stages.shape[1:])), stages]), axis=0)
+        if self.classes is None:
+            return raw.reshape(-1)
+        if raw.shape[1] == 1:
+            return self.classes[(raw.reshape(-1) >= 0).astype(int)]
+        return self.classes[raw.argmax(axis=1)]
+
+
+_TREE_MODELS = (DecisionTreeClassifier, DecisionTreeRegressor, RandomForestClassifier, RandomForestRegressor,
+                ExtraTreesClassifier, ExtraTreesRegressor, GradientBoostingClassifier, GradientBoostingRegressor)
+
+
+def compile_estimator(model: Any) -> CompiledLinearModel | CompiledTreeEnsemble:
+    if type(model) in _TREE_MODELS:
+        return CompiledTreeEnsemble(model)
+    if isinstance(model, (LinearModel, LinearClassifierMixin)) and hasattr(model, "coef_"):
+        return CompiledLinearModel(model)
+    raise UnsupportedPipeline(f"{type(model).__name__} is not supported.")
+
+
+def _same_predictions(expected: np.ndarray, actual: np.ndarray) -> bool:
+    expected, actual = np.asarray(expected), np.asarray(actual)
+    if expected.shape != actual.shape:
+        return False
+    if expected.dtype.kind == "f":
+        # Sparse and dense dot products may round the last bit differently
+        return bool(np.allclose(expected, actual, rtol=1e-12, atol=1e-12))
+    return bool(np.array_equal(expected, actual))
+
+
+def compile_pipeline(preprocessor: Any, model: Any,
+                     rows: list[PredictRequest]) -> tuple[CompiledPreprocessor, Any] | None:
+    """Compiles a fitted preprocessor and estimator, or returns None if they are not supported.
+
+    The compiled pair is only returned if it predicts the same as the original on `rows`.
+    """
+    try:
+        compiled = compile_preprocessor(preprocessor), compile_estimator(model)
+    except Exception as e:
+        # Anything but the fitted attributes we know, e.g. column selectors or other transformers
+        logging.info(f"Serving {type(model).__name__} uncompiled: {e}")
+        return None
+    batch = build_batch(rows)
+    try:
+        expected = model.predict(transform_batch(preprocessor, batch))
+        actual = compiled[1].predict(compiled[0].transform_columns(batch))
+    except Exception as e:
+        logging.warning(f"Serving {type(model).__name__} uncompiled, the compiled pipeline failed: {e}")
+        return None
+    if not _same_predictions(expected, actual):
+        logging.warning(f"Serving {type(model).__name__} uncompiled, the compiled pipeline predicts differently.")
+        return None
+    return compiled
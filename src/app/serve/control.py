@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import threading
+import uuid
+from collections.abc import Awaitable, Callable
+from multiprocessing.connection import Connection
+from typing import Any
+
+
+# Called with (payload, origin); `origin` is True only in the process that received the request,
+# so side effects outside the process (e.g. registering in MLflow) happen once
+Handler = Callable[[dict, bool], Awaitable[Any]]
+
+
+class ControlPlane:
+    """Applies control-plane commands (/load, /deploy, /ab-test) to every serving process in the same order.
+
+    On its own, `execute` simply runs the registered handler. In a worker forked by the Supervisor,
+    the command is sent to the supervisor instead, which numbers it and broadcasts it to every
+    worker, this one included. Each worker applies broadcasts one at a time, in order, and the
+    worker that received the HTTP request answers with the result of its own run. When the models
+    live in inference daemons, `forward_to` sends every command to them instead.
+    """
+    def __init__(self):
+        self._handlers: dict[str, Handler] = {}
+        self._conn: Connection | None = None
+        self._backlog: list[tuple] = []
+        self._pending: dict[str, asyncio.Future] = {}
+        self._commands: asyncio.Queue | None = None
+        self._apply_task: asyncio.Task | None = None
+        # Serializes commands when there is no supervisor to order them
+        self._lock: asyncio.Lock | None = None
+        self._remote: Callable[[str, dict], Awaitable[Any]] | None = None
+
+    def register(self, name: str, handler: Handler) -> None:
+        self._handlers[name] = handler
+
+    def attach(self, conn: Connection, backlog: list[tuple] | None = None) -> None:
+        """Called in a freshly forked worker; `backlog` holds the commands broadcast before it started."""
+        self._conn = conn
+        self._backlog = list(backlog or [])
+
+    def forward_to(self, remote: Callable[[str, dict], Awaitable[Any]] | None) -> None:
+        """Sends commands to `remote`, e.g. the inference daemons that own the models, instead of applying them here."""
+        self._remote = remote
+
+    @property
+    def attached(self) -> bool:
+        return self._conn is not None
+
+    async def start(self) -> None:
+        """Starts applying broadcasts. Must run on the worker's event loop before it serves requests."""
+        if self._conn is None or self._apply_task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._commands = asyncio.Queue()
+        for command in self._backlog:
+            self._commands.put_nowait(command)
+        self._backlog = []
+        threading.Thread(target=self._read_loop, args=(loop,), name="control-plane", daemon=True).start()
+        self._apply_task = asyncio.create_task(self._apply_loop())
+        # Replayed state must be in place before the first request is served
+        await self._commands.join()
+
+    async def execute(self, name: str, payload: dict, origin: bool = True) -> Any:
+        """Applies a command; `origin` is False when another process already applies its outside side effects.
+
+        Under a supervisor, the worker that received the request is the origin and `origin` is ignored.
+        """
+        if name not in self._handlers:
+            raise ValueError(f"Unknown control-plane command {name}.")
+        if self._remote is not None:
+            return await self._remote(name, payload)
+        if self._conn is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                return await self._handlers[name](payload, origin)
+
+        command_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[command_id] = future
+        self._conn.send((command_id, name, payload))
+        return await future
+
+    def _read_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        while True:
+            try:
+                command = self._conn.recv()
+            except (EOFError, OSError):
+                logging.error("Lost the connection to the supervisor; control-plane commands are no longer applied.")
+                return
+            loop.call_soon_threadsafe(self._commands.put_nowait, command)
+
+    async def _apply_loop(self) -> None:
+        while True:
+            command_id, name, payload = await self._commands.get()
+            future = self._pending.pop(command_id, None)
+            try:
+                result = await self._handlers[name](payload, future is not None)
+            except Exception as e:
+                if future is not None:
+                    future.set_exception(e)
+                else:
+                    logging.error(f"Error applying control-plane command {name}: {e}")
+            else:
+                if future is not None:
+                    future.set_result(result)
+            finally:
+                self._commands.task_done()
+
+
+control_plane = ControlPlane()
@@ -0,0 +1,358 @@
+"""Inference daemon: model-owning processes that batch requests from every HTTP front-end.
+
+Front-ends connect over a Unix socket and pipeline requests on one connection. Every frame is
+
+    u32 length | u8 kind | u32 request id | payload
+
+A PREDICT payload starts with the u8 priority lane and the f64 seconds the client still waits
+(negative for no limit), packs the PredictRequest's int and float fields into one fixed struct,
+then its string fields and the user id (for A/B routing) as u16-length-prefixed UTF-8. Replies
+carry the request id, so they can arrive out of order: RESULT holds one f64 and the A/B variant
+as a string, ERROR a u16 status plus a message, and OVERLOADED the u16 status and Retry-After
+of a shed request plus the reason. CONTROL frames forward /load, /deploy and /ab-test to the daemon's control plane as JSON;
+only the daemon whose frame has `origin` set applies side effects outside the process (MLflow registration).
+The /ab-test/feedback and /ab-test/bandit CONTROL commands go to the daemon's runner, which owns the bandit.
+
+    PYTHONPATH=src python -m app.serve.daemon --socket /tmp/titanic-inference.sock
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import struct
+from typing import Any
+
+from fastapi import HTTPException
+
+from app.api.models import PredictRequest
+from app.serve.admission import Overloaded, Priority
+from app.serve.control import ControlPlane
+
+
+PREDICT, CONTROL, RESULT, ERROR, CONTROL_RESULT, OVERLOADED = range(1, 7)
+# CONTROL commands answered by the daemon's runner, not its control plane: the bandit of a `bandit` A/B test
+_BANDIT_COMMANDS = ("ab-test-feedback", "ab-test-bandit")
+
+_LENGTH = struct.Struct("<I")
+_HEADER = struct.Struct("<BI")
+_STRING_LENGTH = struct.Struct("<H")
+_STATUS = struct.Struct("<H")
+_RESULT = struct.Struct("<d")
+_OPTIONS = struct.Struct("<Bd")
+_OVERLOADED = struct.Struct("<HH")
+_NO_USER = 0xFFFF
+
+_NUMERIC_FIELDS = tuple(name for name, field in PredictRequest.model_fields.items() if field.annotation in (int, float))
+_STRING_FIELDS = tuple(name for name, field in PredictRequest.model_fields.items() if field.annotation is str)
+_NUMERIC = struct.Struct("<" + "".join("q" if PredictRequest.model_fields[name].annotation is int else "d"
+                                        for name in _NUMERIC_FIELDS))
+
+
+def _pack_string(value: str | None) -> bytes:
+    if value is None:
+        return _STRING_LENGTH.pack(_NO_USER)
+    data = value.encode()
+    if len(data) >= _NO_USER:
+        raise ValueError("String field too long for the inference protocol.")
+    return _STRING_LENGTH.pack(len(data)) + data
+
+
+def _unpack_string(payload: bytes, offset: int) -> tuple[str | None, int]:
+    (length,) = _STRING_LENGTH.unpack_from(payload, offset)
+    offset += _STRING_LENGTH.size
+    if length == _NO_USER:
+        return None, offset
+    return payload[offset:offset + length].decode(), offset + length
+
+
+def _frame(kind: int, request_id: int, payload: bytes) -> bytes:
+    return _LENGTH.pack(_HEADER.size + len(payload)) + _HEADER.pack(kind, request_id) + payload
+
+
+def encode_predict(request_id: int, request: PredictRequest, user_id: str | None = None,
+                   priority: Priority = Priority.interactive, timeout: float | None = None) -> bytes:
+    parts = [_OPTIONS.pack(priority, -1.0 if timeout is None else timeout),
+             _NUMERIC.pack(*(getattr(request, name) for name in _NUMERIC_FIELDS))]
+    parts.extend(_pack_string(getattr(request, name)) for name in _STRING_FIELDS)
+    parts.append(_pack_string(user_id))
+    return _frame(PREDICT, request_id, b"".join(parts))
+
+
+def decode_predict(payload: bytes) -> tuple[PredictRequest, str | None, Priority, float | None]:
+    priority, timeout = _OPTIONS.unpack_from(payload)
+    values = dict(zip(_NUMERIC_FIELDS, _NUMERIC.unpack_from(payload, _OPTIONS.size)))
+    offset = _OPTIONS.size + _NUMERIC.size
+    strings = []
+    for _ in range(len(_STRING_FIELDS) + 1):
+        value, offset = _unpack_string(payload, offset)
+        strings.append(value)
+    values.update(zip(_STRING_FIELDS, strings))
+    # The front-end already validated the request and the protocol keeps the field types
+    return PredictRequest.model_construct(**values), strings[-1], Priority(priority), None if timeout < 0 else timeout
+
+
+def encode_error(request_id: int, status: int, message: str) -> bytes:
+    return _frame(ERROR, request_id, _STATUS.pack(status) + message.encode())
+
+
+class DaemonError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class InferenceDaemon:
+    """Serves a runner's models to front-ends over a Unix socket."""
+    def __init__(self, socket_path: str, runner, control: ControlPlane):
+        self.socket_path = socket_path
+        self.runner = runner
+        self.control = control
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._serve, path=self.socket_path)
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        tasks: set[asyncio.Task] = set()
+        try:
+            while True:
+                (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                body = await reader.readexactly(length)
+                kind, request_id = _HEADER.unpack_from(body)
+                handler = self._predict if kind == PREDICT else self._control
+                task = asyncio.create_task(handler(writer, request_id, body[_HEADER.size:]))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def _predict(self, writer: asyncio.StreamWriter, request_id: int, payload: bytes) -> None:
+        try:
+            request, user_id, priority, timeout = decode_predict(payload)
+            response = await self.runner.run_inference(request, user_id, priority, timeout)
+        except Overloaded as e:
+            reply = _frame(OVERLOADED, request_id, _OVERLOADED.pack(e.status_code, e.retry_after) + e.reason.encode())
+        except ValueError as e:
+            reply = encode_error(request_id, 422, str(e))
+        except Exception as e:
+            reply = encode_error(request_id, 500, str(e))
+        else:
+            reply = _frame(RESULT, request_id, _RESULT.pack(response.survived) + _pack_string(response.variant))
+        await self._reply(writer, reply)
+
+    async def _control(self, writer: asyncio.StreamWriter, request_id: int, payload: bytes) -> None:
+        try:
+            command = json.loads(payload)
+            if command["name"] in _BANDIT_COMMANDS:
+                result = await self._bandit(command["name"], command["payload"])
+            else:
+                result = await self.control.execute(command["name"], command["payload"], command.get("origin", True))
+        except HTTPException as e:
+            reply = encode_error(request_id, e.status_code, str(e.detail))
+        except ValueError as e:
+            reply = encode_error(request_id, 400, str(e))
+        except Exception as e:
+            reply = encode_error(request_id, 500, str(e))
+        else:
+            body = result.model_dump(mode="json") if hasattr(result, "model_dump") else result
+            reply = _frame(CONTROL_RESULT, request_id, json.dumps(body).encode())
+        await self._reply(writer, reply)
+
+    @staticmethod
+    async def _reply(writer: asyncio.StreamWriter, frame: bytes) -> None:
+        # Waiting for the buffer to drain holds back replies to a front-end that reads slower than it pipelines
+        writer.write(frame)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            # The front-end is gone; its pending requests fail on its side
+            pass
+
+    async def _bandit(self, name: str, payload: dict) -> Any:
+        try:
+            if name == "ab-test-feedback":
+                await self.runner.record_feedback(payload["variant"], payload["reward"])
+                return {"status": "ok"}
+            return await self.runner.bandit_state()
+        except ValueError as e:
+            # 422 is raised as ValueError in the front-end, like the same call on a local runner
+            raise HTTPException(status_code=422, detail=str(e))
+
+
+class DaemonConnection:
+    """One pipelined connection from a front-end to a daemon."""
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._connecting: asyncio.Lock | None = None
+
+    async def _ensure_connected(self) -> asyncio.StreamWriter:
+        if self._writer is not None and not self._writer.is_closing():
+            return self._writer
+        if self._connecting is None:
+            self._connecting = asyncio.Lock()
+        async with self._connecting:
+            if self._writer is None or self._writer.is_closing():
+                try:
+                    reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+                except OSError as e:
+                    raise DaemonError(503, f"Cannot reach the inference daemon at {self.socket_path}: {e!r}")
+                self._reader_task = asyncio.create_task(self._read_loop(reader))
+        return self._writer
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        future = None
+        error = DaemonError(503, "Lost the connection to the inference daemon.")
+        try:
+            while True:
+                (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                body = await reader.readexactly(length)
+                kind, request_id = _HEADER.unpack_from(body)
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                payload = body[_HEADER.size:]
+                if kind == RESULT:
+                    (survived,) = _RESULT.unpack_from(payload)
+                    future.set_result((survived, _unpack_string(payload, _RESULT.size)[0]))
+                elif kind == CONTROL_RESULT:
+                    future.set_result(json.loads(payload))
+                elif kind == OVERLOADED:
+                    status, retry_after = _OVERLOADED.unpack_from(payload)
+                    future.set_exception(Overloaded(status, retry_after, payload[_OVERLOADED.size:].decode()))
+                else:
+                    (status,) = _STATUS.unpack_from(payload)
+                    message = payload[_STATUS.size:].decode()
+                    # Invalid requests fail the same way as when they are scored in this process
+                    future.set_exception(ValueError(message) if status == 422 else DaemonError(status, message))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            error = DaemonError(503, f"Lost the connection to the inference daemon: {e!r}")
+        except Exception as e:
+            # The stream cannot be resynchronised after a frame it failed to decode
+            logging.error(f"Malformed frame from the inference daemon at {self.socket_path}: {e!r}")
+            error = DaemonError(503, f"Malformed reply from the inference daemon: {e!r}")
+        finally:
+            # Also on cancellation: no request may wait for a reply that can no longer arrive
+            for pending in [future, *self._pending.values()]:
+                if pending is not None and not pending.done():
+                    pending.set_exception(error)
+            self._pending.clear()
+            if self._writer is not None:
+                self._writer.close()
+
+    async def _send(self, encode) -> Any:
+        writer = await self._ensure_connected()
+        request_id = next(self._ids) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        writer.write(encode(request_id))
+        await writer.drain()
+        return await future
+
+    async def predict(self, request: PredictRequest, user_id: str | None = None,
+                      priority: Priority = Priority.interactive, timeout: float | None = None) -> tuple[float, str | None]:
+        """Returns the prediction and the A/B variant that made it."""
+        return await self._send(lambda request_id: encode_predict(request_id, request, user_id, priority, timeout))
+
+    async def control(self, name: str, payload: dict, origin: bool = True) -> Any:
+        body = json.dumps({"name": name, "payload": payload, "origin": origin}).encode()
+        return await self._send(lambda request_id: _frame(CONTROL, request_id, body))
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+
+class DaemonClient:
+    """Spreads predictions over one or more daemons and sends control-plane commands to all of them."""
+    def __init__(self, socket_paths: list[str]):
+        self.connections = [DaemonConnection(path) for path in socket_paths]
+        self._next = itertools.cycle(self.connections)
+
+    async def predict(self, request: PredictRequest, user_id: str | None = None,
+                      priority: Priority = Priority.interactive, timeout: float | None = None) -> tuple[float, str | None]:
+        return await next(self._next).predict(request, user_id, priority, timeout)
+
+    async def control(self, name: str, payload: dict) -> Any:
+        """Applies a command in every daemon; the first one is the origin, e.g. the only one registering in MLflow.
+
+        Answers with the first daemon's result unless another daemon failed, so a command that only
+        took effect in some daemons is reported as failed.
+        """
+        results = await asyncio.gather(*(connection.control(name, payload, origin=i == 0)
+                                         for i, connection in enumerate(self.connections)), return_exceptions=True)
+        for connection, result in zip(self.connections, results):
+            if isinstance(result, (DaemonError, ValueError)):
+                raise HTTPException(status_code=getattr(result, "status", 400),
+                                    detail=f"{connection.socket_path}: {result}")
+            if isinstance(result, BaseException):
+                raise result
+        for connection, result in zip(self.connections, results):
+            # /load and /deploy report failures in their response instead of raising
+            if isinstance(result, dict) and str(result.get("status", "")).startswith("Failed"):
+                return {**result, "status": f"{result['status']} ({connection.socket_path})"}
+        return results[0]
+
+    async def record_feedback(self, variant: str, reward: float) -> None:
+        """Credits the reward in every daemon, so each bandit learns from all outcomes, not just its own share."""
+        await asyncio.gather(*(connection.control("ab-test-feedback", {"variant": variant, "reward": reward})
+                               for connection in self.connections))
+
+    async def bandit_state(self) -> dict:
+        """The bandit of the first daemon; the others saw the same rewards but their own pulls."""
+        return await self.connections[0].control("ab-test-bandit", {})
+
+    async def close(self) -> None:
+        await asyncio.gather(*(connection.close() for connection in self.connections))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=os.getenv("INFERENCE_DAEMON_SOCKET", "/tmp/titanic-inference.sock"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app.main import configure, shutdown
+    from app.serve.control import control_plane
+    from app.serve.inference import runner
+
+    async def serve():
+        configure()
+        # This process owns the models; it must not forward to a daemon itself
+        runner.set_configs(inference_daemon=[])
+        control_plane.forward_to(None)
+        daemon = InferenceDaemon(args.socket, runner, control_plane)
+        logging.info(f"Inference daemon listening on {args.socket}")
+        try:
+            await daemon.serve_forever()
+        finally:
+            shutdown()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
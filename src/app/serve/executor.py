@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import pickle
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+
+from app.api.models import PredictRequest
+from app.serve.columnar import ColumnarBatch, build_batch
+from app.serve.model import Model, RequestItem, score
+from app.serve.tracing import tracer
+from app.utils import Timer
+
+
+class ExecutorMode(Enum):
+    inline = "inline"
+    thread = "thread"
+    process = "process"
+
+
+class ExecutorShutdown(RuntimeError):
+    """Raised to the callers of a batch that `shutdown` cancelled before it was scored."""
+
+
+# (preprocessor, model) of the process pool worker, unpickled once by _init_worker
+_worker_state: tuple | None = None
+
+
+def _init_worker(payload: bytes) -> None:
+    global _worker_state
+    _worker_state = pickle.loads(payload)
+
+
+def _score_in_worker(batch: ColumnarBatch) -> tuple[list, Timer]:
+    preprocessor, model = _worker_state
+    return score(preprocessor, model, batch)
+
+
+class InferenceExecutor:
+    """Runs a Model's batches either inline on the event loop, on a thread pool, or on a process pool.
+
+    At most `max_in_flight` batches are scored concurrently; `submit` waits for a free slot,
+    which keeps the Batcher collecting requests (and forming bigger batches) under load.
+    """
+    def __init__(self, model: Model, mode: ExecutorMode = ExecutorMode.inline,
+                 max_workers: int | None = None, max_in_flight: int = 1):
+        self.model = model
+        self.mode = mode
+        self.max_in_flight = max_in_flight
+        self.max_workers = max_workers or max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: set[asyncio.Task] = set()
+        self._pool: Executor | None = None
+        # Called with (batch size, seconds spent scoring and logging it) after every batch
+        self.batch_observer: Callable[[int, float], None] | None = None
+        if mode == ExecutorMode.thread:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix=f"inference-{model.model_name}")
+        elif mode == ExecutorMode.process:
+            # The model is pickled once here and unpickled once per worker, not per batch
+            payload = pickle.dumps((model.preprocessor, model.model))
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             initializer=_init_worker, initargs=(payload,))
+
+    async def submit(self, batch: list[RequestItem]) -> None:
+        if self.mode == ExecutorMode.inline:
+            self._run_inline(batch)
+            return
+        await self._slots.acquire()
+        # Callers may have given up while the batch waited for a slot, e.g. a disconnected bulk upload
+        batch = [item for item in batch if not item.future.done()]
+        if not batch:
+            self._slots.release()
+            return
+        task = asyncio.create_task(self._run_pooled(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def warm(self, rows: list[PredictRequest]) -> tuple[list, Timer]:
+        """Scores `rows` where this executor will score traffic, without logging. Blocking; run it off the event loop.
+
+        In process mode every pool worker gets a copy of the batch, so the workers that serve
+        traffic are the ones warmed up, not this process.
+        """
+        if self.mode != ExecutorMode.process:
+            return self.model.score(rows)
+        columns = build_batch(rows)
+        futures = [self._pool.submit(_score_in_worker, columns) for _ in range(self.max_workers)]
+        return [future.result() for future in futures][-1]
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def wait_idle(self) -> None:
+        """Waits for every submitted batch to be scored and resolved."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _observe(self, batch: list[RequestItem], start: float) -> None:
+        if self.batch_observer is not None:
+            self.batch_observer(len(batch), time.perf_counter() - start)
+
+    def _run_inline(self, batch: list[RequestItem]) -> None:
+        start = time.perf_counter()
+        try:
+            self.model.predict(batch)
+        except Exception as e:
+            self._fail(batch, e)
+        else:
+            self._observe(batch, start)
+
+    async def _run_pooled(self, batch: list[RequestItem]) -> None:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            if self.mode == ExecutorMode.thread:
+                outputs = await loop.run_in_executor(self._pool, self.model.score_and_log, batch)
+            else:
+                started = time.perf_counter_ns()
+                columns = build_batch([item.input_data for item in batch])
+                built = time.perf_counter_ns()
+                # Columns pickle far smaller than the pydantic requests they came from
+                outputs, timer = await loop.run_in_executor(self._pool, _score_in_worker, columns)
+                # Loggers and history sinks live in this process; keep them off the loop thread
+                logging_started = time.perf_counter_ns()
+                await loop.run_in_executor(None, self.model.log_batch, batch, outputs, timer)
+                if tracer.enabled:
+                    # perf_counter_ns is system-wide on Linux, so the worker's timer lines up with ours
+                    tracer.record_batch(batch, started, built, timer, (logging_started, time.perf_counter_ns()))
+            self.model.resolve(batch, outputs)
+        except asyncio.CancelledError:
+            # shutdown() cancelled the batch while it waited for a worker; its callers must not wait forever
+            self._fail(batch, ExecutorShutdown(f"{self.model.model_name}({self.model.version}) was shut down "
+                                               f"before scoring the batch."))
+            raise
+        except Exception as e:
+            self._fail(batch, e)
+        else:
+            self._observe(batch, start)
+        finally:
+            self._slots.release()
+
+    def _fail(self, batch: list[RequestItem], error: Exception) -> None:
+        logging.error(f"Error predicting batch on {self.model.model_name}({self.model.version}): {error}")
+        for item in batch:
+            if not item.future.done():
+                item.future.set_exception(error)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
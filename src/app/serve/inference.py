@@ -1,14 +1,53 @@
-from pydantic import BaseModel
+import asyncio
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from typing import Any
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
 from app.api.models import PredictRequest, PredictResponse
-from app.serve.ab_test.ab import ABTestMode, ABTestWrapper
+from app.serve.ab_test.ab import ABTestMode, ABTestWrapper, make_router
+from app.serve.ab_test.bandit import BanditPolicy, BanditReward, BanditRouter
+from app.serve.ab_test.routing import RampSchedule
+from app.serve.ab_test.shadow import ShadowScorer
+from app.serve.adaptive import AdaptiveBatchController
+from app.serve.admission import Overloaded, Priority
 from app.serve.batcher import Batcher
+from app.serve.cache import PredictionCache
+from app.serve.daemon import DaemonClient, DaemonError
+from app.serve.executor import ExecutorMode, InferenceExecutor
 from app.serve.model import Model
+from app.serve.tracing import current_trace
+from app.serve.warmup import WarmupReport, synthetic_rows, warm_up
 
 
 class ModelDeployConfigs(BaseModel):
     batch_size: int = 16
     batch_timeout: float = 0.05
     ab_test_mode: ABTestMode | None = None
+    executor_mode: ExecutorMode = ExecutorMode.inline
+    executor_workers: int | None = None
+    max_in_flight_batches: int = 1
+    adaptive_batching: bool = False
+    latency_slo: float = 0.1
+    max_batch_size: int = 256
+    prediction_cache_size: int = 0
+    prediction_cache_ttl: float = 300.0
+    warmup: bool = True
+    warmup_rows: int = 64
+    warmup_max_rounds: int = 200
+    warmup_tolerance: float = 0.2
+    shadow_sample_rate: float = 1.0
+    shadow_max_pending: int = 256
+    bandit_policy: BanditPolicy = BanditPolicy.thompson
+    bandit_reward: BanditReward = BanditReward.feedback
+    # Requests queued per batcher before new ones are shed with a 429 (0 = unbounded)
+    max_queue_size: int = 1024
+    # Seconds a request may wait for its prediction when the client sets no timeout (None = no limit)
+    request_timeout: float | None = None
+    # Unix sockets of inference daemons to forward predictions to, instead of batching in this process
+    inference_daemon: list[str] = []
     
 
 
@@ -16,32 +55,107 @@ class InferenceRunner:
     def __init__(self):
         self._running_models: dict[str, Batcher] = {}
         self.runner_configs: ModelDeployConfigs | None = ModelDeployConfigs()
+        self.prediction_cache: PredictionCache | None = None
+        self.daemon: DaemonClient | None = None
+        self.shadow = ShadowScorer()
+        self.ab_test: ABTestWrapper | None = None
         
-    def set_configs(self, batch_size: int = 16, batch_timeout: float = 0.05, ab_test_mode: ABTestMode | None = None):
-        self.runner_configs = ModelDeployConfigs(batch_size=batch_size, batch_timeout=batch_timeout, ab_test_mode=ab_test_mode)
+    def set_configs(self, **configs):
+        """Updates the given fields of the runner configs, keeping the others as they are."""
+        previous = self.runner_configs
+        self.runner_configs = ModelDeployConfigs(**{**self.runner_configs.model_dump(), **configs})
+        size, ttl = self.runner_configs.prediction_cache_size, self.runner_configs.prediction_cache_ttl
+        if (size, ttl) != (previous.prediction_cache_size, previous.prediction_cache_ttl):
+            # Takes effect for batchers created from now on
+            self.prediction_cache = PredictionCache(size, ttl) if size > 0 else None
+        self.shadow.sample_rate = self.runner_configs.shadow_sample_rate
+        self.shadow.max_pending = self.runner_configs.shadow_max_pending
+        if self.runner_configs.inference_daemon != previous.inference_daemon:
+            self.daemon = DaemonClient(self.runner_configs.inference_daemon) \
+                if self.runner_configs.inference_daemon else None
         
-    def new_batcher(self, model: Model, batch_size: int | None = None, batch_timeout: float | None= None):
+    def new_executor(self, model: Model) -> InferenceExecutor:
+        return InferenceExecutor(model,
+                                 mode=self.runner_configs.executor_mode,
+                                 max_workers=self.runner_configs.executor_workers,
+                                 max_in_flight=self.runner_configs.max_in_flight_batches)
+
+    def new_batcher(self, model: Model, batch_size: int | None = None, batch_timeout: float | None= None,
+                    executor: InferenceExecutor | None = None):
         if batch_size is None:
             batch_size = self.runner_configs.batch_size
         if batch_timeout is None:
             batch_timeout = self.runner_configs.batch_timeout
         
-        self._running_models[f"{model.name}({model.version})-{model.variant}"] = Batcher(model, batch_size, batch_timeout)
+        executor = executor or self.new_executor(model)
+        controller = None
+        if self.runner_configs.adaptive_batching:
+            controller = AdaptiveBatchController(
+                latency_slo=self.runner_configs.latency_slo,
+                max_batch_size=self.runner_configs.max_batch_size,
+                labels={"model_name": model.model_name, "model_version": model.version, "variant": model.variant})
+        self._running_models[f"{model.model_name}({model.version})-{model.variant}"] = Batcher(
+            model, batch_size, batch_timeout, executor, controller, cache=self.prediction_cache,
+            max_queue_size=self.runner_configs.max_queue_size)
 
-    def deprecate_batcher(self, model_name: str, model_version: str, variant: str = "deploy"):
-        key = f"{model_name}({model_version})-{variant}"
-        if key in self._running_models:
-            self._running_models[f"{model_name}({model_version})-{variant}_deprecated"] = self._running_models[key]
-            del self._running_models[key]
-        else:
-            raise ValueError(f"Batcher {key} not found.")
-        
-    def _delete_deprecated_batchers(self):
-        # delete all batchers such that the key ends with "_deprecated"
-        keys_to_delete = [key for key in self._running_models if key.endswith("_deprecated")]
-        for key in keys_to_delete:
-            if self._running_models[key].is_empty():
-                del self._running_models[key]
+    async def swap_models(self, models: list[Model], ab_test_mode: ABTestMode | None = None,
+                          warmup_rows: list[PredictRequest] | None = None, weights: list[float] | None = None,
+                          ramp: RampSchedule | None = None) -> list[WarmupReport]:
+        """Replaces every serving batcher by batchers for `models`, without dropping a request.
+
+        The new models are warmed up first, on the executors that will serve them, and the deploy
+        is abandoned with a ValueError if their latency does not settle. The switch itself has no
+        await in it, so every request is routed either entirely to the old models or entirely to
+        the new ones. The old batchers then score what they had queued and are shut down before
+        this returns.
+        In an A/B test, `weights` (or the `ramp` schedule) split the traffic between `models`.
+        """
+        router = None
+        if ab_test_mode is not None:
+            weights = weights or [1.0] * len(models)
+            if len(weights) != len(models):
+                raise ValueError(f"Expected {len(models)} variant weights, got {len(weights)}.")
+            # Salted with the experiment, so users are reshuffled between tests but stable within one
+            salt = "|".join(f"{model.model_name}({model.version})" for model in models)
+            router = make_router(ab_test_mode, weights, salt=salt, schedule=ramp,
+                                 bandit_policy=self.runner_configs.bandit_policy)
+
+        # Warm-up goes through the executors that will serve the traffic, e.g. their process pool workers
+        executors = [self.new_executor(model) for model in models]
+        reports = []
+        try:
+            if self.runner_configs.warmup:
+                rows = warmup_rows or synthetic_rows(self.runner_configs.warmup_rows)
+                batch_size = self.runner_configs.max_batch_size if self.runner_configs.adaptive_batching \
+                    else self.runner_configs.batch_size
+                for model, executor in zip(models, executors):
+                    report = await asyncio.to_thread(warm_up, model, rows, batch_size,
+                                                     max_rounds=self.runner_configs.warmup_max_rounds,
+                                                     tolerance=self.runner_configs.warmup_tolerance, executor=executor)
+                    if not report.stable:
+                        raise ValueError(f"Latency of {model.model_name}({model.version}) did not settle after "
+                                         f"{report.rounds} warm-up rounds.")
+                    reports.append(report)
+        except BaseException:
+            for executor in executors:
+                executor.shutdown()
+            raise
+
+        retired = list(self._running_models.values())
+        self._running_models.clear()
+        if self.prediction_cache is not None:
+            self.prediction_cache.clear()
+        self.set_configs(ab_test_mode=ab_test_mode)
+        if ab_test_mode == ABTestMode.shadow:
+            # The shadow variant is compared to A in aggregate by the ShadowScorer instead
+            models[1].log_predictions = False
+        for model, executor in zip(models, executors):
+            self.new_batcher(model, executor=executor)
+        self.ab_test = None if router is None else ABTestWrapper(
+            list(self._running_models.values()), ab_test_mode, router)
+
+        await asyncio.gather(*(batcher.drain() for batcher in retired))
+        return reports
 
     def _get_batcher_by_key(self, model_name: str, model_version: str, variant: str = "deploy"):
         key = f"{model_name}({model_version})-{variant}"
@@ -49,19 +163,17 @@ class InferenceRunner:
             return self._running_models[key]
         else:
             raise ValueError(f"Batcher {key} not found.")
-     
-    def _find_non_deprecated_batchers(self) -> dict[str, Batcher]:
-        return {key: batcher for key, batcher in self._running_models.items() if not key.endswith("_deprecated")}
 
     def get_active_deploy_batcher(self) -> Batcher:
-        active_batchers = self._find_non_deprecated_batchers()
+        active_batchers = self._running_models
         if not active_batchers:
             raise ValueError("No active batchers found.")
         # Return the first active batcher
         return next(iter(active_batchers.values()))
        
     async def get_batcher_for_inference(self) -> Batcher | tuple[Batcher, Batcher]:
-        active_batchers = self._find_non_deprecated_batchers()
+        """The deploy batcher, or the A and B batchers during an A/B test, which has only these two variants."""
+        active_batchers = self._running_models
         if not active_batchers:
             raise ValueError("No active batchers found.")
         if self.runner_configs.ab_test_mode is not None:
@@ -69,33 +181,151 @@ class InferenceRunner:
             key_B = [key for key in active_batchers.keys() if key.endswith("-B")]
             if not key_A or not key_B:
                 raise ValueError("No active batchers found for A/B testing.")
-            return tuple(active_batchers[key_A[0]], active_batchers[key_B[0]])
+            return active_batchers[key_A[0]], active_batchers[key_B[0]]
         else:
             # Return the first active batcher
             return next(iter(active_batchers.values()))
 
-
-    async def run_inference(self, request: PredictRequest, user_id: str) -> PredictResponse:
+    async def run_inference(self, request: PredictRequest, user_id: str | None = None,
+                            priority: Priority = Priority.interactive, timeout: float | None = None) -> PredictResponse:
+        """Scores one request. Raises Overloaded when it is shed: its lane is full or `timeout` seconds pass first."""
+        timeout = timeout if timeout is not None else self.runner_configs.request_timeout
+        # Bulk rows share their upload's trace: only interactive requests are traced, as in RequestItem
+        trace = current_trace.get() if priority == Priority.interactive else None
+        if self.daemon is not None:
+            # The daemon batches requests from every front-end together
+            if trace is not None:
+                trace.mark("route")
+            try:
+                survived, variant = await self.daemon.predict(request, user_id, priority, timeout)
+            except DaemonError as e:
+                # e.g. 503 when the daemon went away, instead of a bare 500
+                raise HTTPException(status_code=e.status, detail=str(e))
+            if trace is not None:
+                trace.mark("batcher")
+            return PredictResponse(survived=survived, variant=variant)
+        deadline = None if timeout is None else time.monotonic() + timeout
         batcher = await self.get_batcher_for_inference()
         if self.runner_configs.ab_test_mode is not None:
-            batcher_A, batcher_B = batcher
-            runner = ABTestWrapper(batcher_A, batcher_B, ab_test_mode=self.runner_configs.ab_test_mode)
-            outputs, choice = runner.infer(request, user_id)
-            output = outputs[choice]
+            started = time.perf_counter()
+            ab_test = self._ab_test_for(list(batcher))
+            prediction, choice = ab_test.infer(request, user_id, priority=priority, deadline=deadline)
+            if trace is not None:
+                trace.mark("route")
+            output = await prediction
+            if trace is not None:
+                trace.mark("batcher")
+            if self.runner_configs.ab_test_mode == ABTestMode.shadow:
+                self.shadow.submit(*ab_test.batchers, request, output)
+            elif (self.runner_configs.ab_test_mode == ABTestMode.bandit
+                  and self.runner_configs.bandit_reward == BanditReward.latency):
+                within_slo = time.perf_counter() - started <= self.runner_configs.latency_slo
+                ab_test.router.record(choice, 1.0 if within_slo else 0.0)
+            variant = ab_test.batchers[choice].model.variant
         else:
-            output = batcher.queue_request(request, user_id)
-        
-        self._delete_deprecated_batchers()
-        return output
-    
-    def deprecate_current_batchers(self):
-        # deprecate all current models
-        # change all keys from ._running_models to add _deprecated through deprecate_batcher
-        for key in list(self._running_models.keys()):
-            if not key.endswith("_deprecated"):
-                model_name, rest = key.split("(", 1)
-                model_version, variant = rest.rsplit(")", 1)
-                variant = variant.lstrip("-")
-                self.deprecate_batcher(model_name, model_version, variant)
+            if trace is not None:
+                trace.mark("route")
+            output = await batcher.queue_request(request, priority, deadline)
+            if trace is not None:
+                trace.mark("batcher")
+            variant = None
+
+        return PredictResponse(survived=float(output), variant=variant)
+
+    def _bandit(self) -> tuple[ABTestWrapper, BanditRouter]:
+        if self.ab_test is None or not isinstance(self.ab_test.router, BanditRouter) \
+                or self.runner_configs.ab_test_mode != ABTestMode.bandit:
+            raise ValueError("No bandit A/B test is running.")
+        return self.ab_test, self.ab_test.router
+
+    async def record_feedback(self, variant: str, reward: float) -> None:
+        """Credits `reward` (between 0 and 1) to the variant that served a request, e.g. once its outcome is known."""
+        if self.daemon is not None:
+            # The bandit lives in the daemons that score the requests
+            await self.daemon.record_feedback(variant, reward)
+            return
+        ab_test, bandit = self._bandit()
+        variants = [batcher.model.variant for batcher in ab_test.batchers]
+        if variant not in variants:
+            raise ValueError(f"Unknown variant {variant}; expected one of {variants}.")
+        bandit.record(variants.index(variant), reward)
+
+    async def bandit_state(self) -> dict:
+        if self.daemon is not None:
+            return await self.daemon.bandit_state()
+        ab_test, bandit = self._bandit()
+        return bandit.state([batcher.model.variant for batcher in ab_test.batchers])
+
+    def _ab_test_for(self, batchers: list[Batcher]) -> ABTestWrapper:
+        # Batchers set up without swap_models get an even split
+        if self.ab_test is None or self.ab_test.batchers != batchers:
+            self.ab_test = ABTestWrapper(batchers, self.runner_configs.ab_test_mode)
+        return self.ab_test
+
+    def preferred_chunk_size(self) -> int:
+        """Number of rows worth submitting at once so the active batchers can fill whole batches."""
+        active_batchers = self._running_models
+        if self.runner_configs.adaptive_batching:
+            return self.runner_configs.max_batch_size
+        return max((batcher.batch_size for batcher in active_batchers.values()),
+                   default=self.runner_configs.batch_size)
+
+    async def _predict_record(self, record: Any, user_id: str | None) -> dict:
+        try:
+            if isinstance(record, ValueError):
+                # A line of the upload that is not valid JSON
+                raise record
+            if isinstance(record, dict) and "user_id" in record:
+                record = dict(record)
+                user_id = record.pop("user_id")
+            request = PredictRequest.model_validate(record)
+            # Streamed uploads must not crowd out interactive requests
+            response = await self.run_inference(request, user_id, Priority.bulk)
+        except (ValidationError, ValueError, Overloaded) as e:
+            return {"error": str(e)}
+        except HTTPException as e:
+            return {"error": str(e.detail)}
+        return response.model_dump(exclude_none=True)
+
+    async def run_batch_inference(self, records: AsyncIterator[Any], user_id: str | None = None,
+                                  chunk_size: int | None = None, max_pending_chunks: int = 2) -> AsyncIterator[dict]:
+        """Scores a stream of raw records, yielding one result per record in input order.
+
+        Records are submitted `chunk_size` at a time, and at most `max_pending_chunks` chunks are in
+        flight, so the memory used does not depend on the length of the stream. Closing the
+        generator early, as a disconnecting client does, cancels the chunks still in flight.
+        """
+        chunk_size = chunk_size or self.preferred_chunk_size()
+        pending: deque[list[asyncio.Task]] = deque()
+        chunk: list[asyncio.Task] = []
+        stream_error: ValueError | None = None
+        try:
+            try:
+                async for record in records:
+                    chunk.append(asyncio.create_task(self._predict_record(record, user_id)))
+                    if len(chunk) < chunk_size:
+                        continue
+                    pending.append(chunk)
+                    chunk = []
+                    if len(pending) >= max_pending_chunks:
+                        for result in await asyncio.gather(*pending.popleft()):
+                            yield result
+            except ValueError as e:
+                # The stream broke off: still deliver the rows that were already submitted
+                stream_error = e
+            if chunk:
+                pending.append(chunk)
+                chunk = []
+            while pending:
+                for result in await asyncio.gather(*pending.popleft()):
+                    yield result
+            if stream_error is not None:
+                raise stream_error
+        finally:
+            # The client went away mid-stream: don't keep scoring rows nobody will read
+            tasks = [task for tasks in (*pending, chunk) for task in tasks if not task.done()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
 runner = InferenceRunner()
\ No newline at end of file
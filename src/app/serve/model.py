@@ -1,27 +1,44 @@
 import asyncio
 import time
 
-import pandas as pd
 from sklearn.base import BaseEstimator
 from sklearn.pipeline import Pipeline
 from app.api.models import PredictRequest
-from app.loggers import log_inference, log_history
+from app.loggers import log_batch_size, log_inference, log_history
 from app.loggers.extensions.base import LoggingExtension
 from app.loggers.history.base import HistoryBase
 from app.loggers.history.lite import history_sqlite
+from app.loggers.telemetry import BatchRecord, TelemetryBus
+from app.serve.columnar import ColumnarBatch, build_batch, transform_batch
+from app.serve.tracing import current_trace, tracer
 from app.utils import Timer
 
 
 class RequestItem:
-    def __init__(self, input_data: PredictRequest):
+    def __init__(self, input_data: PredictRequest, priority: int = 0, deadline: float | None = None):
         self.input_data = input_data
+        self.priority = priority
+        # time.monotonic() after which the client no longer waits for the prediction
+        self.deadline = deadline
         self.start_time = time.perf_counter_ns()
+        # Bulk rows share their upload's trace and shadow requests outlive theirs: only interactive ones are traced
+        self.trace = current_trace.get() if priority == 0 else None
         self.future = asyncio.get_event_loop().create_future()
 
 
+def score(preprocessor: Pipeline, model: BaseEstimator, batch: ColumnarBatch) -> tuple[list, Timer]:
+    """Preprocess and score a batch. Touches no loggers or futures, so it can run in any thread or process."""
+    features = transform_batch(preprocessor, batch)
+
+    with Timer() as timer:
+        outputs = model.predict(features)
+    return outputs, timer
+
+
 class Model:
-    def __init__(self, model: BaseEstimator, preprocessor: Pipeline, version: str, 
-                 model_name: str, variant: str = 'deploy', *, loggers: list[LoggingExtension] = None, histories: list[HistoryBase] = None):
+    def __init__(self, model: BaseEstimator, preprocessor: Pipeline, version: str,
+                 model_name: str, variant: str = 'deploy', *, loggers: list[LoggingExtension] = None, histories: list[HistoryBase] = None,
+                 telemetry: TelemetryBus | None = None):
         self.model = model
         self.preprocessor = preprocessor
         self.version = version
@@ -29,37 +46,72 @@ class Model:
         self.loggers = loggers or []
         self.histories = histories or [history_sqlite]
         self.variant = variant
+        # When set, loggers and histories are fed from the bus's consumers instead of inline
+        self.telemetry = telemetry
+        # Off for shadow variants, which are only compared to the live one in aggregate
+        self.log_predictions = True
 
-    def predict(self, X: list[RequestItem]):
-        
-        inputs = self.preprocessor.predict(pd.DataFrame([x.input_data.model_dump() for x in X]))
-        
-        with Timer() as timer:
-            outputs = self.model.predict(inputs)
-            
+    def score(self, inputs: list[PredictRequest]) -> tuple[list, Timer]:
+        return score(self.preprocessor, self.model, build_batch(inputs))
+
+    def log_batch(self, X: list[RequestItem], outputs: list, timer: Timer) -> None:
+        if not self.log_predictions:
+            return
+        if self.telemetry is not None:
+            now = time.perf_counter_ns()
+            self.telemetry.publish(BatchRecord(
+                self.model_name, self.version, self.variant,
+                inputs=[item.input_data for item in X],
+                outputs=list(outputs),
+                latencies=[(now - item.start_time) / 1e6 for item in X],
+                wait_times=[(timer.start_time - item.start_time) / 1e6 for item in X],
+                inference_time=timer.elapsed_time / 1e6,
+            ))
+            return
         for item, pred in zip(X, outputs):
             total_latency = time.perf_counter_ns() - item.start_time
             wait_time = timer.start_time - item.start_time
+            # Loggers take milliseconds
             log_inference(
                 model_name=self.model_name,
                 input_data=item.input_data,
-                prediction=item.prediction,
-                latency=total_latency * 1000,
+                prediction=pred,
+                latency=total_latency / 1e6,
                 variant=self.variant,
-                model_version=self.model.model_version,
-                wait_time=wait_time * 1000,
-                inference_time=timer.elapsed_time * 1000,
+                model_version=self.version,
+                wait_time=wait_time / 1e6,
+                inference_time=timer.elapsed_time / 1e6,
                 loggers=self.loggers
             )
-            
+
             log_history(
                 model_name=self.model_name,
                 input_data=item.input_data,
-                prediction=item.prediction,
+                prediction=pred,
                 variant=self.variant,
-                model_version=self.model.model_version,
+                model_version=self.version,
                 history_loggers=self.histories
             )
-            
-            item.future.set_result(pred)
-        return outputs
\ No newline at end of file
+        log_batch_size(self.model_name, self.version, self.variant, len(X), loggers=self.loggers)
+
+    def score_and_log(self, X: list[RequestItem]) -> list:
+        started = time.perf_counter_ns()
+        batch = build_batch([x.input_data for x in X])
+        built = time.perf_counter_ns()
+        outputs, timer = score(self.preprocessor, self.model, batch)
+        self.log_batch(X, outputs, timer)
+        if tracer.enabled:
+            tracer.record_batch(X, started, built, timer, (timer.end_time, time.perf_counter_ns()))
+        return outputs
+
+    @staticmethod
+    def resolve(X: list[RequestItem], outputs: list) -> None:
+        """Hand predictions to the waiting callers. Must run on the event loop thread."""
+        for item, pred in zip(X, outputs):
+            if not item.future.done():
+                item.future.set_result(pred)
+
+    def predict(self, X: list[RequestItem]):
+        outputs = self.score_and_log(X)
+        self.resolve(X, outputs)
+        return outputs
@@ -2,18 +2,26 @@ from sklearn.base import BaseEstimator
 from sklearn.pipeline import Pipeline
 
 from app.loggers.extensions.base import LoggingExtension
-from app.loggers.extensions.mlflow import log_model_to_mlflow_and_register
+from app.loggers.extensions.mlflow import log_model_to_mlflow_and_register, registration_runs
 from app.loggers.history.base import HistoryBase
 from app.loggers.history.lite import history_sqlite
+from app.loggers.telemetry import TelemetryBus
+from app.serve.compiler import compile_pipeline
 from app.serve.model import Model
 from app.serve.inference import runner
+from app.serve.warmup import synthetic_rows
 
     
 
 class ModelServiceProviderConfigs:
-    def __init__(self, extensions: list[LoggingExtension] | None = None, histories: list[HistoryBase] | None = None):
+    def __init__(self, extensions: list[LoggingExtension] | None = None, histories: list[HistoryBase] | None = None,
+                 telemetry: TelemetryBus | None = None, register_in_mlflow: bool = True, compile_models: bool = False):
         self.extensions = extensions or []
         self.histories = histories or [history_sqlite]
+        self.telemetry = telemetry
+        self.register_in_mlflow = register_in_mlflow
+        # Serve supported sklearn pipelines through app.serve.compiler instead of sklearn's own predict
+        self.compile_models = compile_models
     
 
 class ModelServiceProvider:
@@ -32,19 +40,32 @@ class ModelServiceProvider:
     def is_model_registered(self, name: str, version: str) -> bool:
         return f"{name}({version})" in self._loaded_models 
 
-    def register_model(self, model: BaseEstimator, preprocessor: Pipeline, version: str, model_name: str) -> tuple[str, str]:
+    def register_model(self, model: BaseEstimator, preprocessor: Pipeline, version: str, model_name: str,
+                       log_to_mlflow: bool = True, compile: bool | None = None) -> tuple[str, str | None]:
+        """Makes a fitted model and its preprocessor deployable as `model_name(version)`.
+
+        With `compile` (the configs' `compile_models` by default), a supported pipeline is served
+        compiled to NumPy; MLflow always gets the original one.
+        """
         key = f"{model_name}({version})"
         if key in self._loaded_models:
             raise ValueError(f"Model {key} already registered.")
 
-        registered_version, _ = log_model_to_mlflow_and_register(
-            model=model,
-            preprocessor=preprocessor,
-            model_name=model_name,
-            version=version,
-            extra_tags={"registered_by": "ModelServiceProvider"}
-        )
+        registered_version = None
+        if log_to_mlflow:
+            registered_version, run_id = log_model_to_mlflow_and_register(
+                model=model,
+                preprocessor=preprocessor,
+                model_name=model_name,
+                version=version,
+                extra_tags={"registered_by": "ModelServiceProvider"}
+            )
+            registration_runs[(model_name, version)] = run_id
 
+        if self.configs.compile_models if compile is None else compile:
+            compiled = compile_pipeline(preprocessor, model, synthetic_rows(256))
+            if compiled is not None:
+                preprocessor, model = compiled
         self._loaded_models[key] = (preprocessor, model)
         return model_name, registered_version
 
@@ -52,7 +73,8 @@ class ModelServiceProvider:
     def load_model(self, model_name: str, version: str) -> Model:
         self.new_experiment(ab_testing=False, model_name=f"{model_name}__{version}")
         preprocessor, model = self._loaded_models.get(f"{model_name}({version})", (None, None))
-        return Model(model, preprocessor, version, model_name, loggers=self.configs.extensions, histories=self.configs.histories)
+        return Model(model, preprocessor, version, model_name, loggers=self.configs.extensions, histories=self.configs.histories,
+                     telemetry=self.configs.telemetry)
 
     def load_ab_test_models(self, name_a, version_a, name_b, version_b, **kwargs) -> tuple[Model, Model]:
         if name_a is None and version_a is None:
@@ -73,8 +95,10 @@ class ModelServiceProvider:
         preprocessor_A, model_A = self._loaded_models.get(f"{name_a}({version_a})", (None, None))
         preprocessor_B, model_B = self._loaded_models.get(f"{name_b}({version_b})", (None, None))
         return (
-            Model(model_A, preprocessor_A, version_a, name_a, "A", loggers=self.configs.extensions, histories=self.configs.histories),
-            Model(model_B, preprocessor_B, version_b, name_b, "B", loggers=self.configs.extensions, histories=self.configs.histories)
+            Model(model_A, preprocessor_A, version_a, name_a, "A", loggers=self.configs.extensions, histories=self.configs.histories,
+                  telemetry=self.configs.telemetry),
+            Model(model_B, preprocessor_B, version_b, name_b, "B", loggers=self.configs.extensions, histories=self.configs.histories,
+                  telemetry=self.configs.telemetry)
         )
         
     def set_configs(self, configs: ModelServiceProviderConfigs) -> None:
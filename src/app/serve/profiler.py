@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from types import FrameType
+
+from prometheus_client import Counter as PromCounter, Histogram
+
+
+LOOP_LAG = Histogram("event_loop_lag_seconds", "How late the event loop woke up a sleeping heartbeat",
+                     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+LOOP_STALLS = PromCounter("event_loop_stalls", "Event loop stalls above the lag monitor's threshold")
+
+# Rendered frames by (code object, line number); stacks repeat across samples
+_frame_names: dict[tuple, str] = {}
+
+
+def _frame_name(frame: FrameType) -> str:
+    key = (frame.f_code, frame.f_lineno)
+    name = _frame_names.get(key)
+    if name is None:
+        path = frame.f_code.co_filename.rsplit(os.sep, 2)
+        # ';' separates frames in the collapsed format; the count follows the last space
+        name = f"{frame.f_code.co_name} ({'/'.join(path[-2:])}:{frame.f_lineno})".replace(";", ",")
+        _frame_names[key] = name
+    return name
+
+
+def collapse(frame: FrameType | None) -> list[str]:
+    """The stack of `frame`, outermost call first."""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_name(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class SamplingProfiler:
+    """Samples the stacks of running threads through sys._current_frames() from a background thread.
+
+    The profiled code is not instrumented: each sample holds the GIL for as long as it takes to
+    walk the stacks, so the overhead is roughly the sample rate times a few microseconds.
+    Only one profile runs at a time.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval: float = 0.005, thread_id: int | None = None) -> Counter:
+        """Samples every `interval` seconds for `seconds`; returns sample counts by collapsed stack.
+
+        Only `thread_id` is sampled, or every other thread when it is None. Raises RuntimeError
+        when a profile is already running.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running.")
+        try:
+            return self._sample(seconds, interval, thread_id)
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _sample(seconds: float, interval: float, thread_id: int | None) -> Counter:
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks: Counter = Counter()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (thread_id is not None and ident != thread_id):
+                    continue
+                stack = [names.get(ident, str(ident)), *collapse(frame)]
+                stacks[";".join(stack)] += 1
+            time.sleep(interval)
+        return stacks
+
+    @staticmethod
+    def format(stacks: Counter) -> str:
+        """The collapsed-stack format read by flamegraph.pl, speedscope and inferno: `a;b;c count` lines."""
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class LoopLagMonitor:
+    """Records every event loop stall longer than `threshold` seconds with the stack that caused it.
+
+    A heartbeat task sleeps `interval` seconds at a time and measures how late it wakes up. A
+    watchdog thread notices a missed heartbeat while the loop is still stalled and captures the
+    loop thread's stack then, since by the time the loop runs again the culprit has returned.
+    """
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05, max_stalls: int = 100):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls: deque[dict] = deque(maxlen=max_stalls)
+        self._beat = time.monotonic()
+        # (heartbeat the stall started after, stack) captured by the watchdog
+        self._captured: tuple[float, list[str]] | None = None
+        self._loop_thread: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stopped = threading.Event()
+
+    def set_configs(self, threshold: float = 0.1, interval: float = 0.05) -> None:
+        self.threshold = threshold
+        self.interval = interval
+
+    def start(self) -> None:
+        """Starts monitoring the running loop; must be called from it."""
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        # A fresh event per start, so a watchdog that has not noticed a previous stop still exits
+        self._stopped = threading.Event()
+        self._task = asyncio.create_task(self._heartbeat())
+        threading.Thread(target=self._watchdog, args=(self._stopped,), name="loop-lag-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            previous = self._beat
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._beat = now = time.monotonic()
+            lag = max(0.0, now - expected)
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                captured = self._captured
+                stack = captured[1] if captured is not None and captured[0] == previous else []
+                self._record(lag, stack)
+
+    def _record(self, lag: float, stack: list[str]) -> None:
+        LOOP_STALLS.inc()
+        self.stalls.append({"at": time.time() - lag, "duration": lag, "stack": stack})
+        logging.warning(f"Event loop stalled for {lag * 1000:.0f}ms in {stack[-1] if stack else 'unknown code'}")
+
+    def _watchdog(self, stopped: threading.Event) -> None:
+        while not stopped.wait(self.threshold / 4):
+            beat = self._beat
+            # The heartbeat is due every `interval`; it is late by more than the threshold
+            if time.monotonic() - beat > self.interval + self.threshold and \
+                    (self._captured is None or self._captured[0] != beat):
+                frame = sys._current_frames().get(self._loop_thread)
+                self._captured = (beat, collapse(frame))
+
+
+profiler = SamplingProfiler()
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,134 @@
+import logging
+import os
+import signal
+import socket
+import time
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection, wait
+
+import uvicorn
+
+from app.serve.control import control_plane
+
+
+class Supervisor:
+    """Serves the app from `workers` forked processes sharing one listening socket.
+
+    Anything loaded in the supervisor before `run` (e.g. models registered in `model_hub`)
+    is inherited by every worker copy-on-write, and artifacts loaded through the memory-mapped
+    artifact cache share their pages as well. Each worker has its own event loop, batchers and
+    loggers. Control-plane commands are sequenced here: a worker forwards the command, the
+    supervisor appends it to its log and sends it to every worker. Workers that are forked later,
+    e.g. to replace one that died, replay the log first, so all workers converge on the same state.
+    """
+    def __init__(self, app, host: str = "0.0.0.0", port: int = 8000, workers: int = 2, log_level: str = "info"):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.log_level = log_level
+        self._log: list[tuple] = []
+        self._workers: dict[int, tuple[int, Connection]] = {}
+        self._socket: socket.socket | None = None
+        self._stopping = False
+
+    def broadcast(self, name: str, payload: dict) -> None:
+        """Appends a command to the log, e.g. to deploy a preloaded model in every worker at startup."""
+        command = (f"supervisor-{len(self._log)}", name, payload)
+        self._log.append(command)
+        for _, conn in self._workers.values():
+            self._send(conn, command)
+
+    @staticmethod
+    def _send(conn: Connection, command: tuple) -> None:
+        try:
+            conn.send(command)
+        except (BrokenPipeError, OSError):
+            # The worker is gone; it is replaced and replays the log
+            pass
+
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        # Port 0 binds an ephemeral port
+        self.port = sock.getsockname()[1]
+        return sock
+
+    def _spawn(self, index: int) -> None:
+        conn, worker_conn = Pipe()
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            for _, other in self._workers.values():
+                other.close()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            control_plane.attach(worker_conn, self._log)
+            server = uvicorn.Server(uvicorn.Config(self.app, log_level=self.log_level))
+            try:
+                server.run(sockets=[self._socket])
+            finally:
+                os._exit(0)
+        worker_conn.close()
+        self._workers[index] = (pid, conn)
+        logging.info(f"Started worker {index} (pid {pid})")
+
+    def _reap(self) -> None:
+        for index, (pid, conn) in list(self._workers.items()):
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done == 0:
+                continue
+            conn.close()
+            del self._workers[index]
+            if not self._stopping:
+                logging.error(f"Worker {index} (pid {pid}) exited with status {status}; restarting it")
+                self._spawn(index)
+
+    def _stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def run(self) -> None:
+        self._socket = self._bind()
+        logging.info(f"Supervisor listening on {self.host}:{self.port} with {self.workers} workers")
+        for index in range(self.workers):
+            self._spawn(index)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        try:
+            while not self._stopping:
+                for conn in wait([conn for _, conn in self._workers.values()], timeout=0.5):
+                    try:
+                        command = conn.recv()
+                    except (EOFError, OSError):
+                        continue
+                    self._log.append(command)
+                    for _, other in self._workers.values():
+                        self._send(other, command)
+                self._reap()
+        finally:
+            self.shutdown()
+
+    def shutdown(self, timeout: float = 30.0) -> None:
+        self._stopping = True
+        for pid, _ in self._workers.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        for pid, conn in self._workers.values():
+            # uvicorn runs the shutdown hooks, which flush the history and loggers
+            while os.waitpid(pid, os.WNOHANG)[0] == 0:
+                if time.monotonic() > deadline:
+                    logging.error(f"Worker pid {pid} did not stop within {timeout}s; killing it")
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    break
+                time.sleep(0.05)
+            conn.close()
+        self._workers.clear()
+        if self._socket is not None:
+            self._socket.close()
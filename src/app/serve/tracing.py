@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar
+from typing import TYPE_CHECKING
+
+from prometheus_client import Histogram
+
+if TYPE_CHECKING:
+    from app.serve.model import RequestItem
+    from app.utils import Timer
+
+
+STAGE_SECONDS = Histogram("request_stage_seconds", "Time a traced request spent in each serving stage", ["stage"],
+                          buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                                   0.5, 1.0, 2.5))
+
+# The trace of the request being handled; set by TracingMiddleware only while tracing is enabled
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Spans of one request, as (stage, start, end) in time.perf_counter_ns().
+
+    `mark` closes a span that started where the previous mark ended, for the stages the request
+    goes through in order. Batch stages are shared by every request of the batch and are added
+    with explicit bounds. Spans may overlap: `batcher` covers everything from queueing to the
+    prediction, the batch stages included.
+    """
+    __slots__ = ("start", "last", "spans")
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter_ns()
+        self.spans: list[tuple[str, int, int]] = []
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter_ns()
+        self.spans.append((stage, self.last, now))
+        self.last = now
+
+    def add(self, stage: str, start: int, end: int) -> None:
+        self.spans.append((stage, start, end))
+
+    def durations(self) -> dict[str, float]:
+        """Seconds per stage, summed over the spans of each stage."""
+        durations: dict[str, float] = {}
+        for stage, start, end in self.spans:
+            durations[stage] = durations.get(stage, 0.0) + (end - start) / 1e9
+        return durations
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in self.durations().items())
+
+
+class Tracer:
+    """Process-wide tracing switch. While disabled, instrumented code pays one attribute check per span."""
+    def __init__(self):
+        self.enabled = False
+        self.server_timing = False
+        # Histogram children by stage; labels() costs more than the observation itself
+        self._stages: dict = {}
+
+    def set_configs(self, enabled: bool = False, server_timing: bool = False) -> None:
+        self.enabled = enabled
+        self.server_timing = server_timing
+
+    def record_batch(self, X: list[RequestItem], started: int, built: int, timer: Timer,
+                     logged: tuple[int, int]) -> None:
+        """Adds the stages of a scored batch to the traces of its requests.
+
+        `started` is when the batch was taken up for scoring and `built` when its columns were
+        built. Preprocessing runs until `timer` starts, so in process mode it also covers the
+        hand-off to the pool worker. `logged` bounds the logging and history fan-out.
+        """
+        for item in X:
+            trace = item.trace
+            if trace is None:
+                continue
+            trace.add("queue_wait", item.start_time, started)
+            trace.add("build_batch", started, built)
+            trace.add("preprocess", built, timer.start_time)
+            trace.add("inference", timer.start_time, timer.end_time)
+            trace.add("logging", *logged)
+
+    def observe(self, trace: Trace) -> None:
+        for stage, seconds in trace.durations().items():
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = STAGE_SECONDS.labels(stage)
+            histogram.observe(seconds)
+
+
+tracer = Tracer()
+
+
+class TracingMiddleware:
+    """Traces HTTP requests while the tracer is enabled, and exports the spans of instrumented routes.
+
+    Requests whose route recorded no span (every route but /predict) are left out of the
+    histograms and get no Server-Timing header.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        trace = Trace()
+        token = current_trace.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and trace.spans:
+                trace.mark("respond")
+                trace.add("total", trace.start, trace.last)
+                if tracer.server_timing:
+                    message = {**message, "headers": [*message.get("headers", ()),
+                                                      (b"server-timing", trace.server_timing().encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+        if trace.spans:
+            tracer.observe(trace)
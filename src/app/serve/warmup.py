@@ -0,0 +1,84 @@
+import itertools
+import json
+import logging
+import statistics
+import time
+
+from pydantic import ValidationError
+
+from app.api.models import PredictRequest
+from app.loggers.history.base import HistoryBase
+from app.serve.columnar import CATEGORIES
+from app.serve.executor import InferenceExecutor
+from app.serve.model import Model
+
+
+def synthetic_rows(count: int) -> list[PredictRequest]:
+    """Plausible passengers covering every known category, so every encoder branch gets exercised."""
+    combos = itertools.cycle(itertools.product(CATEGORIES["Pclass"], CATEGORIES["Sex"], CATEGORIES["Embarked"]))
+    rows = []
+    for i, (pclass, sex, embarked) in zip(range(count), combos):
+        rows.append(PredictRequest(
+            Pclass=pclass, Name=f"Passenger, {'Mr.' if sex == 'male' else 'Mrs.'} Warm {i}", Sex=sex,
+            Age=1 + (i * 7) % 80, SibSp=i % 4, Parch=i % 3, Ticket=f"WARM {1000 + i}", Fare=5.0 + (i * 13) % 250,
+            Cabin="" if i % 3 else f"C{i % 100}", Embarked=embarked))
+    return rows
+
+
+def replayed_rows(histories: list[HistoryBase], count: int) -> list[PredictRequest]:
+    """Most recent requests of the first history that has any, oldest first."""
+    for history in histories:
+        try:
+            records = history.recent_history(count)
+        except Exception as e:
+            logging.error(f"Error reading warm-up rows from {type(history).__name__}: {e}")
+            continue
+        rows = []
+        for record in records:
+            try:
+                rows.append(PredictRequest.model_validate(json.loads(record["input_data"])))
+            except (ValidationError, ValueError, TypeError):
+                continue
+        if rows:
+            return rows
+    return []
+
+
+def warmup_rows(histories: list[HistoryBase], count: int) -> list[PredictRequest]:
+    rows = replayed_rows(histories, count)
+    return rows + synthetic_rows(count - len(rows))
+
+
+class WarmupReport:
+    def __init__(self, rounds: int, latency: float, stable: bool):
+        self.rounds = rounds
+        self.latency = latency   # Median seconds per batch of the last window
+        self.stable = stable
+
+
+def warm_up(model: Model, rows: list[PredictRequest], batch_size: int = 16, window: int = 5,
+            max_rounds: int = 200, tolerance: float = 0.2, min_delta: float = 0.0005,
+            executor: InferenceExecutor | None = None) -> WarmupReport:
+    """Scores `rows` through the model until batch latency settles. Blocking; run it off the event loop.
+
+    Latency is stable once the medians of two consecutive windows of rounds differ by less than
+    `tolerance` (relative) or `min_delta` seconds. Scoring goes through `Model.score`, or through
+    `executor` (e.g. to its process pool workers) when given; neither logs nor records history,
+    so warm-up traffic never shows up in the telemetry.
+    """
+    score = model.score if executor is None else executor.warm
+    latencies = []
+    for round_ in range(max_rounds):
+        start = (round_ * batch_size) % len(rows)
+        batch = (rows[start:] + rows[:start])[:batch_size]
+        # Single rows take different code paths in numpy/sklearn than full batches
+        score(batch[:1])
+        begin = time.perf_counter()
+        score(batch)
+        latencies.append(time.perf_counter() - begin)
+        if len(latencies) >= 2 * window:
+            previous = statistics.median(latencies[-2 * window:-window])
+            current = statistics.median(latencies[-window:])
+            if abs(current - previous) <= max(tolerance * previous, min_delta):
+                return WarmupReport(round_ + 1, current, stable=True)
+    return WarmupReport(max_rounds, statistics.median(latencies[-window:]), stable=False)
@@ -0,0 +1,101 @@
+"""Trains the Titanic survival model served by the app.
+
+Fits app.features.TitanicFeatures, a ColumnTransformer and a classifier on the Kaggle dataset,
+reports the cross-validated accuracy, and saves the preprocessor and the model as joblib files
+that POST /load accepts. With --register they are also logged and registered in MLflow.
+
+    PYTHONPATH=src python src/train/train.py --model forest --output models/
+"""
+import argparse
+import os
+import zipfile
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import cross_val_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from app.api.models import PredictRequest
+from app.features import TitanicFeatures
+
+
+DATASET = os.path.join(os.path.dirname(__file__), "..", "..", "data", "dataset", "archive.zip")
+NUMERIC = ["Age", "Fare", "SibSp", "Parch", "FamilySize", "IsAlone", "FarePerPerson", "CabinCount"]
+CATEGORICAL = ["Pclass", "Sex", "Embarked", "Title", "Deck", "TicketPrefix"]
+
+MODELS = {
+    "forest": lambda: RandomForestClassifier(n_estimators=300, max_depth=7, min_samples_leaf=2, n_jobs=1,
+                                             random_state=0),
+    "boosting": lambda: GradientBoostingClassifier(n_estimators=200, max_depth=3, learning_rate=0.05,
+                                                   random_state=0),
+    "logistic": lambda: LogisticRegression(max_iter=2000, C=0.5),
+}
+
+
+def load_dataset(path: str = DATASET) -> tuple[pd.DataFrame, pd.Series]:
+    """The PredictRequest columns and the Survived target of the dataset, from its zip or a CSV."""
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            with archive.open("Titanic-Dataset.csv") as f:
+                frame = pd.read_csv(f)
+    else:
+        frame = pd.read_csv(path)
+    # Requests carry empty strings where the dataset has no cabin or port
+    frame[["Cabin", "Embarked"]] = frame[["Cabin", "Embarked"]].fillna("")
+    return frame[list(PredictRequest.model_fields)], frame["Survived"]
+
+
+def build_preprocessor() -> Pipeline:
+    # Serving feeds the same columns: the dataset's missing ages are the only missing values
+    columns = ColumnTransformer([
+        ("numeric", Pipeline([("impute", SimpleImputer(strategy="median")), ("scale", StandardScaler())]), NUMERIC),
+        ("categorical", OneHotEncoder(handle_unknown="ignore"), CATEGORICAL),
+    ])
+    return Pipeline([("features", TitanicFeatures()), ("columns", columns)])
+
+
+def train(X: pd.DataFrame, y: pd.Series, model_name: str = "forest", folds: int = 5):
+    """Returns the fitted preprocessor, the fitted model and the cross-validated accuracy of each fold."""
+    scores = cross_val_score(Pipeline([("preprocessor", build_preprocessor()), ("model", MODELS[model_name]())]),
+                             X, y, cv=folds)
+    preprocessor = build_preprocessor().fit(X, y)
+    model = MODELS[model_name]().fit(preprocessor.transform(X), y)
+    return preprocessor, model, scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=DATASET, help="the dataset zip or CSV")
+    parser.add_argument("--model", choices=list(MODELS), default="forest")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--output", default="models", help="directory for preprocessor.joblib and model.joblib")
+    parser.add_argument("--register", metavar="NAME", help="also register the model in MLflow under NAME")
+    parser.add_argument("--version", default="1")
+    args = parser.parse_args()
+
+    X, y = load_dataset(args.data)
+    preprocessor, model, scores = train(X, y, args.model, args.folds)
+    print(f"{args.model}: accuracy {np.mean(scores):.3f} +/- {np.std(scores):.3f} over {args.folds} folds")
+
+    os.makedirs(args.output, exist_ok=True)
+    joblib.dump(preprocessor, os.path.join(args.output, "preprocessor.joblib"))
+    joblib.dump(model, os.path.join(args.output, "model.joblib"))
+    print(f"Saved to {args.output}; POST /load with model_path={args.output}/model.joblib and "
+          f"preprocessor_path={args.output}/preprocessor.joblib")
+
+    if args.register:
+        from app.loggers.extensions.mlflow import init_mlflow, log_model_to_mlflow_and_register
+
+        init_mlflow()
+        version, run_id = log_model_to_mlflow_and_register(model, preprocessor, args.register, args.version)
+        print(f"Registered {args.register} version {version} (run {run_id})")
+
+
+if __name__ == "__main__":
+    main()
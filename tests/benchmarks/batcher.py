@@ -0,0 +1,93 @@
+"""Closed-loop latency/throughput benchmark of the Batcher against a dummy model.
+
+Run from the repository root:
+
+    PYTHONPATH=src python tests/benchmarks/batcher.py
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.api.models import PredictRequest
+from app.serve.adaptive import AdaptiveBatchController
+from app.serve.batcher import Batcher
+from app.serve.executor import ExecutorMode, InferenceExecutor
+from app.serve.model import Model
+
+
+class DummyModel:
+    def predict(self, data):
+        return [0.0] * len(data)
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+class DummyHistory:
+    def insert_history(self, **kwargs):
+        pass
+
+
+REQUEST = PredictRequest(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=22, SibSp=1,
+                         Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S")
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(concurrency: int, requests_per_client: int, batch_size: int, batch_timeout: float,
+              executor_mode: ExecutorMode = ExecutorMode.inline, max_in_flight: int = 1,
+              latency_slo: float | None = None) -> dict:
+    model = Model(DummyModel(), DummyProcessor(), "1", "dummy", histories=[DummyHistory()])
+    executor = InferenceExecutor(model, mode=executor_mode, max_in_flight=max_in_flight)
+    controller = AdaptiveBatchController(latency_slo=latency_slo) if latency_slo else None
+    batcher = Batcher(model, batch_size=batch_size, batch_timeout=batch_timeout, executor=executor,
+                      controller=controller)
+    latencies: list[float] = []
+
+    async def client():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            await batcher.queue_request(REQUEST)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    batcher.close()
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 256])
+    parser.add_argument("--requests", type=int, default=2048, help="total requests per concurrency level")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--batch-timeout", type=float, default=0.05)
+    parser.add_argument("--executor", type=ExecutorMode, default=ExecutorMode.inline)
+    parser.add_argument("--in-flight", type=int, default=1, help="max batches scored concurrently")
+    parser.add_argument("--adaptive-slo", type=float, default=None,
+                        help="enable adaptive batching with this latency SLO in seconds")
+    args = parser.parse_args()
+
+    print(f"{'clients':>8} {'requests':>9} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for concurrency in args.concurrency:
+        per_client = max(1, args.requests // concurrency)
+        result = asyncio.run(run(concurrency, per_client, args.batch_size, args.batch_timeout,
+                                 args.executor, args.in_flight, args.adaptive_slo))
+        print(f"{result['concurrency']:>8} {result['requests']:>9} {result['rps']:>10.1f} "
+              f"{result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Scoring time of sklearn pipelines against their compiled NumPy versions, at batch sizes 1, 16 and 1024.
+
+Fits a ColumnTransformer (imputers, scaler, one-hot encoders) with a logistic regression, a
+random forest and gradient boosting on the Titanic dataset, compiles each pair with
+app.serve.compiler, and times `score` (preprocessing and prediction of a columnar batch, what
+the executor runs per batch) for both. Predictions are checked to be identical first.
+
+    PYTHONPATH=src python tests/benchmarks/compiler.py --repeats 200
+"""
+import argparse
+import os
+import statistics
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from app.api.models import PredictRequest
+from app.serve.columnar import build_batch
+from app.serve.compiler import compile_pipeline
+from app.serve.model import score
+
+
+DATASET = os.path.join(os.path.dirname(__file__), "..", "..", "data", "dataset", "archive.zip")
+NUMERIC = ["Age", "SibSp", "Parch", "Fare"]
+CATEGORICAL = ["Pclass", "Sex", "Embarked"]
+
+
+def load_rows() -> tuple[list[PredictRequest], pd.Series]:
+    with zipfile.ZipFile(DATASET) as archive:
+        with archive.open("Titanic-Dataset.csv") as f:
+            frame = pd.read_csv(f)
+    frame["Age"] = frame["Age"].fillna(frame["Age"].median()).astype(int)
+    frame[["Cabin", "Embarked"]] = frame[["Cabin", "Embarked"]].fillna("")
+    rows = [PredictRequest(**row) for row in frame[list(PredictRequest.model_fields)].to_dict("records")]
+    return rows, frame["Survived"]
+
+
+def preprocessor() -> ColumnTransformer:
+    return ColumnTransformer([
+        ("num", Pipeline([("impute", SimpleImputer(strategy="median")), ("scale", StandardScaler())]), NUMERIC),
+        ("cat", Pipeline([("impute", SimpleImputer(strategy="most_frequent")),
+                          ("encode", OneHotEncoder(handle_unknown="ignore"))]), CATEGORICAL),
+    ])
+
+
+def timed(function, repeats: int) -> float:
+    """Median seconds per call."""
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--trees", type=int, default=100)
+    args = parser.parse_args()
+
+    rows, target = load_rows()
+    frame = build_batch(rows).to_frame()
+    models = {
+        "logistic regression": LogisticRegression(max_iter=1000),
+        "random forest": RandomForestClassifier(n_estimators=args.trees, max_depth=8, n_jobs=1, random_state=0),
+        "gradient boosting": GradientBoostingClassifier(n_estimators=args.trees, random_state=0),
+    }
+    print(f"{'model':<20} {'batch':>6} {'sklearn us':>11} {'compiled us':>12} {'speedup':>8}")
+    for name, model in models.items():
+        pipeline = preprocessor().fit(frame, target)
+        model.fit(pipeline.transform(frame), target)
+        compiled_pipeline, compiled_model = compile_pipeline(pipeline, model, rows[:256])
+        for size in (1, 16, 1024):
+            batch = build_batch((rows * 2)[:size])
+            expected, _ = score(pipeline, model, batch)
+            actual, _ = score(compiled_pipeline, compiled_model, batch)
+            assert np.array_equal(expected, actual)
+            original = timed(lambda: score(pipeline, model, batch), args.repeats)
+            compiled = timed(lambda: score(compiled_pipeline, compiled_model, batch), args.repeats)
+            print(f"{name:<20} {size:>6} {original * 1e6:>11.0f} {compiled * 1e6:>12.0f} {original / compiled:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
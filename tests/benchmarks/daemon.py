@@ -0,0 +1,160 @@
+"""Per-worker batching vs centralized batching in an inference daemon.
+
+Runs N front-end processes, each with C closed-loop clients calling `runner.run_inference`, in two
+setups: every front-end batches its own requests with its own copy of the model, or all of them
+forward their requests over Unix sockets to one daemon process that batches them together.
+Reports requests/second, the mean batch size the model saw, and p50/p99 latency. HTTP is left
+out so only the batching path is compared.
+
+    PYTHONPATH=src python tests/benchmarks/daemon.py --front-ends 4 --concurrency 8
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from app.api.models import PredictRequest
+from app.serve.control import ControlPlane
+from app.serve.daemon import InferenceDaemon
+from app.serve.inference import InferenceRunner
+from app.serve.model import Model
+
+
+NUMERIC = ["Pclass", "Age", "SibSp", "Parch", "Fare"]
+ROW = PredictRequest(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=22, SibSp=1,
+                     Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S")
+
+
+class NumericProcessor:
+    def transform(self, data):
+        return data[NUMERIC].to_numpy(dtype=np.float64)
+
+
+class CountingModel:
+    """Counts rows and batches in shared memory, whichever process scores them."""
+    def __init__(self, estimator, rows, batches):
+        self.estimator = estimator
+        self.rows = rows
+        self.batches = batches
+
+    def predict(self, X):
+        with self.rows.get_lock():
+            self.rows.value += len(X)
+            self.batches.value += 1
+        return self.estimator.predict_proba(X)[:, 1]
+
+
+class NoHistory:
+    def insert_history(self, **kwargs):
+        pass
+
+
+def make_model() -> RandomForestClassifier:
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, len(NUMERIC)))
+    return RandomForestClassifier(n_estimators=50, max_depth=8, n_jobs=1, random_state=0).fit(X, X[:, 1] > 0)
+
+
+def make_runner(estimator, rows, batches, batch_size: int, batch_timeout: float) -> InferenceRunner:
+    runner = InferenceRunner()
+    runner.set_configs(batch_size=batch_size, batch_timeout=batch_timeout, warmup=False)
+    model = Model(CountingModel(estimator, rows, batches), NumericProcessor(), "1", "forest", "deploy",
+                  loggers=[], histories=[NoHistory()])
+    runner.new_batcher(model)
+    return runner
+
+
+def run_daemon(socket_path: str, estimator, rows, batches, batch_size: int, batch_timeout: float):
+    async def serve():
+        # Batchers start their loop on creation, so they are built inside the event loop
+        runner = make_runner(estimator, rows, batches, batch_size, batch_timeout)
+        await InferenceDaemon(socket_path, runner, ControlPlane()).serve_forever()
+
+    asyncio.run(serve())
+
+
+def front_end(runner_factory, concurrency: int, duration: float, start, results):
+    async def client(runner: InferenceRunner, deadline: float) -> list[float]:
+        latencies = []
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            await runner.run_inference(ROW)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    async def main():
+        runner = runner_factory()
+        start.wait()
+        deadline = time.monotonic() + duration
+        latencies = await asyncio.gather(*(client(runner, deadline) for _ in range(concurrency)))
+        return [latency for chunk in latencies for latency in chunk]
+
+    results.put(asyncio.run(main()))
+
+
+def measure(centralized: bool, args, estimator) -> tuple[float, float, np.ndarray]:
+    ctx = multiprocessing.get_context("fork")
+    rows, batches = ctx.Value("q", 0), ctx.Value("q", 0)
+    start, results = ctx.Event(), ctx.Queue()
+    daemon = None
+    with tempfile.TemporaryDirectory() as directory:
+        if centralized:
+            socket_path = os.path.join(directory, "inference.sock")
+            daemon = ctx.Process(target=run_daemon, args=(socket_path, estimator, rows, batches,
+                                                          args.batch_size, args.batch_timeout))
+            daemon.start()
+            while not os.path.exists(socket_path):
+                if not daemon.is_alive():
+                    raise RuntimeError("The inference daemon exited before listening.")
+                time.sleep(0.05)
+
+            def runner_factory():
+                runner = InferenceRunner()
+                runner.set_configs(inference_daemon=[socket_path])
+                return runner
+        else:
+            def runner_factory():
+                return make_runner(estimator, rows, batches, args.batch_size, args.batch_timeout)
+
+        procs = [ctx.Process(target=front_end, args=(runner_factory, args.concurrency, args.duration, start, results))
+                 for _ in range(args.front_ends)]
+        for proc in procs:
+            proc.start()
+        time.sleep(0.5)
+        # Only count the measured window
+        rows.value = batches.value = 0
+        start.set()
+        latencies = np.concatenate([results.get() for _ in procs])
+        for proc in procs:
+            proc.join()
+        if daemon is not None:
+            daemon.terminate()
+            daemon.join(10)
+    return len(latencies) / args.duration, rows.value / max(batches.value, 1), latencies * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--front-ends", type=int, default=4, help="front-end (HTTP worker) processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="in-flight requests per front-end")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--batch-timeout", type=float, default=0.01)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    estimator = make_model()
+    print(f"{'batching':>12} {'req/s':>9} {'rows/batch':>11} {'p50 ms':>8} {'p99 ms':>8}")
+    for centralized in (False, True):
+        throughput, batch_size, latencies = measure(centralized, args, estimator)
+        p50, p99 = np.percentile(latencies, [50, 99])
+        name = "daemon" if centralized else "per-worker"
+        print(f"{name:>12} {throughput:>9.0f} {batch_size:>11.1f} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
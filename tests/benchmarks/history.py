@@ -0,0 +1,82 @@
+"""Query latency of paginated /history lookups on a large SQLite history table.
+
+Populates a temporary database (10M rows by default) and times one page of each
+query shape the /history endpoint issues.
+
+    PYTHONPATH=src python tests/benchmarks/history.py --rows 10000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from app.loggers.history.base import HistoryFilter
+from app.loggers.history.lite import _SQL_INSERT_HISTORY, HistorySQLite
+
+
+INPUT = json.dumps({"Pclass": 3, "Name": "Braund, Mr. Owen Harris", "Sex": "male", "Age": 22, "SibSp": 1,
+                    "Parch": 0, "Ticket": "A/5 21171", "Fare": 7.25, "Cabin": "", "Embarked": "S"})
+
+
+def populate(history: HistorySQLite, rows: int, start_time: float, chunk: int = 100_000) -> None:
+    rng = random.Random(0)
+    conn = history.conn
+    # Bulk load first and index afterwards, which is much faster than maintaining the indexes row by row
+    conn.execute("CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, model_name TEXT NOT NULL, "
+                 "variant TEXT NOT NULL, model_version TEXT NOT NULL, input_data TEXT NOT NULL, "
+                 "prediction FLOAT NOT NULL, created_at REAL NOT NULL DEFAULT 0);")
+    for offset in range(0, rows, chunk):
+        batch = [(f"model_{rng.randrange(4)}", rng.choice("AB"), str(rng.randrange(10)), INPUT, rng.random(),
+                  start_time + i) for i in range(offset, min(rows, offset + chunk))]
+        with conn:
+            conn.executemany(_SQL_INSERT_HISTORY, batch)
+    history.create_table()
+    conn.execute("ANALYZE;")
+
+
+def time_query(history: HistorySQLite, filters: HistoryFilter, after_id: int | None, limit: int,
+               repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = list(history.iter_history(filters, after_id, limit + 1))
+        timings.append(time.perf_counter() - start)
+    assert records, f"query returned nothing: {filters}"
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        history = HistorySQLite(os.path.join(directory, "history.db"))
+        start_time = 1_700_000_000.0
+        start = time.perf_counter()
+        populate(history, args.rows, start_time)
+        print(f"populated {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+        deep = args.rows - 10 * args.limit
+        cases = {
+            "first page": (HistoryFilter(), None),
+            "deep page (keyset)": (HistoryFilter(), deep),
+            "model + version": (HistoryFilter(model_name="model_1", model_version="7"), None),
+            "model + version, deep": (HistoryFilter(model_name="model_1", model_version="7"), deep // 2),
+            "variant": (HistoryFilter(variant="B"), deep // 2),
+            "time range": (HistoryFilter(start_time=start_time + deep // 2, end_time=start_time + deep), None),
+            "model + time range": (HistoryFilter(model_name="model_2", start_time=start_time + deep // 2), None),
+        }
+        print(f"{'query':<24} {'p50 ms':>8}")
+        for name, (filters, after_id) in cases.items():
+            print(f"{name:<24} {time_query(history, filters, after_id, args.limit, args.repeat):>8.2f}")
+        history.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""Load test: replays recorded PredictRequest traffic against the app and writes a JSON report.
+
+Traffic comes from a JSONL file of PredictRequest records (each may carry a `user_id`), or by
+default from the Titanic dataset in data/dataset/archive.zip. The app is served in-process
+through httpx's ASGI transport, or by a forked uvicorn server over a local socket. Clients run
+closed-loop (`--concurrency` requests in flight) or open-loop at `--rate` requests/second; in
+open-loop mode latency counts from each request's scheduled start, so a server that falls
+behind cannot hide its queueing. Two random forests trained on the dataset are deployed, or
+A/B tested with `--ab-mode`. The report has throughput, status codes, p50/p95/p99/p999
+latency, and the server-side split of latency into batcher queue wait and inference time, as
+recorded by the loggers. Compare the `--output` files of two commits to spot regressions.
+
+    PYTHONPATH=src python tests/benchmarks/loadtest.py --transport asgi --concurrency 32 --output load.json
+    PYTHONPATH=src python tests/benchmarks/loadtest.py --transport socket --rate 300 --ab-mode hash
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import httpx
+import numpy as np
+import pandas as pd
+import uvicorn
+from sklearn.ensemble import RandomForestClassifier
+
+from app.api.models import PredictRequest
+from app.loggers.extensions.base import LoggingExtension
+from app.loggers.history.lite import HistorySQLite
+from app.loggers.telemetry import TelemetryBus
+from app.main import app, configure
+from app.serve.inference import runner
+from app.serve.model_server import ModelServiceProviderConfigs, model_hub
+
+
+DATASET = os.path.join(os.path.dirname(__file__), "..", "..", "data", "dataset", "archive.zip")
+FEATURES = ["Pclass", "Female", "Age", "SibSp", "Parch", "Fare"]
+PERCENTILES = {"p50": 50, "p95": 95, "p99": 99, "p999": 99.9}
+
+
+class TitanicProcessor:
+    def transform(self, data: pd.DataFrame) -> np.ndarray:
+        return np.column_stack([data["Pclass"], data["Sex"] == "female", data["Age"],
+                                data["SibSp"], data["Parch"], data["Fare"]]).astype(np.float64)
+
+
+class BreakdownRecorder(LoggingExtension):
+    """Keeps the per-row timings the loggers receive, in milliseconds."""
+    def __init__(self):
+        self.latency: list[float] = []
+        self.wait_time: list[float] = []
+        self.inference_time: list[float] = []
+
+    def new_experiment(self, experiment_name):
+        pass
+
+    def log(self, latency, wait_time, inference_time, **kwargs):
+        self.latency.append(latency)
+        self.wait_time.append(wait_time)
+        self.inference_time.append(inference_time)
+
+    def summary(self) -> dict:
+        return {
+            "rows": len(self.latency),
+            "server_latency_ms": percentiles(self.latency),
+            "queue_wait_ms": percentiles(self.wait_time),
+            "inference_ms": percentiles(self.inference_time),
+        }
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    array = np.asarray(values)
+    stats = {name: float(np.percentile(array, q)) for name, q in PERCENTILES.items()}
+    stats.update(mean=float(array.mean()), max=float(array.max()))
+    return stats
+
+
+def load_dataset() -> pd.DataFrame:
+    with zipfile.ZipFile(DATASET) as archive:
+        with archive.open("Titanic-Dataset.csv") as f:
+            frame = pd.read_csv(f)
+    frame["Age"] = frame["Age"].fillna(frame["Age"].median()).astype(int)
+    frame["Fare"] = frame["Fare"].fillna(0.0)
+    frame[["Cabin", "Embarked"]] = frame[["Cabin", "Embarked"]].fillna("")
+    return frame
+
+
+def load_traffic(path: str | None, dataset: pd.DataFrame) -> list[tuple[dict, str | None]]:
+    """(PredictRequest fields, user id) pairs in replay order."""
+    if path is None:
+        fields = list(PredictRequest.model_fields)
+        return [(row, f"passenger-{passenger}")
+                for row, passenger in zip(dataset[fields].to_dict("records"), dataset["PassengerId"])]
+    traffic = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                user_id = record.pop("user_id", None)
+                traffic.append((PredictRequest.model_validate(record).model_dump(), user_id))
+    return traffic
+
+
+def train_models(dataset: pd.DataFrame) -> list[RandomForestClassifier]:
+    X = TitanicProcessor().transform(dataset)
+    y = dataset["Survived"].to_numpy()
+    return [RandomForestClassifier(n_estimators=trees, max_depth=6, n_jobs=1, random_state=0).fit(X, y)
+            for trees in (50, 100)]
+
+
+def configure_server(args, models: list[RandomForestClassifier], directory: str) -> BreakdownRecorder:
+    """Sets the app up like production (history in SQLite, telemetry bus) but with a recording logger."""
+    recorder = BreakdownRecorder()
+    history = HistorySQLite(os.path.join(directory, "history.db"))
+    history.create_table()
+    telemetry = None if args.no_telemetry_bus else TelemetryBus([recorder], [history])
+    model_hub.set_configs(ModelServiceProviderConfigs(extensions=[recorder], histories=[history],
+                                                      telemetry=telemetry, register_in_mlflow=False))
+    runner.set_configs(batch_size=args.batch_size, batch_timeout=args.batch_timeout,
+                       max_queue_size=args.max_queue_size, warmup_rows=16)
+    for version, model in enumerate(models, start=1):
+        model_hub.register_model(model, TitanicProcessor(), str(version), "loadtest", log_to_mlflow=False)
+    return recorder
+
+
+async def deploy(client: httpx.AsyncClient, ab_mode: str | None) -> None:
+    response = await client.post("/deploy", json={"model_name": "loadtest", "model_version": "1"})
+    response.raise_for_status()
+    if ab_mode:
+        response = await client.post("/ab-test", json={"name_a": "loadtest", "version_a": "1", "name_b": "loadtest",
+                                                      "version_b": "2", "mode": ab_mode})
+        response.raise_for_status()
+
+
+async def generate_load(client: httpx.AsyncClient, traffic: list, args) -> dict:
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    variants: dict[str, int] = {}
+
+    async def send(index: int, scheduled: float) -> None:
+        row, user_id = traffic[index % len(traffic)]
+        params = {"user_id": user_id} if user_id else None
+        try:
+            response = await client.post("/predict", json=row, params=params)
+            status = str(response.status_code)
+            if response.status_code == 200:
+                variant = response.json().get("variant") or "deploy"
+                variants[variant] = variants.get(variant, 0) + 1
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        latencies.append((time.perf_counter() - scheduled) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    if args.rate:
+        # Open loop: arrivals follow the schedule whatever the server does
+        rng = random.Random(0)
+        tasks = []
+        scheduled = started
+        for index in range(args.requests):
+            scheduled += rng.expovariate(args.rate) if args.poisson else 1.0 / args.rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(index, scheduled)))
+        await asyncio.gather(*tasks)
+    else:
+        counter = iter(range(args.requests))
+
+        async def worker():
+            for index in counter:
+                await send(index, time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "duration_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed,
+        "statuses": statuses,
+        "variants": variants,
+        "latency_ms": percentiles(latencies),
+    }
+
+
+async def run_asgi(args, traffic: list, models: list) -> tuple[dict, dict]:
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = configure_server(args, models, directory)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            await deploy(client, args.ab_mode)
+            # Only the measured traffic goes into the breakdown
+            if model_hub.configs.telemetry is not None:
+                model_hub.configs.telemetry.flush()
+            recorder.__init__()
+            result = await generate_load(client, traffic, args)
+        if model_hub.configs.telemetry is not None:
+            model_hub.configs.telemetry.close()
+        return result, recorder.summary()
+
+
+def serve(args, models: list, port: int, directory: str, summary_path: str) -> None:
+    recorder = configure_server(args, models, directory)
+    # The app's own startup hook would replace this setup with the one from the environment
+    app.router.on_startup[:] = [hook for hook in app.router.on_startup if hook is not configure]
+
+    def write_summary():
+        # Runs after the app's shutdown hook drained the telemetry bus; uvicorn then re-raises SIGTERM
+        with open(summary_path, "w") as f:
+            json.dump(recorder.summary(), f)
+
+    app.router.on_shutdown.append(write_summary)
+    uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")).run()
+
+
+async def run_socket(args, traffic: list, models: list) -> tuple[dict, dict]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as directory:
+        summary_path = os.path.join(directory, "summary.json")
+        server = multiprocessing.get_context("fork").Process(
+            target=serve, args=(args, models, port, directory, summary_path))
+        server.start()
+        limits = httpx.Limits(max_connections=args.concurrency if not args.rate else 1000)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline or not server.is_alive():
+                        raise RuntimeError("The server did not start.")
+                    await asyncio.sleep(0.1)
+            await deploy(client, args.ab_mode)
+            result = await generate_load(client, traffic, args)
+        os.kill(server.pid, signal.SIGTERM)
+        server.join(60)
+        with open(summary_path) as f:
+            return result, json.load(f)
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traffic", help="JSONL of PredictRequest records (default: the Titanic dataset)")
+    parser.add_argument("--transport", choices=["asgi", "socket"], default="asgi")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32, help="closed loop: requests in flight")
+    parser.add_argument("--rate", type=float, help="open loop: requests/second")
+    parser.add_argument("--poisson", action="store_true", help="open loop: exponential inter-arrival times")
+    parser.add_argument("--ab-mode", choices=["split", "hash", "shadow", "bandit"])
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--batch-timeout", type=float, default=0.01)
+    parser.add_argument("--max-queue-size", type=int, default=1024)
+    parser.add_argument("--no-telemetry-bus", action="store_true", help="log inline instead of through the bus")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    dataset = load_dataset()
+    traffic = load_traffic(args.traffic, dataset)
+    models = train_models(dataset)
+    run = run_asgi if args.transport == "asgi" else run_socket
+    result, server = asyncio.run(run(args, traffic, models))
+
+    report = {"commit": commit(), "config": vars(args), **result, "server": server}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    latency, wait, inference = result["latency_ms"], server.get("queue_wait_ms", {}), server.get("inference_ms", {})
+    print(f"{result['requests']} requests in {result['duration_s']:.1f}s: {result['throughput_rps']:.0f} req/s, "
+          f"statuses {result['statuses']}, variants {result['variants']}", file=sys.stderr)
+    print(f"{'ms':<16} {'p50':>8} {'p95':>8} {'p99':>8} {'p999':>8}", file=sys.stderr)
+    for name, stats in (("client latency", latency), ("queue wait", wait), ("inference", inference)):
+        if stats:
+            print(f"{name:<16} " + " ".join(f"{stats[p]:>8.2f}" for p in PERCENTILES), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Per-request cost of A/B routing, in nanoseconds.
+
+Compares the previous router (a new ABTestWrapper per request, and `route_variant` on the salted
+built-in `hash`) with TrafficRouter on its precomputed bucket table, sticky and random, with and
+without a ramp schedule.
+
+    PYTHONPATH=src python tests/benchmarks/routing.py --requests 1000000
+"""
+import argparse
+import random
+import time
+
+from app.serve.ab_test.routing import RampSchedule, TrafficRouter, stable_hash
+
+
+class PerRequestWrapper:
+    """What every request used to build before it could route."""
+    def __init__(self, batcher_A, batcher_B, ab_test_mode):
+        self._batcher_A = batcher_A
+        self._batcher_B = batcher_B
+        self._ab_test_mode = ab_test_mode
+
+
+def previous_route(user_id: str | None) -> int:
+    PerRequestWrapper(None, None, "hash")
+    if user_id:
+        return 0 if hash(user_id) % 2 == 0 else 1
+    return 0 if random.random() < 0.5 else 1
+
+
+def measure(route, users: list[str | None]) -> float:
+    started = time.perf_counter_ns()
+    for user in users:
+        route(user)
+    return (time.perf_counter_ns() - started) / len(users)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+
+    users = [f"user-{random.randrange(args.users)}" for _ in range(args.requests)]
+    anonymous = [None] * args.requests
+    ramp = RampSchedule([(0, [95, 5]), (3600, [50, 50])])
+    cases = [
+        ("previous (hash, per-request wrapper)", previous_route, users),
+        ("stable_hash only", stable_hash, users),
+        ("sticky 50/50", TrafficRouter([1, 1], salt="bench").route, users),
+        ("sticky 70/20/10", TrafficRouter([70, 20, 10], salt="bench").route, users),
+        ("sticky with ramp schedule", TrafficRouter([1, 1], salt="bench", schedule=ramp).route, users),
+        ("random split", TrafficRouter([1, 1], sticky=False).route, anonymous),
+    ]
+    print(f"{'router':<38} {'ns/request':>10}")
+    for name, route, keys in cases:
+        print(f"{name:<38} {measure(route, keys):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
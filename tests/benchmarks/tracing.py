@@ -0,0 +1,126 @@
+"""Cost of span tracing, in nanoseconds per span and per /predict request.
+
+Measures the instrumentation as it appears in the code: the `current_trace` lookup and None
+check that a disabled tracer costs, `Trace.mark` and `Trace.add` on an enabled one, and the
+export of a finished trace (Server-Timing header and histograms). Then times /predict
+in-process with tracing off, on, and on with Server-Timing headers.
+
+    PYTHONPATH=src python tests/benchmarks/tracing.py --spans 1000000 --requests 2000
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.main import app
+from app.serve.inference import runner
+from app.serve.model import Model
+from app.serve.tracing import Trace, current_trace, tracer
+
+
+ROW = {"Pclass": 3, "Name": "Braund, Mr. Owen Harris", "Sex": "male", "Age": 22, "SibSp": 1,
+       "Parch": 0, "Ticket": "A/5 21171", "Fare": 7.25, "Cabin": "", "Embarked": "S"}
+
+
+class DummyModel:
+    def predict(self, data):
+        return [0.5] * len(data)
+
+class DummyHistory:
+    def insert_history(self, **kwargs):
+        pass
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+
+def per_span(spans: int) -> list[tuple[str, float]]:
+    def disabled():
+        for _ in range(spans):
+            trace = current_trace.get()
+            if trace is not None:
+                trace.mark("stage")
+
+    def mark():
+        trace = Trace()
+        for _ in range(spans):
+            trace.mark("stage")
+
+    def add():
+        trace = Trace()
+        for _ in range(spans):
+            trace.add("stage", 0, 1)
+
+    def export():
+        # One trace holds about ten spans; report the cost per span
+        for _ in range(spans // 10):
+            trace = Trace()
+            for stage in range(10):
+                trace.add(str(stage), 0, 1000)
+            trace.server_timing()
+            tracer.observe(trace)
+
+    def loop():
+        for _ in range(spans):
+            pass
+
+    baseline = measure(loop, spans)
+    token = current_trace.set(None)
+    try:
+        return [(name, measure(case, spans) - baseline)
+                for name, case in (("disabled check", disabled), ("mark", mark), ("add", add),
+                                   ("export", export))]
+    finally:
+        current_trace.reset(token)
+
+
+def measure(case, spans: int) -> float:
+    started = time.perf_counter_ns()
+    case()
+    return (time.perf_counter_ns() - started) / spans
+
+
+async def per_request(requests: int, concurrency: int) -> float:
+    model = Model(DummyModel(), DummyProcessor(), "1", "tracing", histories=[DummyHistory()])
+    runner.set_configs(batch_size=concurrency, batch_timeout=0.001)
+    runner.new_batcher(model)
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def worker(count):
+                for _ in range(count):
+                    await client.post("/predict", json=ROW)
+
+            await worker(concurrency)
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+            return (time.perf_counter() - started) / requests * 1e6
+    finally:
+        for batcher in runner._running_models.values():
+            batcher.close()
+        runner._running_models.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spans", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"{'span':<16} {'ns/span':>8}")
+    for name, cost in per_span(args.spans):
+        print(f"{name:<16} {cost:>8.0f}")
+
+    print(f"\n{'/predict':<16} {'us/request':>10}")
+    for name, enabled, server_timing in (("tracing off", False, False), ("tracing on", True, False),
+                                         ("server timing", True, True)):
+        tracer.set_configs(enabled=enabled, server_timing=server_timing)
+        print(f"{name:<16} {asyncio.run(per_request(args.requests, args.concurrency)):>10.1f}")
+    tracer.set_configs()
+
+
+if __name__ == "__main__":
+    main()
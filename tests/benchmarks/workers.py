@@ -0,0 +1,120 @@
+"""HTTP throughput of the supervised multi-worker server from 1 to N workers.
+
+Starts the app under the Supervisor with a CPU-bound scikit-learn model preloaded before the
+fork, drives it with several client processes over real sockets, and reports requests/second
+and the speedup over one worker. The client processes share the machine with the workers, so
+leave them enough cores.
+
+    PYTHONPATH=src python tests/benchmarks/workers.py --max-workers 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+
+import httpx
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from app.main import app
+from app.serve.model_server import model_hub
+from app.serve.supervisor import Supervisor
+
+
+NUMERIC = ["Pclass", "Age", "SibSp", "Parch", "Fare"]
+ROW = {"Pclass": 3, "Name": "Braund, Mr. Owen Harris", "Sex": "male", "Age": 22, "SibSp": 1,
+       "Parch": 0, "Ticket": "A/5 21171", "Fare": 7.25, "Cabin": "", "Embarked": "S"}
+
+
+class NumericProcessor:
+    def transform(self, data):
+        return data[NUMERIC].to_numpy(dtype=np.float64)
+
+
+def make_model() -> RandomForestClassifier:
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, len(NUMERIC)))
+    return RandomForestClassifier(n_estimators=50, max_depth=8, n_jobs=1, random_state=0).fit(X, X[:, 1] > 0)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(port: int, workers: int):
+    os.environ.update(USE_MLFLOW="false")
+    model_hub._loaded_models["forest(1)"] = (NumericProcessor(), make_model())
+    supervisor = Supervisor(app, host="127.0.0.1", port=port, workers=workers, log_level="warning")
+    supervisor.broadcast("deploy", {"model_name": "forest", "model_version": "1"})
+    supervisor.run()
+
+
+def client(base_url: str, concurrency: int, duration: float, counts):
+    async def worker(http: httpx.AsyncClient, deadline: float) -> int:
+        done = 0
+        while time.monotonic() < deadline:
+            response = await http.post("/predict", json=ROW)
+            response.raise_for_status()
+            done += 1
+        return done
+
+    async def main():
+        # One connection per in-flight request; the kernel spreads new connections over the workers
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+            deadline = time.monotonic() + duration
+            return sum(await asyncio.gather(*(worker(http, deadline) for _ in range(concurrency))))
+
+    counts.put(asyncio.run(main()))
+
+
+def measure(workers: int, clients: int, concurrency: int, duration: float) -> float:
+    ctx = multiprocessing.get_context("fork")
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = ctx.Process(target=serve, args=(port, workers))
+    server.start()
+    try:
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if httpx.post(f"{base_url}/predict", json=ROW).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            time.sleep(0.1)
+        counts = ctx.Queue()
+        procs = [ctx.Process(target=client, args=(base_url, concurrency, duration, counts)) for _ in range(clients)]
+        for proc in procs:
+            proc.start()
+        total = sum(counts.get() for _ in procs)
+        for proc in procs:
+            proc.join()
+    finally:
+        server.terminate()
+        server.join(30)
+    return total / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="in-flight requests per client process")
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'req/s':>9} {'speedup':>8}")
+    baseline = None
+    for workers in range(1, args.max_workers + 1):
+        throughput = measure(workers, args.clients, args.concurrency, args.duration)
+        baseline = baseline or throughput
+        print(f"{workers:>7} {throughput:>9.0f} {throughput / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.api.models import PredictRequest
+from app.serve.adaptive import BATCH_SIZE_GAUGE, AdaptiveBatchController
+from app.serve.batcher import Batcher
+from app.serve.model import Model
+
+
+class DummyModel:
+    def predict(self, data):
+        return [0.2] * len(data)
+
+class DummyHistory:
+    def insert_history(self, **kwargs):
+        pass
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+
+def make_request() -> PredictRequest:
+    return PredictRequest(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=22, SibSp=1,
+                          Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S")
+
+
+def feed_arrivals(controller: AdaptiveBatchController, rate: float, count: int = 200):
+    for i in range(count):
+        controller.observe_arrival(i / rate)
+
+
+def test_no_traffic_does_not_wait():
+    controller = AdaptiveBatchController(latency_slo=0.1)
+    assert controller.update() == (1, 0.0)
+
+def test_low_traffic_does_not_wait():
+    controller = AdaptiveBatchController(latency_slo=0.1)
+    # One request per second: nothing else will arrive within the SLO
+    feed_arrivals(controller, rate=1)
+    controller.observe_batch(1, 0.002)
+    batch_size, batch_timeout = controller.update()
+    assert batch_size == 1
+    assert batch_timeout == 0.0
+
+def test_idle_scorer_does_not_wait():
+    controller = AdaptiveBatchController(latency_slo=0.1)
+    # 100 req/s against a 1ms scorer keeps utilization at 10% without any batching
+    feed_arrivals(controller, rate=100)
+    controller.observe_batch(1, 0.001)
+    assert controller.update() == (1, 0.0)
+
+def test_high_traffic_grows_batch_within_slo():
+    controller = AdaptiveBatchController(latency_slo=0.1, max_batch_size=1024)
+    feed_arrivals(controller, rate=2000)
+    for size in (1, 8, 32, 64):
+        controller.observe_batch(size, 0.005 + 0.0001 * size)
+    batch_size, batch_timeout = controller.update()
+    assert batch_size > 16
+    assert batch_timeout + controller.estimate_inference_time(batch_size) <= 0.1 + 1e-9
+
+def test_batch_size_is_capped():
+    controller = AdaptiveBatchController(latency_slo=1.0, max_batch_size=64)
+    feed_arrivals(controller, rate=100_000)
+    controller.observe_batch(16, 0.01)
+    batch_size, _ = controller.update()
+    assert batch_size == 64
+
+def test_inference_cost_fit():
+    controller = AdaptiveBatchController()
+    for size in (1, 4, 16, 64, 1, 4, 16, 64):
+        controller.observe_batch(size, 0.01 + 0.001 * size)
+    fixed, per_item = controller.inference_cost()
+    assert fixed == pytest.approx(0.01)
+    assert per_item == pytest.approx(0.001)
+
+def test_decisions_are_exported():
+    labels = {"model_name": "dummy", "model_version": "1", "variant": "deploy"}
+    controller = AdaptiveBatchController(latency_slo=1.0, max_batch_size=64, labels=labels)
+    feed_arrivals(controller, rate=100_000)
+    controller.observe_batch(16, 0.01)
+    controller.update()
+    assert BATCH_SIZE_GAUGE.labels(**labels)._value.get() == 64
+
+def test_adaptive_batcher_serves_requests():
+    async def scenario():
+        model = Model(DummyModel(), DummyProcessor(), '1', 'dummy', histories=[DummyHistory()])
+        controller = AdaptiveBatchController(latency_slo=0.05)
+        batcher = Batcher(model, controller=controller)
+        results = await asyncio.gather(*(batcher.queue_request(make_request()) for _ in range(20)))
+        batcher.close()
+        assert results == [0.2] * 20
+        assert controller._s0 > 0
+
+    asyncio.run(scenario())
+
+def test_retired_controllers_drop_their_series():
+    labels = {"model_name": "adaptive-retired", "model_version": "1", "variant": "deploy"}
+
+    def batch_size() -> float | None:
+        return REGISTRY.get_sample_value("batcher_adaptive_batch_size", labels)
+
+    async def scenario():
+        model = Model(DummyModel(), DummyProcessor(), '1', 'adaptive-retired', histories=[DummyHistory()])
+        old = Batcher(model, controller=AdaptiveBatchController(latency_slo=0.05, labels=labels))
+        await old.queue_request(make_request())
+        # The redeployed batcher owns the series; retiring the old one leaves them in place
+        new = Batcher(model, controller=AdaptiveBatchController(latency_slo=0.05, labels=labels))
+        await new.queue_request(make_request())
+        await old.drain()
+        kept = batch_size()
+        await new.drain()
+        return kept, batch_size()
+
+    kept, after = asyncio.run(scenario())
+    assert kept is not None
+    assert after is None
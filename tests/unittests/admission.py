@@ -0,0 +1,138 @@
+import asyncio
+import gc
+import time
+import weakref
+
+import pytest
+
+from app.api.models import PredictRequest
+from app.serve.admission import QUEUE_DEPTH, SHED_REQUESTS, LaneQueue, Overloaded, Priority
+from app.serve.batcher import Batcher
+from app.serve.executor import ExecutorMode, InferenceExecutor
+from app.serve.model import Model
+
+
+class RecordingModel:
+    def __init__(self):
+        self.ages = []
+
+    def predict(self, data):
+        self.ages.extend(data["Age"])
+        return [0.5] * len(data)
+
+class DummyHistory:
+    def insert_history(self, **kwargs):
+        pass
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+
+def make_request(age: int = 22) -> PredictRequest:
+    return PredictRequest(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=age, SibSp=1,
+                          Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S")
+
+
+def make_batcher(model, **kwargs) -> Batcher:
+    model = Model(model, DummyProcessor(), "1", "admission", "deploy", loggers=[], histories=[DummyHistory()])
+    return Batcher(model, **kwargs)
+
+
+def test_lanes_serve_by_priority_and_reserve_room():
+    async def scenario():
+        queue = LaneQueue(max_size=4)
+        queue.put_nowait("shadow", Priority.shadow)
+        queue.put_nowait("bulk", Priority.bulk)
+        # Lower lanes only get half of the queue
+        with pytest.raises(asyncio.QueueFull):
+            queue.put_nowait("bulk-2", Priority.bulk)
+        queue.put_nowait("interactive", Priority.interactive)
+        queue.put_nowait("interactive-2", Priority.interactive)
+        with pytest.raises(asyncio.QueueFull):
+            queue.put_nowait("interactive-3", Priority.interactive)
+        queue.put_last("marker")
+        return [await queue.get() for _ in range(queue.qsize())]
+
+    assert asyncio.run(scenario()) == ["interactive", "interactive-2", "bulk", "shadow", "marker"]
+
+
+def test_full_queue_sheds_with_retry_after():
+    async def scenario():
+        # One huge batch window: nothing is scored while the queue fills up
+        batcher = make_batcher(RecordingModel(), batch_size=100, batch_timeout=0.2, max_queue_size=4)
+        shed = SHED_REQUESTS.labels("admission", "1", "deploy", "interactive", "queue_full")
+        before = shed._value.get()
+        results = await asyncio.gather(*(batcher.queue_request(make_request()) for _ in range(8)),
+                                       return_exceptions=True)
+        batcher.close()
+        return results, shed._value.get() - before
+
+    results, shed = asyncio.run(scenario())
+    rejected = [result for result in results if isinstance(result, Overloaded)]
+    assert len(rejected) == 4 and shed == 4
+    assert all(error.status_code == 429 and error.retry_after >= 1 for error in rejected)
+    assert [result for result in results if not isinstance(result, Overloaded)] == [0.5] * 4
+
+
+def test_expired_requests_are_dropped_before_scoring():
+    async def scenario():
+        model = RecordingModel()
+        batcher = make_batcher(model, batch_size=100, batch_timeout=0.05)
+        with pytest.raises(Overloaded) as error:
+            await batcher.queue_request(make_request(), deadline=time.monotonic() - 1)
+        assert error.value.status_code == 503
+
+        deadline = time.monotonic() + 0.01
+        results = await asyncio.gather(batcher.queue_request(make_request(1), deadline=deadline),
+                                       batcher.queue_request(make_request(2)), return_exceptions=True)
+        batcher.close()
+        return model.ages, results
+
+    ages, (expired, scored) = asyncio.run(scenario())
+    assert isinstance(expired, Overloaded) and expired.reason == "deadline"
+    assert scored == 0.5 and ages == [2]
+
+
+def queue_depth_series() -> set[tuple]:
+    return {tuple(sample.labels.values()) for metric in QUEUE_DEPTH.collect() for sample in metric.samples}
+
+
+def test_retired_batchers_are_released_by_the_depth_gauge():
+    async def scenario():
+        old = make_batcher(RecordingModel())
+        new = make_batcher(RecordingModel())
+        # The redeployed batcher owns the series; retiring the old one leaves them in place
+        await old.drain()
+        kept = ("admission", "1", "deploy", "interactive") in queue_depth_series()
+        retired = weakref.ref(old)
+        del old
+        await new.drain()
+        return kept, retired
+
+    kept, retired = asyncio.run(scenario())
+    gc.collect()
+    assert kept
+    assert retired() is None
+    assert not any(series[0] == "admission" for series in queue_depth_series())
+
+class SlowModel:
+    def predict(self, data):
+        time.sleep(0.05)
+        return [0.5] * len(data)
+
+def test_requests_cut_off_by_shutdown_are_shed():
+    async def scenario():
+        model = Model(SlowModel(), DummyProcessor(), "1", "admission", "deploy", loggers=[],
+                      histories=[DummyHistory()])
+        # One worker: the second batch waits in the pool's queue until close cancels it
+        executor = InferenceExecutor(model, mode=ExecutorMode.thread, max_workers=1, max_in_flight=2)
+        batcher = Batcher(model, batch_size=1, batch_timeout=0.001, executor=executor)
+        pending = [asyncio.create_task(batcher.queue_request(make_request())) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        batcher.close()
+        return await asyncio.wait_for(asyncio.gather(*pending, return_exceptions=True), 1)
+
+    scored, shed = asyncio.run(scenario())
+    assert scored == 0.5
+    assert isinstance(shed, Overloaded) and shed.status_code == 503 and shed.reason == "shutdown"
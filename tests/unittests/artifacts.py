@@ -0,0 +1,60 @@
+import os
+import shutil
+
+import joblib
+import mlflow
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+from app.serve.artifacts import ArtifactLoader
+
+
+@pytest.fixture
+def estimator():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 50))
+    return LogisticRegression().fit(X, X[:, 0] > 0)
+
+
+def test_local_artifacts_are_memory_mapped(tmp_path, estimator):
+    source = tmp_path / "model.joblib"
+    joblib.dump(estimator, source, compress=3)
+    loader = ArtifactLoader(str(tmp_path / "cache"))
+    loaded = loader.load(str(source))
+    assert isinstance(loaded.coef_, np.memmap)
+    np.testing.assert_array_equal(loaded.coef_, estimator.coef_)
+    # The same content is stored once, whatever path it came from
+    shutil.copy(source, tmp_path / "copy.joblib")
+    assert loader.fetch(str(tmp_path / "copy.joblib")) == loader.fetch(str(source))
+    assert len(os.listdir(tmp_path / "cache" / "objects")) == 1
+
+def test_mlflow_model_directories(tmp_path, estimator):
+    model_dir = tmp_path / "mlflow_model"
+    mlflow.sklearn.save_model(estimator, str(model_dir))
+    loader = ArtifactLoader(str(tmp_path / "cache"))
+    loaded = loader.load(str(model_dir))
+    np.testing.assert_array_equal(loaded.predict(np.zeros((1, 50))), estimator.predict(np.zeros((1, 50))))
+
+def test_immutable_uris_are_downloaded_once(tmp_path, monkeypatch, estimator):
+    model_dir = tmp_path / "mlflow_model"
+    mlflow.sklearn.save_model(estimator, str(model_dir))
+    downloads = []
+
+    def download_artifacts(artifact_uri, dst_path):
+        downloads.append(artifact_uri)
+        return shutil.copytree(model_dir, os.path.join(dst_path, "model"))
+
+    monkeypatch.setattr(mlflow.artifacts, "download_artifacts", download_artifacts)
+    loader = ArtifactLoader(str(tmp_path / "cache"))
+    for _ in range(2):
+        loader.load("models:/titanic/3")
+        loader.load("runs:/abc123/model")
+        loader.load("models:/titanic/Production")
+    # Stages move, so they are resolved every time; versions and runs only once
+    assert downloads == ["models:/titanic/3", "runs:/abc123/model", "models:/titanic/Production",
+                         "models:/titanic/Production"]
+    # A fresh replica sharing the cache directory needs no download at all
+    ArtifactLoader(str(tmp_path / "cache")).load("models:/titanic/3")
+    assert len(downloads) == 4
+    assert os.listdir(tmp_path / "cache" / "downloads") == []
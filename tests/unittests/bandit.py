@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from app.serve.ab_test.bandit import BanditPolicy, BanditRouter
+
+
+def simulate(router: BanditRouter, success_rates: list[float], rounds: int = 2000) -> None:
+    rng = random.Random(0)
+    for _ in range(rounds):
+        choice = router.route()
+        router.record(choice, 1.0 if rng.random() < success_rates[choice] else 0.0)
+
+
+@pytest.mark.parametrize("policy", list(BanditPolicy))
+def test_bandit_moves_traffic_to_the_better_variant(policy):
+    random.seed(0)
+    router = BanditRouter(3, policy)
+    simulate(router, [0.2, 0.7, 0.4])
+    assert sum(router.pulls) == 2000
+    assert router.pulls[1] > router.pulls[0] + router.pulls[2]
+    assert router.allocation()[1] > 0.8
+
+
+def test_bandit_state_and_rewards():
+    router = BanditRouter(2)
+    # No feedback yet: both variants are equally likely
+    assert abs(router.allocation(draws=4000)[0] - 0.5) < 0.05
+    router.record(1, 0.5)
+    state = router.state(["A", "B"])
+    assert state["variants"][0]["reward_mean"] is None
+    assert state["variants"][1]["reward_mean"] == 0.5
+    with pytest.raises(ValueError):
+        router.record(0, 2.0)
+
+
+def test_ucb_shares_traffic_until_every_variant_has_feedback():
+    router = BanditRouter(2, BanditPolicy.ucb)
+    # Feedback is delayed: requests keep arriving before any reward is posted
+    assert [router.route() for _ in range(4)] == [0, 1, 0, 1]
+    assert router.allocation() == [0.5, 0.5]
+    router.record(0, 1.0)
+    # Still no reward for B: the split stays even instead of swinging to B
+    assert router.allocation() == [0.5, 0.5]
+    assert [router.route() for _ in range(4)] == [0, 1, 0, 1]
+    router.record(1, 0.0)
+    # Both have feedback: UCB1 picks the better mean
+    assert router.route() == 0
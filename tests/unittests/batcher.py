@@ -1,97 +1,165 @@
+import asyncio
+
 import pytest
 
+from app.api.models import PredictRequest
+from app.loggers.extensions.base import LoggingExtension
+from app.loggers.history.base import HistoryBase
+from app.loggers.telemetry import TelemetryBus
 from app.serve.batcher import Batcher, RequestItem
 from app.serve.model import Model
 
 
 class DummyModel:
+    def __init__(self):
+        self.batch_sizes = []
+
     def predict(self, data):
-        return 0.2
-    
-class DummyLogger:
-    def log(self, message):
-        print(f"Log: {message}")
-        
+        self.batch_sizes.append(len(data))
+        return [0.2] * len(data)
+
+class FailingModel:
+    def predict(self, data):
+        raise RuntimeError("boom")
+
+class DummyLogger(LoggingExtension):
+    def new_experiment(self, experiment_name):
+        pass
+
+    def log(self, **kwargs):
+        print(f"Log: {kwargs}")
+
+class DummyHistory:
+    def insert_history(self, **kwargs):
+        pass
+
+class RecordingHistory(HistoryBase):
+    def __init__(self):
+        self.records = []
+
+    def connect(self):
+        pass
+
+    def fetch_history(self, model_version=None):
+        return self.records
+
+    def iter_history(self, filters, after_id=None, limit=None):
+        return iter(self.records)
+
+    def insert_history(self, **kwargs):
+        self.records.append(kwargs)
+
 class DummyProcessor:
     def transform(self, data):
         return data
 
-@pytest.fixture
-def batcher():
-    return Batcher(Model(DummyModel(), DummyProcessor(), '1', 'dummy', 'deploy', loggers=DummyLogger()), batch_size=5, batch_timeout=0.1)
-
-def test_new_batcher(batcher):
-    assert batcher.batch_size == 5
-    assert batcher.batch_timeout == 0.1
-    assert batcher.queue == []
-    assert batcher.model.model_name == 'dummy'
-    assert batcher.model.version == '1'
-    
-def test_queue_request(batcher):
-    input_data = {"feature1": 1, "feature2": 2}
-    run_id = "test_run"
-    variant = "A"
-    model_version = "1.0"
-    
-    future = batcher.queue_request(input_data, run_id, variant, model_version)
-    
-    assert len(batcher.queue) == 1
-    assert batcher.queue[0].input_data == input_data
-    assert batcher.queue[0].run_id == run_id
-    assert batcher.queue[0].variant == variant
-    assert batcher.queue[0].model_version == model_version
-    assert future.done() is False
-    
-def test_add_request_item(batcher):
-    item = RequestItem(id="1", data={"key": "value"})
-    batcher.add_request_item(item)
-    
-    assert len(batcher.current_batch) == 1
-    assert batcher.current_batch[0] == item
-    
-def test_flush_batch(batcher):
-    item1 = RequestItem(id="1", data={"key": "value1"})
-    item2 = RequestItem(id="2", data={"key": "value2"})
-    
-    batcher.add_request_item(item1)
-    batcher.add_request_item(item2)
-    
-    flushed_batch = batcher.flush_batch()
-    
-    assert len(flushed_batch) == 2
-    assert flushed_batch[0] == item1
-    assert flushed_batch[1] == item2
-    assert batcher.current_batch == []
-    assert batcher.last_flushed_batch == flushed_batch
-    
-def test_flush_empty_batch(batcher):
-    flushed_batch = batcher.flush_batch()
-    
-    assert len(flushed_batch) == 0
-    assert batcher.current_batch == []
-    assert batcher.last_flushed_batch == []
-    
-def test_flush_timeout(batcher):
-    item = RequestItem(id="1", data={"key": "value"})
-    batcher.add_request_item(item)
-    
-    # Simulate waiting for the timeout
-    batcher.last_flush_time = 0  # Reset last flush time to simulate timeout
-    flushed_batch = batcher.flush_batch()
-    
-    assert len(flushed_batch) == 1
-    assert flushed_batch[0] == item
-    assert batcher.current_batch == []
-    assert batcher.last_flushed_batch == flushed_batch
-    
-def test_flush_batch_size(batcher):
-    for i in range(5):
-        item = RequestItem(id=str(i), data={"key": f"value{i}"})
-        batcher.add_request_item(item)
-    
-    flushed_batch = batcher.flush_batch()
-    
-    assert len(flushed_batch) == 5
-    assert len(batcher.current_batch) == 0
-    assert batcher.last_flushed_batch == flushed_batch
-    
\ No newline at end of file
+
+def make_request() -> PredictRequest:
+    return PredictRequest(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=22, SibSp=1,
+                          Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S")
+
+
+def make_batcher(model=None, batch_size=5, batch_timeout=0.1) -> Batcher:
+    model = Model(model or DummyModel(), DummyProcessor(), '1', 'dummy', 'deploy',
+                  loggers=[DummyLogger()], histories=[DummyHistory()])
+    return Batcher(model, batch_size=batch_size, batch_timeout=batch_timeout)
+
+
+def test_new_batcher():
+    async def scenario():
+        batcher = make_batcher()
+        assert batcher.batch_size == 5
+        assert batcher.batch_timeout == 0.1
+        assert batcher.is_empty()
+        assert batcher.model.model_name == 'dummy'
+        assert batcher.model.version == '1'
+
+    asyncio.run(scenario())
+
+def test_queue_request():
+    async def scenario():
+        batcher = make_batcher()
+        prediction = await batcher.queue_request(make_request())
+        assert prediction == 0.2
+        assert batcher.is_empty()
+
+    asyncio.run(scenario())
+
+def test_request_item_keeps_input():
+    async def scenario():
+        request = make_request()
+        item = RequestItem(request)
+        assert item.input_data is request
+        assert item.future.done() is False
+
+    asyncio.run(scenario())
+
+def test_flush_batch_size():
+    async def scenario():
+        model = DummyModel()
+        # The timeout is far longer than the test: only a full batch can wake the loop
+        batcher = make_batcher(model, batch_size=5, batch_timeout=60)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.queue_request(make_request()) for _ in range(5))), 1)
+        assert results == [0.2] * 5
+        assert model.batch_sizes == [5]
+
+    asyncio.run(scenario())
+
+def test_flush_timeout():
+    async def scenario():
+        model = DummyModel()
+        batcher = make_batcher(model, batch_size=5, batch_timeout=0.01)
+        results = await asyncio.gather(*(batcher.queue_request(make_request()) for _ in range(2)))
+        assert results == [0.2] * 2
+        assert model.batch_sizes == [2]
+
+    asyncio.run(scenario())
+
+def test_batches_never_exceed_batch_size():
+    async def scenario():
+        model = DummyModel()
+        batcher = make_batcher(model, batch_size=4, batch_timeout=0.01)
+        await asyncio.gather(*(batcher.queue_request(make_request()) for _ in range(10)))
+        assert sum(model.batch_sizes) == 10
+        assert max(model.batch_sizes) <= 4
+
+    asyncio.run(scenario())
+
+def test_model_error_is_propagated():
+    async def scenario():
+        batcher = make_batcher(FailingModel(), batch_timeout=0.01)
+        with pytest.raises(RuntimeError):
+            await batcher.queue_request(make_request())
+
+    asyncio.run(scenario())
+
+def test_batches_are_published_to_telemetry():
+    history = RecordingHistory()
+    bus = TelemetryBus(histories=[history])
+
+    async def scenario():
+        model = Model(DummyModel(), DummyProcessor(), '1', 'dummy', 'deploy', telemetry=bus)
+        batcher = Batcher(model, batch_size=5, batch_timeout=0.1)
+        results = await asyncio.gather(*(batcher.queue_request(make_request()) for _ in range(5)))
+        batcher.close()
+        return results
+
+    assert asyncio.run(scenario()) == [0.2] * 5
+    assert bus.flush(5)
+    assert len(history.records) == 5
+    bus.close()
+
+def test_drain_scores_queued_requests_then_stops():
+    model = DummyModel()
+
+    async def scenario():
+        batcher = make_batcher(model, batch_size=4, batch_timeout=10)
+        pending = [asyncio.ensure_future(batcher.queue_request(make_request())) for _ in range(6)]
+        await asyncio.sleep(0)
+        await asyncio.wait_for(batcher.drain(), 1)
+        assert batcher._task.done()
+        return [future.result() for future in pending]
+
+    assert asyncio.run(scenario()) == [0.2] * 6
+    assert model.batch_sizes == [4, 2]
@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+from prometheus_client import REGISTRY
+
+from app.api.models import PredictRequest
+from app.serve.batcher import Batcher
+from app.serve.cache import PredictionCache
+from app.serve.inference import InferenceRunner
+from app.serve.model import Model
+
+
+class DummyModel:
+    def __init__(self):
+        self.rows = 0
+
+    def predict(self, data):
+        self.rows += len(data)
+        return [float(age) for age in data["Age"]]
+
+class DummyHistory:
+    def insert_history(self, **kwargs):
+        pass
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+
+def make_request(age: int = 22) -> PredictRequest:
+    return PredictRequest(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=age, SibSp=1,
+                          Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S")
+
+def make_model(version: str = "1", variant: str = "deploy") -> Model:
+    return Model(DummyModel(), DummyProcessor(), version, "dummy", variant, histories=[DummyHistory()])
+
+
+def test_key_covers_fields_and_model():
+    model = make_model()
+    key = PredictionCache.key(model, make_request())
+    assert key == PredictionCache.key(model, make_request())
+    assert key != PredictionCache.key(model, make_request(age=23))
+    assert key != PredictionCache.key(make_model(version="2"), make_request())
+    assert key != PredictionCache.key(make_model(variant="B"), make_request())
+
+def test_lru_eviction():
+    cache = PredictionCache(max_entries=2)
+    evictions = REGISTRY.get_sample_value("prediction_cache_evictions_total", {"reason": "capacity"}) or 0
+    cache.put("a", 1.0)
+    cache.put("b", 2.0)
+    assert cache.get("a") == 1.0   # "b" is now the least recently used
+    cache.put("c", 3.0)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1.0 and cache.get("c") == 3.0
+    assert REGISTRY.get_sample_value("prediction_cache_evictions_total", {"reason": "capacity"}) == evictions + 1
+
+def test_ttl_expiry():
+    cache = PredictionCache(ttl=0.01)
+    cache.put("a", 1.0)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_repeats_skip_the_model():
+    model = make_model()
+    cache = PredictionCache()
+
+    async def scenario():
+        batcher = Batcher(model, batch_size=4, batch_timeout=0.01, cache=cache)
+        # Identical concurrent requests share one prediction
+        first = await asyncio.gather(*(batcher.queue_request(make_request()) for _ in range(3)))
+        again = await batcher.queue_request(make_request())
+        other = await batcher.queue_request(make_request(age=30))
+        batcher.close()
+        return first, again, other
+
+    hits = REGISTRY.get_sample_value("prediction_cache_hits_total")
+    assert asyncio.run(scenario()) == ([22.0] * 3, 22.0, 30.0)
+    assert model.model.rows == 2
+    assert REGISTRY.get_sample_value("prediction_cache_hits_total") - hits == 3
+
+def test_errors_are_not_cached():
+    cache = PredictionCache()
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    async def scenario():
+        for _ in range(2):
+            try:
+                await cache.fetch("a", failing)
+            except RuntimeError:
+                pass
+        return await cache.fetch("a", lambda: asyncio.sleep(0, result=1.0))
+
+    assert asyncio.run(scenario()) == 1.0
+
+def test_waiters_outlive_a_cancelled_first_caller():
+    cache = PredictionCache()
+    calls = []
+
+    async def compute():
+        calls.append(len(calls))
+        await asyncio.sleep(0.05)
+        return 1.0
+
+    async def scenario():
+        first = asyncio.create_task(cache.fetch("a", compute))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.fetch("a", compute)) for _ in range(2)]
+        await asyncio.sleep(0)
+        first.cancel()
+        results = await asyncio.gather(*waiters)
+        return first.cancelled(), results
+
+    assert asyncio.run(scenario()) == (True, [1.0, 1.0])
+    assert len(calls) == 2
+    assert cache.get("a") == 1.0
+
+def test_swapping_batchers_invalidates_cache():
+    runner = InferenceRunner()
+    runner.set_configs(prediction_cache_size=10, batch_timeout=0.001, warmup=False)
+
+    async def scenario():
+        runner.new_batcher(make_model())
+        await runner.run_inference(make_request())
+        assert len(runner.prediction_cache) == 1
+        await runner.swap_models([make_model(version="2")])
+        assert len(runner.prediction_cache) == 0
+        await runner.run_inference(make_request())
+        assert len(runner.prediction_cache) == 1
+        for batcher in runner._running_models.values():
+            batcher.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from app.api.models import PredictRequest
+from app.serve.columnar import FIELDS, build_batch, transform_batch
+
+
+def make_requests() -> list[PredictRequest]:
+    return [
+        PredictRequest(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=22, SibSp=1,
+                       Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S"),
+        PredictRequest(Pclass=1, Name="Cumings, Mrs. John Bradley", Sex="female", Age=38, SibSp=1,
+                       Parch=0, Ticket="PC 17599", Fare=71.2833, Cabin="C85", Embarked="C"),
+        PredictRequest(Pclass=2, Name="Nobody, Mr. X", Sex="unknown", Age=40, SibSp=0,
+                       Parch=0, Ticket="1234", Fare=13.0, Cabin="", Embarked=""),
+    ]
+
+
+class FrameProcessor:
+    def transform(self, data):
+        return data
+
+class ColumnarProcessor:
+    def transform(self, data):
+        raise AssertionError("transform_columns should be preferred")
+
+    def transform_columns(self, batch):
+        return batch.codes["Sex"]
+
+
+def test_build_batch_matches_dataframe_path():
+    requests = make_requests()
+    expected = pd.DataFrame([r.model_dump() for r in requests])
+    frame = build_batch(requests).to_frame()
+    assert list(frame.columns) == list(FIELDS)
+    pd.testing.assert_frame_equal(frame, expected)
+
+def test_build_batch_encodes_categories():
+    batch = build_batch(make_requests())
+    assert len(batch) == 3
+    assert batch.codes["Pclass"].tolist() == [2, 0, 1]
+    assert batch.codes["Sex"].tolist() == [0, 1, -1]
+    assert batch.codes["Embarked"].tolist() == [2, 0, -1]
+    assert batch.codes["Sex"].dtype == np.int8
+
+def test_build_empty_batch():
+    batch = build_batch([])
+    assert len(batch) == 0
+    assert batch["Fare"].dtype == np.float64
+
+def test_transform_batch_prefers_columnar_preprocessors():
+    batch = build_batch(make_requests())
+    assert transform_batch(ColumnarProcessor(), batch).tolist() == [0, 1, -1]
+    assert isinstance(transform_batch(FrameProcessor(), batch), pd.DataFrame)
@@ -0,0 +1,96 @@
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier, RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression, Ridge
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MinMaxScaler, OneHotEncoder, OrdinalEncoder, StandardScaler
+
+from app.serve.columnar import build_batch, transform_batch
+from app.serve.compiler import CompiledPreprocessor, compile_pipeline
+from app.serve.model_server import ModelServiceProvider, ModelServiceProviderConfigs
+from app.serve.warmup import synthetic_rows
+
+
+NUMERIC = ["Age", "SibSp", "Parch", "Fare"]
+CATEGORICAL = ["Pclass", "Sex", "Embarked"]
+
+
+class DummyProcessor:
+    def fit(self, data, target):
+        return self
+
+    def transform(self, data):
+        return data[NUMERIC].to_numpy()
+
+
+def columns(encoder) -> ColumnTransformer:
+    return ColumnTransformer([
+        ("num", Pipeline([("impute", SimpleImputer(strategy="median")), ("scale", StandardScaler())]), NUMERIC),
+        ("cat", Pipeline([("impute", SimpleImputer(strategy="most_frequent")), ("encode", encoder)]), CATEGORICAL),
+        ("cabin", OneHotEncoder(handle_unknown="ignore"), ["Cabin"]),
+    ])
+
+
+def fit(preprocessor, model, regression: bool = False):
+    frame = build_batch(synthetic_rows(400)).to_frame()
+    target = frame["Fare"] * 2 + frame["Age"] if regression else \
+        ((frame["Age"] < 30) ^ (frame["Sex"] == "female") ^ (frame["Pclass"] == 3)).astype(int)
+    preprocessor.fit(frame, target)
+    model.fit(preprocessor.transform(frame), target)
+    return preprocessor, model
+
+
+PIPELINES = {
+    "logistic/one-hot": lambda: fit(columns(OneHotEncoder(handle_unknown="ignore")), LogisticRegression()),
+    "logistic/drop-first": lambda: fit(columns(OneHotEncoder(drop="first", handle_unknown="ignore",
+                                                             sparse_output=False)), LogisticRegression()),
+    "forest/ordinal": lambda: fit(columns(OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1)),
+                                  RandomForestClassifier(n_estimators=30, random_state=0)),
+    "boosting": lambda: fit(columns(OneHotEncoder(handle_unknown="ignore")),
+                            GradientBoostingClassifier(n_estimators=30, random_state=0)),
+    "forest regressor": lambda: fit(columns(OneHotEncoder(handle_unknown="ignore")),
+                                    RandomForestRegressor(n_estimators=20, random_state=0), regression=True),
+    "ridge/min-max": lambda: fit(Pipeline([
+        ("columns", columns(OneHotEncoder(handle_unknown="ignore")).set_params(sparse_threshold=0)),
+        ("scale", MinMaxScaler())]), Ridge(), regression=True),
+}
+
+
+@pytest.mark.parametrize("name", PIPELINES)
+def test_compiled_pipeline_predicts_like_sklearn(name):
+    preprocessor, model = PIPELINES[name]()
+    compiled = compile_pipeline(preprocessor, model, synthetic_rows(64))
+    assert compiled is not None
+    # Process-mode executors pickle the pair
+    compiled_preprocessor, compiled_model = pickle.loads(pickle.dumps(compiled))
+
+    rows = synthetic_rows(500)[::-1]
+    # Unknown categories are ignored, or encoded as unknown_value, by both
+    rows[0] = rows[0].model_copy(update={"Embarked": "X", "Pclass": 4, "Cabin": "Z99"})
+    for size in (1, 16, 500):
+        batch = build_batch(rows[:size])
+        expected = model.predict(transform_batch(preprocessor, batch))
+        assert np.array_equal(compiled_model.predict(compiled_preprocessor.transform_columns(batch)), expected)
+
+
+def test_unknown_category_raises_like_sklearn():
+    preprocessor, model = fit(columns(OneHotEncoder(handle_unknown="error")), LogisticRegression())
+    compiled_preprocessor, _ = compile_pipeline(preprocessor, model, synthetic_rows(64))
+    batch = build_batch([synthetic_rows(1)[0].model_copy(update={"Embarked": "X"})])
+    with pytest.raises(ValueError):
+        compiled_preprocessor.transform_columns(batch)
+
+
+def test_register_model_compiles_supported_pipelines_only():
+    hub = ModelServiceProvider(ModelServiceProviderConfigs(compile_models=True))
+    preprocessor, model = fit(columns(OneHotEncoder(handle_unknown="ignore")), LogisticRegression())
+    hub.register_model(model, preprocessor, "1", "compiled", log_to_mlflow=False)
+    assert isinstance(hub._loaded_models["compiled(1)"][0], CompiledPreprocessor)
+
+    processor, forest = fit(DummyProcessor(), RandomForestClassifier(n_estimators=5, random_state=0))
+    hub.register_model(forest, processor, "2", "compiled", log_to_mlflow=False)
+    assert hub._loaded_models["compiled(2)"] == (processor, forest)
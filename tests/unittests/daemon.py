@@ -0,0 +1,247 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.models import PredictRequest
+from app.serve.ab_test.ab import ABTestMode
+from app.serve.admission import Priority
+from app.serve.control import ControlPlane
+from app.serve.daemon import (DaemonClient, DaemonConnection, DaemonError, InferenceDaemon, decode_predict,
+                              encode_predict, RESULT, _HEADER, _LENGTH)
+from app.serve.inference import InferenceRunner
+from app.serve.model import Model
+
+
+class EchoAgeModel:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, data):
+        self.batch_sizes.append(len(data))
+        return [float(age) for age in data["Age"]]
+
+class DummyHistory:
+    def insert_history(self, **kwargs):
+        pass
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+
+def make_request(age: int = 22, name: str = "Braund, Mr. Owen Harris") -> PredictRequest:
+    return PredictRequest(Pclass=3, Name=name, Sex="male", Age=age, SibSp=1,
+                          Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S")
+
+
+def make_runner(model: EchoAgeModel) -> InferenceRunner:
+    runner = InferenceRunner()
+    runner.set_configs(batch_size=64, batch_timeout=0.05, warmup=False)
+    runner.new_batcher(Model(model, DummyProcessor(), "1", "echo", "deploy", loggers=[], histories=[DummyHistory()]))
+    return runner
+
+
+async def aiter_records(count: int):
+    for age in range(count):
+        yield make_request(age=age).model_dump()
+
+
+def test_predict_frame_round_trip():
+    request = make_request(name="Åberg, Mrs. Éva")
+    frame = encode_predict(7, request, "user-1")
+    (length,) = _LENGTH.unpack_from(frame)
+    assert length == len(frame) - _LENGTH.size
+    kind, request_id = _HEADER.unpack_from(frame, _LENGTH.size)
+    assert request_id == 7
+
+    decoded, user_id, priority, timeout = decode_predict(frame[_LENGTH.size + _HEADER.size:])
+    assert decoded.model_dump() == request.model_dump()
+    assert (user_id, priority, timeout) == ("user-1", Priority.interactive, None)
+    frame = encode_predict(8, request, priority=Priority.bulk, timeout=0.25)
+    assert decode_predict(frame[_LENGTH.size + _HEADER.size:])[1:] == (None, Priority.bulk, 0.25)
+
+
+def test_front_ends_are_batched_together(tmp_path):
+    async def scenario():
+        model = EchoAgeModel()
+        daemon = InferenceDaemon(str(tmp_path / "inference.sock"), make_runner(model), ControlPlane())
+        await daemon.start()
+        # Each client stands for one HTTP worker with its own connection
+        clients = [DaemonClient([daemon.socket_path]) for _ in range(4)]
+        try:
+            results = await asyncio.gather(*(client.predict(make_request(age=i * 10 + j))
+                                             for i, client in enumerate(clients) for j in range(8)))
+        finally:
+            for client in clients:
+                await client.close()
+            await daemon.close()
+        assert results == [(float(i * 10 + j), None) for i in range(4) for j in range(8)]
+        # Requests from all four front-ends fill a single batch
+        assert max(model.batch_sizes) > 8
+
+    asyncio.run(scenario())
+
+
+def test_runner_forwards_predictions_and_errors(tmp_path):
+    async def scenario():
+        daemon_runner = InferenceRunner()
+        daemon = InferenceDaemon(str(tmp_path / "inference.sock"), daemon_runner, ControlPlane())
+        await daemon.start()
+        front_end = InferenceRunner()
+        front_end.set_configs(inference_daemon=[daemon.socket_path])
+        try:
+            # No model is deployed in the daemon yet; the error surfaces like a local one
+            with pytest.raises(ValueError, match="No active batchers"):
+                await front_end.run_inference(make_request())
+            daemon_runner.set_configs(batch_timeout=0.01)
+            daemon_runner.new_batcher(Model(EchoAgeModel(), DummyProcessor(), "1", "echo", "deploy",
+                                            loggers=[], histories=[DummyHistory()]))
+            response = await front_end.run_inference(make_request(age=41))
+            assert response.survived == 41.0
+        finally:
+            await front_end.daemon.close()
+            await daemon.close()
+
+    asyncio.run(scenario())
+
+
+def test_control_commands_run_in_the_daemon(tmp_path):
+    async def scenario():
+        applied = []
+
+        def plane(index: int) -> ControlPlane:
+            async def deploy(payload, origin):
+                applied.append((index, origin))
+                return {"status": "deployed"}
+
+            async def load(payload, origin):
+                # Only the second daemon cannot read the artifacts
+                return {"status": "Failed to push model: missing"} if index == 1 else {"status": "loaded"}
+
+            async def reject(payload, origin):
+                raise HTTPException(status_code=409, detail="unstable")
+
+            control = ControlPlane()
+            control.register("deploy", deploy)
+            control.register("load", load)
+            control.register("ab-test", reject)
+            return control
+
+        daemons = [InferenceDaemon(str(tmp_path / f"inference-{i}.sock"), InferenceRunner(), plane(i))
+                   for i in range(2)]
+        for daemon in daemons:
+            await daemon.start()
+        client = DaemonClient([daemon.socket_path for daemon in daemons])
+        front_end = plane(-1)
+        front_end.forward_to(client.control)
+        try:
+            assert await front_end.execute("deploy", {"model_name": "echo"}) == {"status": "deployed"}
+            # Every daemon applies the command, none of them in the front-end, and only one is the origin
+            assert sorted(applied) == [(0, True), (1, False)]
+            result = await front_end.execute("load", {})
+            assert result["status"].startswith("Failed to push model: missing") and "inference-1.sock" in result["status"]
+            with pytest.raises(HTTPException) as error:
+                await front_end.execute("ab-test", {})
+            assert error.value.status_code == 409
+        finally:
+            await client.close()
+            for daemon in daemons:
+                await daemon.close()
+
+    asyncio.run(scenario())
+
+
+def test_unreachable_daemon_answers_503(tmp_path):
+    async def scenario():
+        front_end = InferenceRunner()
+        front_end.set_configs(inference_daemon=[str(tmp_path / "missing.sock")])
+        with pytest.raises(HTTPException) as error:
+            await front_end.run_inference(make_request())
+        # Bulk uploads report it per row instead of breaking off
+        results = [result async for result in front_end.run_batch_inference(aiter_records(3))]
+        return error.value.status_code, results
+
+    status, results = asyncio.run(scenario())
+    assert status == 503
+    assert len(results) == 3 and all("Cannot reach the inference daemon" in result["error"] for result in results)
+
+
+def test_malformed_reply_fails_pending_requests(tmp_path):
+    async def scenario():
+        async def serve(reader, writer):
+            # Two requests, then a RESULT frame too short to hold a prediction
+            for _ in range(2):
+                (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                await reader.readexactly(length)
+            writer.write(_LENGTH.pack(_HEADER.size + 2) + _HEADER.pack(RESULT, 1) + b"\x00\x01")
+            await writer.drain()
+            await reader.read()
+
+        server = await asyncio.start_unix_server(serve, str(tmp_path / "broken.sock"))
+        connection = DaemonConnection(str(tmp_path / "broken.sock"))
+        try:
+            results = await asyncio.wait_for(asyncio.gather(connection.predict(make_request()),
+                                                            connection.predict(make_request()),
+                                                            return_exceptions=True), 5)
+        finally:
+            await connection.close()
+            server.close()
+            await server.wait_closed()
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, DaemonError) and result.status == 503 for result in results)
+    assert "Malformed reply" in str(results[0])
+
+
+class GoneWriter:
+    def __init__(self):
+        self.frames = []
+        self.drains = 0
+
+    def write(self, frame):
+        self.frames.append(frame)
+
+    async def drain(self):
+        self.drains += 1
+        raise ConnectionResetError("front-end went away")
+
+def test_replies_wait_for_the_front_end_to_read():
+    async def scenario():
+        runner = make_runner(EchoAgeModel())
+        daemon = InferenceDaemon("unused.sock", runner, ControlPlane())
+        writer = GoneWriter()
+        # The payload of a PREDICT frame is everything after its header
+        await daemon._predict(writer, 1, encode_predict(1, make_request())[_LENGTH.size + _HEADER.size:])
+        runner.get_active_deploy_batcher().close()
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert len(writer.frames) == 1 and writer.drains == 1
+
+
+def test_bandit_feedback_reaches_the_daemon(tmp_path):
+    async def scenario():
+        daemon_runner = InferenceRunner()
+        daemon_runner.set_configs(batch_timeout=0.01, warmup=False)
+        models = [Model(EchoAgeModel(), DummyProcessor(), str(version), "echo", variant, loggers=[],
+                        histories=[DummyHistory()]) for version, variant in ((1, "A"), (2, "B"))]
+        await daemon_runner.swap_models(models, ab_test_mode=ABTestMode.bandit)
+        daemon = InferenceDaemon(str(tmp_path / "inference.sock"), daemon_runner, ControlPlane())
+        await daemon.start()
+        front_end = InferenceRunner()
+        front_end.set_configs(inference_daemon=[daemon.socket_path])
+        try:
+            variant = (await front_end.run_inference(make_request())).variant
+            await front_end.record_feedback(variant, 1.0)
+            with pytest.raises(ValueError, match="Unknown variant"):
+                await front_end.record_feedback("C", 1.0)
+            return variant, await front_end.bandit_state()
+        finally:
+            await front_end.daemon.close()
+            await daemon.close()
+
+    variant, state = asyncio.run(scenario())
+    served = next(entry for entry in state["variants"] if entry["variant"] == variant)
+    assert served["pulls"] == 1 and served["feedback"] == 1 and served["reward_sum"] == 1.0
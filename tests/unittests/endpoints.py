@@ -0,0 +1,400 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from app.api.streaming import StreamFormatError, iter_json_records
+from app.loggers.history.lite import HistorySQLite
+from app.main import app
+from app.serve.inference import InferenceRunner, runner
+from app.serve.model_server import ModelServiceProviderConfigs, model_hub
+from app.serve.model import Model
+from app.serve.tracing import STAGE_SECONDS, tracer
+
+
+class DummyModel:
+    def predict(self, data):
+        return [float(age) for age in data["Age"]]
+
+class DummyHistory:
+    def __init__(self):
+        self.records = []
+
+    def insert_history(self, **kwargs):
+        self.records.append(kwargs)
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+
+ROW = {"Pclass": 3, "Name": "Braund, Mr. Owen Harris", "Sex": "male", "Age": 22, "SibSp": 1,
+       "Parch": 0, "Ticket": "A/5 21171", "Fare": 7.25, "Cabin": "", "Embarked": "S"}
+
+
+async def chunked(body: bytes, size: int):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+async def collect(body: bytes, size: int = 7) -> list:
+    return [record async for record in iter_json_records(chunked(body, size))]
+
+
+def serve(scenario, history: DummyHistory | None = None):
+    """Runs `scenario(client)` against the app with a dummy model deployed."""
+    async def run():
+        model = Model(DummyModel(), DummyProcessor(), '1', 'dummy', histories=[history or DummyHistory()])
+        runner.set_configs(batch_size=4, batch_timeout=0.01)
+        runner.new_batcher(model)
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await scenario(client)
+        finally:
+            for batcher in runner._running_models.values():
+                batcher.close()
+            runner._running_models.clear()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("size", [1, 7, 1024])
+def test_iter_json_array(size):
+    rows = [dict(ROW, Age=age) for age in range(5)]
+    body = json.dumps(rows, indent=2).encode()
+    assert asyncio.run(collect(body, size)) == rows
+
+@pytest.mark.parametrize("size", [1, 7, 1024])
+def test_iter_ndjson(size):
+    rows = [dict(ROW, Name="Ünïcode ✓", Age=age) for age in range(5)]
+    body = ("\n".join(json.dumps(row) for row in rows) + "\n\n").encode()
+    assert asyncio.run(collect(body, size)) == rows
+
+def test_iter_empty_body():
+    assert asyncio.run(collect(b"")) == []
+    assert asyncio.run(collect(b"[]")) == []
+
+def test_iter_json_array_values_cut_at_every_position():
+    # Strings, escapes, literals and numbers can all be cut off by a chunk boundary
+    row = {"Name": "Ünïcode \\ \"quoted\"", "Fare": -1.5e+10, "Age": 0.25, "flags": [True, False, None]}
+    body = json.dumps([row, row]).encode()
+    assert asyncio.run(collect(body, 1)) == [row, row]
+
+def test_iter_malformed_array_fails_without_reading_the_rest():
+    read = []
+
+    async def chunks():
+        yield b'[{"Age": 1}, {"Age": oops}, '
+        for i in range(1000):
+            read.append(i)
+            yield json.dumps({"Age": i}).encode() + b", "
+
+    async def scenario():
+        return [record async for record in iter_json_records(chunks())]
+
+    with pytest.raises(ValueError):
+        asyncio.run(scenario())
+    assert len(read) <= 1
+
+def test_iter_ndjson_reports_malformed_lines():
+    body = b'{"Age": 1}\n{"Age": \n{"Age": 3}\n'
+    first, broken, last = asyncio.run(collect(body, 4))
+    assert first == {"Age": 1} and last == {"Age": 3}
+    assert isinstance(broken, StreamFormatError) and "line 2" in str(broken)
+
+def test_iter_truncated_array():
+    with pytest.raises(ValueError):
+        asyncio.run(collect(b'[{"a": 1}, {"a": '))
+
+def test_predict():
+    async def scenario(client):
+        response = await client.post("/predict", json=ROW)
+        assert response.status_code == 200
+        assert response.json() == {"survived": 22.0}
+
+    serve(scenario)
+
+def test_predict_batch_streams_ndjson():
+    history = DummyHistory()
+    rows = [dict(ROW, Age=age) for age in range(10)]
+    rows[3] = {"Pclass": "not a class"}
+
+    async def scenario(client):
+        body = "\n".join(json.dumps(row) for row in rows)
+        response = await client.post("/predict/batch", content=body)
+        assert response.headers["content-type"] == "application/x-ndjson"
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert len(results) == 10
+        assert "error" in results[3]
+        assert [r["survived"] for i, r in enumerate(results) if i != 3] == [float(a) for a in range(10) if a != 3]
+
+    serve(scenario, history)
+    # Every valid row is logged exactly like a single /predict call
+    assert len(history.records) == 9
+
+def test_predict_batch_reports_malformed_lines():
+    async def scenario(client):
+        body = json.dumps(dict(ROW, Age=1)) + "\nnot json\n" + json.dumps(dict(ROW, Age=3))
+        response = await client.post("/predict/batch", content=body)
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    first, broken, last = serve(scenario)
+    assert first == {"survived": 1.0} and last == {"survived": 3.0}
+    assert broken["error"].startswith("Invalid JSON on line 2")
+
+def test_predict_batch_accepts_json_array():
+    async def scenario(client):
+        response = await client.post("/predict/batch", json=[dict(ROW, Age=1), dict(ROW, Age=2)])
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    assert serve(scenario) == [{"survived": 1.0}, {"survived": 2.0}]
+
+def test_predict_batch_reports_malformed_body():
+    async def scenario(client):
+        response = await client.post("/predict/batch", content=b"[" + json.dumps(ROW).encode() + b", {")
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    results = serve(scenario)
+    assert results[0] == {"survived": 22.0}
+    assert results[-1]["error"].startswith("Invalid request body")
+
+class SlowModel:
+    def __init__(self):
+        self.rows = 0
+
+    def predict(self, data):
+        time.sleep(0.01)
+        self.rows += len(data)
+        return [1.0] * len(data)
+
+def test_closing_the_stream_cancels_pending_chunks():
+    model = SlowModel()
+
+    async def records():
+        for _ in range(64):
+            yield ROW
+
+    async def scenario():
+        bulk = InferenceRunner()
+        bulk.set_configs(batch_size=4, batch_timeout=0.001, executor_mode="thread", warmup=False)
+        bulk.new_batcher(Model(model, DummyProcessor(), '1', 'dummy', histories=[DummyHistory()]))
+        stream = bulk.run_batch_inference(records(), chunk_size=4, max_pending_chunks=8)
+        first = await anext(stream)
+        # What a disconnecting client does to the response body
+        await stream.aclose()
+        await asyncio.sleep(0.2)
+        bulk.get_active_deploy_batcher().close()
+        return first
+
+    assert asyncio.run(scenario()) == {"survived": 1.0}
+    # Only the batches already being scored when the client left, not all 32 rows in flight
+    assert model.rows <= 12
+
+def test_history_pages(tmp_path):
+    history = HistorySQLite(str(tmp_path / "history.db"))
+    history.create_table()
+    model_hub.set_configs(ModelServiceProviderConfigs(histories=[history]))
+    for i in range(5):
+        history.insert_history(model_name="dummy", variant="deploy", model_version=str(i % 2),
+                               input_data=ROW, prediction=i)
+    history.flush()
+
+    async def scenario(client):
+        pages, cursor = [], None
+        while True:
+            params = {"model_version": "0", "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            body = (await client.get("/history", params=params)).json()
+            pages.append([record["prediction"] for record in body["items"]])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+        invalid = await client.get("/history", params={"cursor": "garbage"})
+        return pages, invalid.status_code
+
+    try:
+        pages, invalid_status = serve(scenario)
+    finally:
+        history.close_connection()
+        model_hub.set_configs(ModelServiceProviderConfigs())
+    assert pages == [[0.0, 2.0], [4.0]]
+    assert invalid_status == 400
+
+def test_history_naive_times_are_utc(tmp_path, monkeypatch):
+    # Hours away from UTC, so reading the naive times as local time would miss every record
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    history = HistorySQLite(str(tmp_path / "history.db"))
+    history.create_table()
+    model_hub.set_configs(ModelServiceProviderConfigs(histories=[history]))
+    history.insert_history(model_name="dummy", variant="deploy", model_version="1", input_data=ROW, prediction=1)
+    history.flush()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    window = {"start_time": (now - timedelta(minutes=1)).isoformat(),
+              "end_time": (now + timedelta(minutes=1)).isoformat()}
+
+    async def scenario(client):
+        naive = (await client.get("/history", params=window)).json()
+        aware = (await client.get("/history", params={name: f"{value}+00:00" for name, value in window.items()}))
+        return naive, aware.json()
+
+    try:
+        naive, aware = serve(scenario)
+    finally:
+        history.close_connection()
+        model_hub.set_configs(ModelServiceProviderConfigs())
+        monkeypatch.undo()
+        time.tzset()
+    assert [record["prediction"] for record in naive["items"]] == [1.0]
+    assert naive == aware
+
+class ConstantModel:
+    def predict(self, data):
+        return [1.0] * len(data)
+
+def test_deploy_switches_traffic(tmp_path):
+    model_hub._loaded_models["constant(2)"] = (DummyProcessor(), ConstantModel())
+    history = HistorySQLite(str(tmp_path / "history.db"))
+    history.create_table()
+    model_hub.set_configs(ModelServiceProviderConfigs(histories=[history]))
+
+    async def scenario(client):
+        before = (await client.post("/predict", json=ROW)).json()
+        missing = (await client.post("/deploy", json={"model_name": "missing", "model_version": "1"})).json()
+        deployed = (await client.post("/deploy", json={"model_name": "constant", "model_version": "2"})).json()
+        after = (await client.post("/predict", json=ROW)).json()
+        return before, missing, deployed, after
+
+    try:
+        runner.set_configs(warmup_rows=8)
+        before, missing, deployed, after = serve(scenario)
+    finally:
+        del model_hub._loaded_models["constant(2)"]
+        history.close()
+        history.close_connection()
+        model_hub.set_configs(ModelServiceProviderConfigs())
+    assert before == {"survived": 22.0}
+    assert missing["status"].startswith("Failed")
+    assert deployed == {"status": "Model deployed successfully", "model_name": "constant",
+                        "model_version": "2", "variant": "deploy"}
+    assert after == {"survived": 1.0}
+
+def test_bandit_feedback_shifts_traffic():
+    model_hub._loaded_models["dummy(1)"] = (DummyProcessor(), DummyModel())
+    model_hub._loaded_models["constant(2)"] = (DummyProcessor(), ConstantModel())
+    model_hub.set_configs(ModelServiceProviderConfigs(histories=[DummyHistory()]))
+
+    async def scenario(client):
+        assert (await client.get("/ab-test/bandit")).status_code == 404
+        started = await client.post("/ab-test", json={"name_a": "dummy", "version_a": "1", "name_b": "constant",
+                                                     "version_b": "2", "mode": "bandit"})
+        assert started.status_code == 200
+        for _ in range(60):
+            variant = (await client.post("/predict", json=ROW)).json()["variant"]
+            reward = 1.0 if variant == "B" else 0.0
+            response = await client.post("/ab-test/feedback", json={"variant": variant, "reward": reward})
+            assert response.status_code == 200
+        bad = await client.post("/ab-test/feedback", json={"variant": "C", "reward": 1.0})
+        return bad, (await client.get("/ab-test/bandit")).json()
+
+    try:
+        runner.set_configs(warmup_rows=8)
+        bad, state = serve(scenario)
+    finally:
+        del model_hub._loaded_models["dummy(1)"], model_hub._loaded_models["constant(2)"]
+        model_hub.set_configs(ModelServiceProviderConfigs())
+        runner.set_configs(ab_test_mode=None)
+        runner.ab_test = None
+    assert bad.status_code == 400
+    assert state["policy"] == "thompson"
+    variant_A, variant_B = state["variants"]
+    assert variant_A["variant"] == "A" and variant_B["variant"] == "B"
+    assert variant_B["pulls"] > variant_A["pulls"] and variant_B["allocation"] > 0.8
+
+def test_saturated_predict_returns_429():
+    async def scenario(client):
+        responses = await asyncio.gather(*(client.post("/predict", json=ROW) for _ in range(12)))
+        timed_out = await client.post("/predict", json=ROW, headers={"X-Request-Timeout": "0"})
+        return responses, timed_out
+
+    try:
+        runner.set_configs(max_queue_size=2)
+        responses, timed_out = serve(scenario)
+    finally:
+        runner.set_configs(max_queue_size=1024)
+    statuses = [response.status_code for response in responses]
+    assert 200 in statuses and 429 in statuses
+    shed = next(response for response in responses if response.status_code == 429)
+    assert int(shed.headers["Retry-After"]) >= 1
+    assert timed_out.status_code == 503 and "Retry-After" in timed_out.headers
+
+
+def test_server_timing_breaks_down_predict():
+    async def scenario(client):
+        traced = await client.post("/predict", json=ROW)
+        untraced = await client.get("/health")
+        return traced, untraced
+
+    inference = STAGE_SECONDS.labels("inference")
+    before = inference._sum.get()
+    try:
+        tracer.set_configs(enabled=True, server_timing=True)
+        traced, untraced = serve(scenario)
+        tracer.set_configs()
+        plain = serve(lambda client: client.post("/predict", json=ROW))
+    finally:
+        tracer.set_configs()
+    stages = dict(entry.split(";dur=") for entry in traced.headers["Server-Timing"].split(", "))
+    assert set(stages) == {"validate", "route", "batcher", "queue_wait", "build_batch", "preprocess",
+                           "inference", "logging", "respond", "total"}
+    assert float(stages["queue_wait"]) <= float(stages["batcher"]) <= float(stages["total"])
+    assert inference._sum.get() > before
+    assert "Server-Timing" not in untraced.headers and "Server-Timing" not in plain.headers
+
+def test_bulk_rows_are_not_traced():
+    body = "\n".join(json.dumps(dict(ROW, Age=age)) for age in range(50)).encode()
+    route = STAGE_SECONDS.labels("route")
+    before = route._sum.get()
+    try:
+        tracer.set_configs(enabled=True, server_timing=True)
+        response = serve(lambda client: client.post("/predict/batch", content=body))
+    finally:
+        tracer.set_configs()
+    assert len(response.text.splitlines()) == 50
+    # Rows share the upload's context; none of them may add spans to its trace
+    assert route._sum.get() == before
+    assert "route" not in response.headers.get("Server-Timing", "")
+
+def test_profile_endpoint_returns_collapsed_stacks():
+    async def scenario(client):
+        profile = asyncio.create_task(client.get("/admin/profile", params={"seconds": 0.3, "interval": 0.002}))
+        await asyncio.sleep(0.05)
+        busy = await client.get("/admin/profile", params={"seconds": 0.1})
+        await asyncio.gather(*(client.post("/predict", json=ROW) for _ in range(20)))
+        return await profile, busy
+
+    profile, busy = serve(scenario)
+    assert profile.status_code == 200 and busy.status_code == 409
+    lines = profile.text.splitlines()
+    assert lines and all(line.startswith("MainThread;") and line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_metrics_served_with_prometheus_enabled():
+    # The switch is read when app.main is imported, so the app starts in a fresh interpreter
+    code = ("from fastapi.testclient import TestClient\n"
+            "from app.main import app\n"
+            "with TestClient(app) as client:\n"
+            "    response = client.get('/metrics')\n"
+            "    print(response.status_code, 'request_stage_seconds' in response.text)\n")
+    env = {**os.environ, "USE_PROMETHEUS": "true", "USE_MLFLOW": "false", "HISTORY_SQLITE": "false",
+           "TELEMETRY_BUS": "false", "LOOP_STALL_THRESHOLD": "0"}
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=60)
+    assert output.returncode == 0, output.stderr
+    assert output.stdout.split() == ["200", "True"]
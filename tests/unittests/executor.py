@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.api.models import PredictRequest
+from app.serve.batcher import Batcher
+from app.serve.executor import ExecutorMode, ExecutorShutdown, InferenceExecutor
+from app.serve.model import Model, RequestItem
+
+
+class DummyModel:
+    def predict(self, data):
+        return [float(age) for age in data["Age"]]
+
+class SlowModel:
+    def __init__(self):
+        self.threads = set()
+
+    def predict(self, data):
+        self.threads.add(threading.get_ident())
+        time.sleep(0.05)
+        return [0.5] * len(data)
+
+class FailingModel:
+    def predict(self, data):
+        raise RuntimeError("boom")
+
+class DummyHistory:
+    def __init__(self):
+        self.records = []
+
+    def insert_history(self, **kwargs):
+        self.records.append(kwargs)
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+
+def make_request(age: int = 22) -> PredictRequest:
+    return PredictRequest(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=age, SibSp=1,
+                          Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S")
+
+
+def make_model(estimator, history=None) -> Model:
+    return Model(estimator, DummyProcessor(), '1', 'dummy', histories=[history or DummyHistory()])
+
+
+@pytest.mark.parametrize("mode", list(ExecutorMode))
+def test_executor_modes_predict(mode):
+    async def scenario():
+        history = DummyHistory()
+        model = make_model(DummyModel(), history)
+        executor = InferenceExecutor(model, mode=mode, max_workers=2, max_in_flight=2)
+        batcher = Batcher(model, batch_size=4, batch_timeout=0.01, executor=executor)
+        results = await asyncio.gather(*(batcher.queue_request(make_request(age)) for age in range(8)))
+        batcher.close()
+        assert results == [float(age) for age in range(8)]
+        assert len(history.records) == 8
+
+    asyncio.run(scenario())
+
+def test_thread_executor_runs_batches_in_parallel():
+    async def scenario():
+        estimator = SlowModel()
+        model = make_model(estimator)
+        executor = InferenceExecutor(model, mode=ExecutorMode.thread, max_workers=4, max_in_flight=4)
+        batcher = Batcher(model, batch_size=1, batch_timeout=0.01, executor=executor)
+        start = time.perf_counter()
+        await asyncio.gather(*(batcher.queue_request(make_request()) for _ in range(4)))
+        elapsed = time.perf_counter() - start
+        batcher.close()
+        assert threading.get_ident() not in estimator.threads
+        # Four 50ms batches scored one after the other would take at least 200ms
+        assert elapsed < 0.15
+
+    asyncio.run(scenario())
+
+def test_in_flight_batches_are_bounded():
+    async def scenario():
+        model = make_model(SlowModel())
+        executor = InferenceExecutor(model, mode=ExecutorMode.thread, max_workers=4, max_in_flight=2)
+        batcher = Batcher(model, batch_size=1, batch_timeout=0.01, executor=executor)
+        pending = [asyncio.create_task(batcher.queue_request(make_request())) for _ in range(6)]
+        await asyncio.sleep(0.02)
+        assert executor.in_flight <= 2
+        await asyncio.gather(*pending)
+        batcher.close()
+
+    asyncio.run(scenario())
+
+@pytest.mark.parametrize("mode", [ExecutorMode.thread, ExecutorMode.process])
+def test_pooled_errors_are_propagated(mode):
+    async def scenario():
+        model = make_model(FailingModel())
+        executor = InferenceExecutor(model, mode=mode, max_workers=1)
+        batcher = Batcher(model, batch_size=2, batch_timeout=0.01, executor=executor)
+        with pytest.raises(RuntimeError):
+            await batcher.queue_request(make_request())
+        batcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_shutdown_fails_batches_waiting_for_a_worker():
+    async def scenario():
+        # One worker: the second batch waits in the pool's queue until shutdown cancels it
+        executor = InferenceExecutor(make_model(SlowModel()), mode=ExecutorMode.thread, max_workers=1,
+                                     max_in_flight=2)
+        batches = [[RequestItem(make_request())] for _ in range(2)]
+        for batch in batches:
+            await executor.submit(batch)
+        await asyncio.sleep(0.01)
+        executor.shutdown()
+        futures = [batch[0].future for batch in batches]
+        return await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), 1)
+
+    scored, cancelled = asyncio.run(scenario())
+    assert scored == 0.5
+    assert isinstance(cancelled, ExecutorShutdown)
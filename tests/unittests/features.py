@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from app.api.models import PredictRequest
+from app.features import TitanicFeatures, engineer
+from app.serve.columnar import build_batch, transform_batch
+from app.serve.compiler import compile_pipeline
+from app.serve.model import score
+from app.serve.warmup import synthetic_rows
+from train.train import build_preprocessor
+
+
+PASSENGERS = [
+    dict(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=22, SibSp=1, Parch=0, Ticket="A/5 21171",
+         Fare=7.25, Cabin=None, Embarked="S"),
+    dict(Pclass=1, Name="Cumings, Mrs. John Bradley (Florence Briggs Thayer)", Sex="female", Age=38, SibSp=1,
+         Parch=0, Ticket="PC 17599", Fare=71.2833, Cabin="C85", Embarked="C"),
+    dict(Pclass=1, Name="Rothes, the Countess. of (Lucy Noel Martha Dyer-Edwards)", Sex="female", Age=33, SibSp=0,
+         Parch=0, Ticket="110152", Fare=86.5, Cabin="B77", Embarked="S"),
+    dict(Pclass=1, Name="Fortune, Mr. Charles Alexander", Sex="male", Age=19, SibSp=3, Parch=2, Ticket="19950",
+         Fare=263.0, Cabin="C23 C25 C27", Embarked="S"),
+    dict(Pclass=2, Name="Aubart, Mme. Leontine Pauline", Sex="female", Age=24, SibSp=0, Parch=0,
+         Ticket="PC 17477", Fare=69.3, Cabin="B35", Embarked=None),
+    dict(Pclass=3, Name="Nosuchtitle", Sex="male", Age=30, SibSp=0, Parch=0, Ticket="S.O./P.P. 751", Fare=7.0,
+         Cabin="", Embarked="Q"),
+]
+
+
+def test_engineered_columns():
+    engineered, codes = engineer(pd.DataFrame(PASSENGERS))
+    assert list(engineered["Title"]) == ["Mr", "Mrs", "Rare", "Mr", "Mrs", "Rare"]
+    assert list(engineered["Deck"]) == ["U", "C", "B", "C", "B", "U"]
+    assert list(engineered["TicketPrefix"]) == ["A", "PC", "NONE", "NONE", "PC", "SO"]
+    assert list(engineered["CabinCount"]) == [0, 1, 1, 3, 1, 0]
+    assert list(engineered["FamilySize"]) == [2, 2, 1, 6, 1, 1]
+    assert list(engineered["IsAlone"]) == [0, 0, 1, 0, 1, 1]
+    assert engineered["FarePerPerson"][3] == 263.0 / 6
+    assert codes["Title"].dtype == np.int8
+
+
+def test_offline_and_online_features_match():
+    # Offline rows have NaN where requests have empty strings
+    frame = pd.DataFrame(PASSENGERS)
+    rows = [PredictRequest(**{field: "" if value is None else value for field, value in passenger.items()})
+            for passenger in PASSENGERS]
+    offline = TitanicFeatures().fit(frame).transform(frame)
+    online = TitanicFeatures().extend(build_batch(rows)).to_frame()
+    for field in ("Title", "Deck", "TicketPrefix", "CabinCount", "FamilySize", "IsAlone", "FarePerPerson"):
+        assert list(offline[field]) == list(online[field]), field
+
+
+def test_feature_pipeline_serves_and_compiles():
+    rows = synthetic_rows(400)
+    frame = build_batch(rows).to_frame()
+    target = ((frame["Age"] < 30) ^ (frame["Sex"] == "female") ^ (frame["Cabin"] == "")).astype(int)
+    preprocessor = build_preprocessor().fit(frame, target)
+    model = RandomForestClassifier(n_estimators=20, random_state=0).fit(preprocessor.transform(frame), target)
+
+    batch = build_batch(rows[:50])
+    expected = model.predict(preprocessor.transform(frame[:50]))
+    assert np.array_equal(model.predict(transform_batch(preprocessor, batch)), expected)
+
+    compiled = compile_pipeline(preprocessor, model, synthetic_rows(64))
+    assert compiled is not None
+    assert np.array_equal(score(*compiled, batch)[0], score(preprocessor, model, batch)[0])
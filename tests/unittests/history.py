@@ -0,0 +1,302 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app.api.models import PredictRequest
+from app.loggers.history.base import HistoryFilter, decode_cursor, encode_cursor
+from app.loggers.history.lite import DropPolicy, HistorySQLite
+from app.loggers.history.object_store import LocalObjectStore
+from app.loggers.history.segments import HistorySegments
+
+
+REQUEST = PredictRequest(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=22, SibSp=1,
+                         Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S")
+
+
+class BlockedHistorySQLite(HistorySQLite):
+    """Writer that holds every batch until `release` is set."""
+    def __init__(self, *args, **kwargs):
+        self.release = threading.Event()
+        super().__init__(*args, **kwargs)
+
+    def _write(self, conn, rows):
+        self.release.wait(5)
+        super()._write(conn, rows)
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / "deploy" / "history.db")
+
+
+def make_history(db_file, cls=HistorySQLite, **kwargs) -> HistorySQLite:
+    history = cls(db_file, **kwargs)
+    history.create_table()
+    return history
+
+
+def count_rows(db_file) -> int:
+    with sqlite3.connect(db_file) as conn:
+        return conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+
+def insert(history: HistorySQLite, prediction: float = 1.0, input_data=REQUEST):
+    history.insert_history(model_name="dummy", variant="deploy", model_version="1",
+                           input_data=input_data, prediction=prediction)
+
+
+def test_insert_is_written_in_background(db_file):
+    history = make_history(db_file)
+    for i in range(1000):
+        insert(history, prediction=i)
+    history.flush()
+    assert count_rows(db_file) == 1000
+    history.close_connection()
+
+def test_input_data_is_serialized(db_file):
+    history = make_history(db_file)
+    insert(history, input_data=REQUEST)
+    insert(history, input_data={"Age": 3})
+    history.close()
+    rows = history.fetch_history()
+    assert json.loads(rows[0][4]) == REQUEST.model_dump()
+    assert json.loads(rows[1][4]) == {"Age": 3}
+    history.close_connection()
+
+def test_uses_wal(db_file):
+    history = make_history(db_file)
+    assert history.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    history.close_connection()
+
+def test_close_flushes_pending_records(db_file):
+    # Neither the row count nor the interval would trigger a write before close()
+    history = make_history(db_file, batch_rows=10_000, flush_interval=60)
+    for _ in range(10):
+        insert(history)
+    history.close()
+    assert count_rows(db_file) == 10
+    history.close_connection()
+
+def test_drop_newest_when_full(db_file):
+    history = make_history(db_file, cls=BlockedHistorySQLite, batch_rows=1, max_queue=2,
+                           drop_policy=DropPolicy.drop_newest)
+    for i in range(10):
+        insert(history, prediction=i)
+    assert history.dropped > 0
+    history.release.set()
+    history.close()
+    predictions = [row[5] for row in history.fetch_history()]
+    assert len(predictions) == 10 - history.dropped
+    assert predictions == sorted(predictions)
+    assert 9.0 not in predictions
+    history.close_connection()
+
+def test_drop_oldest_when_full(db_file):
+    history = make_history(db_file, cls=BlockedHistorySQLite, batch_rows=1, max_queue=2,
+                           drop_policy=DropPolicy.drop_oldest)
+    for i in range(10):
+        insert(history, prediction=i)
+    assert history.dropped > 0
+    history.release.set()
+    history.close()
+    predictions = [row[5] for row in history.fetch_history()]
+    assert len(predictions) == 10 - history.dropped
+    assert predictions[-1] == 9.0
+    history.close_connection()
+
+def populate(history: HistorySQLite):
+    for i in range(30):
+        history.insert_history(model_name="titanic" if i % 2 else "other", variant="A" if i % 3 else "B",
+                               model_version=str(i % 5), input_data=REQUEST, prediction=i)
+    history.flush()
+
+def test_iter_history_filters(db_file):
+    history = make_history(db_file)
+    populate(history)
+    records = list(history.iter_history(HistoryFilter(model_name="titanic", model_version="1")))
+    assert [r["prediction"] for r in records] == [1.0, 11.0, 21.0]
+    records = list(history.iter_history(HistoryFilter(model_name="titanic", variant="B")))
+    assert [r["prediction"] for r in records] == [3.0, 9.0, 15.0, 21.0, 27.0]
+    history.close_connection()
+
+def test_iter_history_time_range(db_file):
+    history = make_history(db_file)
+    for i in range(30):
+        insert(history, prediction=i)
+        if i % 10 == 9:
+            # Commit in three groups, each stamped with its own created_at
+            history.flush()
+            time.sleep(0.01)
+    created = [r["created_at"] for r in history.iter_history(HistoryFilter())]
+    assert created == sorted(created)
+    records = list(history.iter_history(HistoryFilter(start_time=created[10], end_time=created[20])))
+    assert [r["prediction"] for r in records] == [float(i) for i in range(10, 20)]
+    records = list(history.iter_history(HistoryFilter(start_time=created[-1] + 1)))
+    assert records == []
+    history.close_connection()
+
+def test_iter_history_keyset_pages(db_file):
+    history = make_history(db_file)
+    populate(history)
+    seen, after_id = [], None
+    while True:
+        page = list(history.iter_history(HistoryFilter(model_name="titanic"), after_id, limit=4))
+        if not page:
+            break
+        seen.extend(r["prediction"] for r in page)
+        after_id = page[-1]["id"]
+    assert seen == [float(i) for i in range(1, 30, 2)]
+    history.close_connection()
+
+def test_recent_history_is_the_newest_records(db_file):
+    history = make_history(db_file)
+    populate(history)
+    assert [r["prediction"] for r in history.recent_history(5)] == [25.0, 26.0, 27.0, 28.0, 29.0]
+    assert len(history.recent_history(100)) == 30
+    history.close_connection()
+
+def test_filtered_queries_use_indexes(db_file):
+    history = make_history(db_file)
+    plan = history.conn.execute("EXPLAIN QUERY PLAN SELECT * FROM history WHERE model_name = ? "
+                                "AND model_version = ? AND id > ? ORDER BY id LIMIT 10", ("a", "1", 5)).fetchall()
+    assert "idx_history_model" in str(plan)
+    history.close_connection()
+
+def test_create_table_migrates_old_schema(db_file):
+    history = HistorySQLite(db_file)
+    history.conn.execute("CREATE TABLE history (id INTEGER PRIMARY KEY AUTOINCREMENT, model_name TEXT NOT NULL, "
+                         "variant TEXT NOT NULL, model_version TEXT NOT NULL, input_data TEXT NOT NULL, "
+                         "prediction FLOAT NOT NULL);")
+    history.conn.execute("INSERT INTO history (model_name, variant, model_version, input_data, prediction) "
+                         "VALUES ('old', 'deploy', '1', '{}', 0.5);")
+    history.conn.commit()
+    history.create_table()
+    insert(history)
+    history.flush()
+    records = list(history.iter_history(HistoryFilter()))
+    assert records[0]["created_at"] == 0
+    assert records[1]["created_at"] > 0
+    history.close_connection()
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(12345)) == 12345
+    assert decode_cursor(None) is None
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+def make_segments(tmp_path, **kwargs) -> HistorySegments:
+    # Reads right after a flush: nothing else writes to the bucket unless a test says so
+    kwargs.setdefault("settle_time", 0)
+    return HistorySegments(LocalObjectStore(str(tmp_path / "bucket")), **kwargs)
+
+def test_segments_are_partitioned(tmp_path):
+    history = make_segments(tmp_path, flush_interval=60)
+    populate(history)
+    history.close()
+    keys = list(history.store.list("history/"))
+    # One segment per (model name, model version) partition of today's date
+    assert len(keys) == 10
+    assert all(key.endswith(".ndjson.gz") and "/date=" in key for key in keys)
+    assert [r["prediction"] for r in history.iter_history(HistoryFilter())] == [float(i) for i in range(30)]
+
+def test_segments_filters_and_pages(tmp_path):
+    history = make_segments(tmp_path, flush_interval=60)
+    populate(history)
+    populate(history)
+    history.close()
+    records = list(history.iter_history(HistoryFilter(model_name="titanic", model_version="1")))
+    assert [r["prediction"] for r in records] == [1.0, 11.0, 21.0] * 2
+    seen, after_id = [], None
+    while page := list(history.iter_history(HistoryFilter(model_name="titanic", variant="B"), after_id, limit=3)):
+        seen.extend(r["prediction"] for r in page)
+        after_id = page[-1]["id"]
+    assert seen == [3.0, 9.0, 15.0, 21.0, 27.0] * 2
+
+def test_segments_recent_history_reads_the_newest_segments(tmp_path):
+    history = make_segments(tmp_path, flush_interval=60)
+    populate(history)
+    history.flush()
+    # The second batch of segments holds the 12 newest records
+    for i in range(12):
+        insert(history, prediction=100 + i)
+    history.close()
+    read = []
+    get = history.store.get
+    history.store.get = lambda key: read.append(key) or get(key)
+    assert [r["prediction"] for r in history.recent_history(5)] == [107.0, 108.0, 109.0, 110.0, 111.0]
+    assert len(read) == 1
+    assert [r["prediction"] for r in history.recent_history(14)][:3] == [28.0, 29.0, 100.0]
+
+def test_segments_only_read_matching_partitions(tmp_path):
+    history = make_segments(tmp_path, flush_interval=60)
+    populate(history)
+    history.close()
+    listed, read = [], []
+    list_keys, get = history.store.list, history.store.get
+    history.store.list = lambda prefix: listed.append(prefix) or list_keys(prefix)
+    history.store.get = lambda key: read.append(key) or get(key)
+    list(history.iter_history(HistoryFilter(model_name="titanic", model_version="3")))
+    assert listed == ["history/model_name=titanic/model_version=3/"]
+    assert len(read) == 1
+    read.clear()
+    list(history.iter_history(HistoryFilter(start_time=time.time() + 1)))
+    assert read == []
+
+def test_segments_background_flush(tmp_path):
+    history = make_segments(tmp_path, flush_interval=0.01)
+    insert(history)
+    deadline = time.time() + 5
+    while not list(history.store.list("history/")) and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(list(history.iter_history(HistoryFilter()))) == 1
+    history.close()
+
+def test_segments_keep_records_when_upload_fails(tmp_path):
+    history = make_segments(tmp_path, flush_interval=60)
+    put = history.store.put
+    history.store.put = lambda key, body: (_ for _ in ()).throw(OSError("unavailable"))
+    insert(history, prediction=1)
+    history.flush()
+    history.store.put = put
+    insert(history, prediction=2)
+    history.close()
+    assert [r["prediction"] for r in history.iter_history(HistoryFilter())] == [1.0, 2.0]
+
+
+def test_segments_cursor_waits_for_unflushed_records(tmp_path):
+    history = make_segments(tmp_path, flush_interval=60)
+    other = make_segments(tmp_path, flush_interval=60)
+    insert(history, prediction=1)
+    insert(other, prediction=2)
+    other.flush()
+    # The newer record is in the bucket, but handing it out would let a cursor skip the older one
+    assert list(history.iter_history(HistoryFilter())) == []
+    history.flush()
+    assert [r["prediction"] for r in history.iter_history(HistoryFilter())] == [1.0, 2.0]
+    # Records of other writers are readable once they had time to flush
+    settling = make_segments(tmp_path, flush_interval=60, settle_time=30)
+    assert list(settling.iter_history(HistoryFilter())) == []
+    history.close()
+    other.close()
+
+def test_segments_forked_writer_gets_its_own_tag(tmp_path, monkeypatch):
+    history = make_segments(tmp_path, flush_interval=60)
+    insert(history)
+    child_tag = (history._writer_tag + 1) % (1 << 11)
+    monkeypatch.setattr("app.loggers.history.segments.random.getrandbits", lambda bits: child_tag)
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write, json.dumps([history._writer_tag, history._buffered_rows]).encode())
+        os._exit(0)
+    os.close(write)
+    os.waitpid(pid, 0)
+    with os.fdopen(read) as f:
+        tag, buffered = json.load(f)
+    # The child draws a tag of its own, and the parent's records are the parent's to upload
+    assert tag == child_tag and buffered == 0
+    history.close()
@@ -0,0 +1,158 @@
+import time
+
+from prometheus_client import REGISTRY
+
+from app.loggers import log_inference
+from app.loggers.extensions import prometheus
+from app.loggers.extensions.mlflow import AggregatedMLFlowLogger, registration_runs
+from app.loggers.extensions.prometheus import PrometheusLogger
+from app.serve import model_server
+from app.serve.model_server import ModelServiceProvider, ModelServiceProviderConfigs
+
+
+class DummyVersion:
+    def __init__(self, run_id):
+        self.run_id = run_id
+
+class DummyRun:
+    def __init__(self, run_id):
+        self.info = DummyVersion(run_id)
+
+class DummyExperiment:
+    experiment_id = "0"
+
+class DummyMlflowClient:
+    def __init__(self, delay: float = 0.0, fail: bool = False, unnamed: tuple[str, ...] = ()):
+        self.delay = delay
+        self.fail = fail
+        # Run names no registration run has, e.g. models served without going through the registry
+        self.unnamed = unnamed
+        self.production = "run-production"
+        self.lookups = 0
+        self.batches = []
+
+    def search_experiments(self):
+        return [DummyExperiment()]
+
+    def search_runs(self, experiment_ids, filter_string, max_results, order_by):
+        self.lookups += 1
+        run_name = filter_string.split("'")[1]
+        if run_name in self.unnamed:
+            return []
+        return [DummyRun("run-" + run_name.removeprefix("register_").replace("_", "-"))]
+
+    def get_latest_versions(self, name, stages):
+        return [DummyVersion(self.production)]
+
+    def log_batch(self, run_id, metrics=(), tags=()):
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("mlflow is down")
+        self.batches.append((run_id, {m.key: m.value for m in metrics}))
+
+
+def log_rows(logger, n: int, variant: str = "A", version: str = "1"):
+    for i in range(n):
+        log_inference(model_name="titanic", input_data={}, prediction=i % 2, latency=float(i + 1),
+                      variant=variant, model_version=version, wait_time=0.5, inference_time=0.25, loggers=[logger])
+
+
+def test_aggregates_window_into_one_batch():
+    client = DummyMlflowClient()
+    logger = AggregatedMLFlowLogger(client, window=60)
+    log_rows(logger, 100, variant="A")
+    log_rows(logger, 10, variant="B")
+    log_rows(logger, 5, version="2")
+    logger.close()
+    batches = dict(client.batches)
+    assert set(batches) == {"run-titanic-1", "run-titanic-2"}
+    metrics = batches["run-titanic-1"]
+    assert metrics["A.count"] == 100 and metrics["B.count"] == 10
+    assert metrics["A.latency_ms_mean"] == 50.5
+    assert 49 <= metrics["A.latency_ms_p50"] <= 52 and metrics["A.latency_ms_p99"] >= 99
+    assert metrics["A.prediction_positive_rate"] == 0.5
+    assert metrics["A.wait_time_ms_mean"] == 0.5
+
+def test_run_id_is_cached_per_version():
+    client = DummyMlflowClient()
+    logger = AggregatedMLFlowLogger(client, window=60)
+    for _ in range(3):
+        log_rows(logger, 10)
+        logger.flush()
+    logger.close()
+    assert client.lookups == 1
+    assert len(client.batches) == 3
+
+def test_summaries_go_to_the_run_that_registered_the_app_version(monkeypatch):
+    # The registry numbers versions itself, so app version "1" is registry version 3 here
+    registrations = iter([("3", "run-one"), ("4", "run-two")])
+    monkeypatch.setattr(model_server, "log_model_to_mlflow_and_register", lambda **kwargs: next(registrations))
+    hub = ModelServiceProvider(ModelServiceProviderConfigs(histories=[]))
+    try:
+        assert hub.register_model(object(), object(), "1", "titanic")[1] == "3"
+        assert hub.register_model(object(), object(), "2", "titanic")[1] == "4"
+        client = DummyMlflowClient()
+        logger = AggregatedMLFlowLogger(client, window=60)
+        log_rows(logger, 10, version="1")
+        log_rows(logger, 10, version="2")
+        logger.close()
+    finally:
+        registration_runs.clear()
+    assert sorted(run_id for run_id, _ in client.batches) == ["run-one", "run-two"]
+    assert client.lookups == 0
+
+def test_production_fallback_is_not_cached():
+    client = DummyMlflowClient(unnamed=("register_titanic_1",))
+    logger = AggregatedMLFlowLogger(client, window=60)
+    log_rows(logger, 10)
+    logger.flush()
+    client.production = "run-redeployed"
+    log_rows(logger, 10)
+    logger.close()
+    assert [run_id for run_id, _ in client.batches] == ["run-production", "run-redeployed"]
+
+def test_slow_mlflow_does_not_block_logging():
+    client = DummyMlflowClient(delay=0.5)
+    logger = AggregatedMLFlowLogger(client, window=0.01)
+    log_rows(logger, 1)
+    time.sleep(0.05)   # let the worker start a slow push
+    start = time.perf_counter()
+    log_rows(logger, 1000)
+    assert time.perf_counter() - start < 0.2
+    logger.close()
+
+def test_failed_push_is_counted():
+    client = DummyMlflowClient(fail=True)
+    logger = AggregatedMLFlowLogger(client, window=60)
+    log_rows(logger, 10)
+    logger.close()
+    assert logger.failed_pushes == 1
+
+
+def sample(name: str, variant: str = "A", **extra) -> float:
+    labels = {"model_name": "prom", "model_version": "1", "variant": variant, **extra}
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def test_prometheus_records_histograms_in_process():
+    logger = PrometheusLogger()
+    before = sample("model_predictions_total", "B")
+    for i in range(10):
+        log_inference(model_name="prom", input_data={}, prediction=i % 2, latency=2.0, variant="B",
+                      model_version="1", wait_time=1.0, inference_time=0.5, loggers=[logger])
+    logger.log_batch_size("prom", "1", "B", 10)
+    assert sample("model_predictions_total", "B") - before == 10
+    assert sample("model_inference_latency_seconds_count", "B") >= 10
+    assert sample("model_inference_latency_seconds_bucket", "B", le="0.0025") >= 10
+    assert sample("model_inference_queue_wait_seconds_sum", "B") >= 10 * 0.001
+    assert sample("model_prediction_value_bucket", "B", le="0.1") >= 5
+    assert sample("model_inference_batch_size_bucket", "B", le="16.0") >= 1
+
+def test_prometheus_push_is_optional(monkeypatch):
+    pushes = []
+    monkeypatch.setattr(prometheus, "push_to_gateway", lambda *args, **kwargs: pushes.append(kwargs["job"]))
+    PrometheusLogger().close()
+    assert pushes == []
+    logger = PrometheusLogger(push_interval=0.01)
+    time.sleep(0.05)
+    logger.close()
+    assert len(pushes) >= 2
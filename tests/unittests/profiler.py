@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+
+from app.serve.profiler import LoopLagMonitor, SamplingProfiler
+
+
+def spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+def blocking_call(seconds: float):
+    time.sleep(seconds)
+
+
+def test_profile_collapses_sampled_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=spin, args=(stop,), name="spinner")
+    worker.start()
+    try:
+        profiler = SamplingProfiler()
+        stacks = profiler.profile(0.2, interval=0.005, thread_id=worker.ident)
+    finally:
+        stop.set()
+        worker.join()
+    lines = profiler.format(stacks).splitlines()
+    assert lines and all(line.startswith("spinner;") for line in lines)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == sum(stacks.values()) >= 10
+    assert all("spin (unittests/profiler.py:" in stack for stack in stacks)
+
+
+def test_only_one_profile_at_a_time():
+    profiler = SamplingProfiler()
+    profiler._lock.acquire()
+    try:
+        profiler.profile(0.01)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("A second profile should be refused")
+    finally:
+        profiler._lock.release()
+
+
+def test_loop_stall_is_recorded_with_its_stack():
+    async def scenario():
+        monitor = LoopLagMonitor(threshold=0.05, interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        blocking_call(0.3)
+        await asyncio.sleep(0.05)
+        monitor.stop()
+        return list(monitor.stalls)
+
+    stalls = asyncio.run(scenario())
+    assert len(stalls) == 1
+    assert stalls[0]["duration"] >= 0.2
+    assert stalls[0]["stack"][-1].startswith("blocking_call (unittests/profiler.py:")
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import pytest
+
+from app.api.models import PredictRequest
+from app.serve.ab_test.ab import ABTestMode
+from app.serve.ab_test.routing import RampSchedule, TrafficRouter, bucket_table, stable_hash
+from app.serve.inference import InferenceRunner
+from app.serve.model import Model
+
+
+class ConstantModel:
+    def __init__(self, value: float):
+        self.value = value
+
+    def predict(self, data):
+        return [self.value] * len(data)
+
+class DummyHistory:
+    def insert_history(self, **kwargs):
+        pass
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+
+USERS = [f"user-{i}" for i in range(20_000)]
+
+
+def test_stable_hash_is_the_same_in_every_process():
+    # Pinned: changing the hash would move every user to another variant
+    assert stable_hash("user-1") == 4186229313
+    code = "from app.serve.ab_test.routing import stable_hash; print(stable_hash('user-1', 12345))"
+    env = {**os.environ, "PYTHONHASHSEED": "123"}
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert int(output.stdout) == stable_hash("user-1", 12345)
+
+
+def test_weighted_split_over_n_variants():
+    router = TrafficRouter([70, 20, 10], salt="experiment")
+    counts = Counter(router.route(user) for user in USERS)
+    for index, share in enumerate((0.7, 0.2, 0.1)):
+        assert abs(counts[index] / len(USERS) - share) < 0.02
+    # Sticky: the same user always gets the same variant, also from another router of the experiment
+    other = TrafficRouter([70, 20, 10], salt="experiment")
+    assert all(router.route(user) == other.route(user) for user in USERS[:1000])
+    assert TrafficRouter([0, 1]).route("anyone") == 1
+
+    with pytest.raises(ValueError):
+        bucket_table([0, 0])
+
+
+def test_growing_a_variant_keeps_its_users():
+    before = TrafficRouter([95, 5], salt="ramp")
+    after = TrafficRouter([80, 20], salt="ramp")
+    in_b = [user for user in USERS if before.route(user) == 1]
+    assert in_b and all(after.route(user) == 1 for user in in_b)
+
+
+def test_ramp_schedule_advances_the_weights():
+    started = time.time() - 10
+    schedule = RampSchedule([(0, [1, 0]), (5, [0, 1]), (3600, [1, 1])], started_at=started)
+    router = TrafficRouter([1, 1], schedule=schedule)
+    assert router.weights == [0, 1] and router.route("user-1") == 1
+
+    future = TrafficRouter([1, 1], schedule=RampSchedule([(0, [1, 0]), (0.05, [0, 1])]))
+    assert future.route("user-1") == 0
+    time.sleep(0.06)
+    assert future.route("user-1") == 1
+
+
+def test_runner_routes_by_weight():
+    async def scenario():
+        runner = InferenceRunner()
+        runner.set_configs(batch_timeout=0.001, warmup=False)
+        models = [Model(ConstantModel(value), DummyProcessor(), "1", name, variant, loggers=[], histories=[DummyHistory()])
+                  for value, name, variant in ((0.0, "live", "A"), (1.0, "candidate", "B"))]
+        await runner.swap_models(models, ab_test_mode=ABTestMode.hash_split, weights=[0, 1])
+        request = PredictRequest(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=22, SibSp=1,
+                                 Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S")
+        responses = await asyncio.gather(*(runner.run_inference(request, f"user-{i}") for i in range(20)))
+        assert {response.survived for response in responses} == {1.0}
+
+        with pytest.raises(ValueError):
+            await runner.swap_models(models, ab_test_mode=ABTestMode.split, weights=[1, 1, 1])
+
+    asyncio.run(scenario())
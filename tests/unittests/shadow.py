@@ -0,0 +1,83 @@
+import asyncio
+
+from app.api.models import PredictRequest
+from app.serve.ab_test.ab import ABTestMode
+from app.serve.inference import InferenceRunner
+from app.serve.model import Model
+
+
+class ConstantModel:
+    def __init__(self, value: float):
+        self.value = value
+        self.rows = 0
+
+    def predict(self, data):
+        self.rows += len(data)
+        return [self.value] * len(data)
+
+class RecordingHistory:
+    def __init__(self):
+        self.variants = []
+
+    def insert_history(self, **kwargs):
+        self.variants.append(kwargs["variant"])
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+
+def make_request() -> PredictRequest:
+    return PredictRequest(Pclass=3, Name="Braund, Mr. Owen Harris", Sex="male", Age=22, SibSp=1,
+                          Parch=0, Ticket="A/5 21171", Fare=7.25, Cabin="", Embarked="S")
+
+
+async def shadow_runner(model_A, model_B, history, **configs) -> InferenceRunner:
+    runner = InferenceRunner()
+    runner.set_configs(batch_size=8, batch_timeout=0.01, warmup=False, **configs)
+    models = [Model(model, DummyProcessor(), "1", name, variant, loggers=[], histories=[history])
+              for model, name, variant in ((model_A, "live", "A"), (model_B, "candidate", "B"))]
+    await runner.swap_models(models, ab_test_mode=ABTestMode.shadow)
+    return runner
+
+
+def test_shadow_is_scored_off_the_critical_path():
+    async def scenario():
+        history = RecordingHistory()
+        model_A, model_B = ConstantModel(0.8), ConstantModel(0.3)
+        runner = await shadow_runner(model_A, model_B, history)
+        response = await runner.run_inference(make_request())
+        # B is only queued once A answered
+        assert response.survived == 0.8 and model_B.rows == 0
+        responses = await asyncio.gather(*(runner.run_inference(make_request()) for _ in range(19)))
+        assert {response.survived for response in responses} == {0.8}
+
+        await runner.shadow.wait_idle()
+        stats = runner.shadow.stats()
+        assert model_B.rows == 20 and stats["scored"] == 20
+        assert abs(stats["divergence_mean"] - 0.5) < 1e-9
+        assert stats["disagreement_rate"] == 1.0
+        # Only the live variant goes to the sinks
+        assert set(history.variants) == {"A"}
+
+    asyncio.run(scenario())
+
+
+def test_shadow_sheds_and_samples():
+    async def scenario():
+        model_B = ConstantModel(0.8)
+        runner = await shadow_runner(ConstantModel(0.8), model_B, RecordingHistory(), shadow_max_pending=4)
+        await asyncio.gather(*(runner.run_inference(make_request()) for _ in range(20)))
+        await runner.shadow.wait_idle()
+        stats = runner.shadow.stats()
+        assert stats["scored"] + stats["shed"] == 20
+        assert stats["shed"] > 0 and stats["pending"] == 0
+        assert stats["disagreement_rate"] == 0.0
+
+        runner.set_configs(shadow_sample_rate=0.0)
+        scored = model_B.rows
+        await asyncio.gather(*(runner.run_inference(make_request()) for _ in range(20)))
+        await runner.shadow.wait_idle()
+        assert model_B.rows == scored
+
+    asyncio.run(scenario())
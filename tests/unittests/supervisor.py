@@ -0,0 +1,103 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import httpx
+import joblib
+import pytest
+
+from app.main import app
+from app.serve.model_server import model_hub
+from app.serve.supervisor import Supervisor
+
+
+class EchoAgeModel:
+    def predict(self, data):
+        return [float(age) for age in data["Age"]]
+
+class ConstantModel:
+    def predict(self, data):
+        return [1.0] * len(data)
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+
+ROW = {"Pclass": 3, "Name": "Braund, Mr. Owen Harris", "Sex": "male", "Age": 22, "SibSp": 1,
+       "Parch": 0, "Ticket": "A/5 21171", "Fare": 7.25, "Cabin": "", "Embarked": "S"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def run_supervisor(directory: str, port: int, workers: int):
+    os.chdir(directory)
+    os.environ.update(USE_MLFLOW="false", WARMUP_ROWS="8")
+    # Registered before the fork, so every worker inherits it
+    model_hub._loaded_models["echo(1)"] = (DummyProcessor(), EchoAgeModel())
+    supervisor = Supervisor(app, host="127.0.0.1", port=port, workers=workers, log_level="warning")
+    supervisor.broadcast("deploy", {"model_name": "echo", "model_version": "1"})
+    supervisor.run()
+
+def worker_pids(pid: int) -> list[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+async def predict_many(base_url: str, n: int) -> set:
+    # No keep-alive, so the requests spread over the workers
+    limits = httpx.Limits(max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        responses = await asyncio.gather(*(client.post("/predict", json=ROW) for _ in range(n)))
+    return {response.json()["survived"] for response in responses}
+
+def wait_healthy(base_url: str, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            time.sleep(0.05)
+    raise TimeoutError(base_url)
+
+
+@pytest.mark.skipif(not os.path.exists(f"/proc/{os.getpid()}/task/{os.getpid()}/children"),
+                    reason="needs /proc children lists")
+def test_control_plane_reaches_every_worker(tmp_path):
+    joblib.dump(ConstantModel(), tmp_path / "model.joblib")
+    joblib.dump(DummyProcessor(), tmp_path / "preprocessor.joblib")
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = multiprocessing.get_context("fork").Process(target=run_supervisor, args=(str(tmp_path), port, 2))
+    process.start()
+    try:
+        wait_healthy(base_url)
+        assert asyncio.run(predict_many(base_url, 20)) == {22.0}
+
+        loaded = httpx.post(f"{base_url}/load", json={"model_path": str(tmp_path / "model.joblib"),
+                                                      "preprocessor_path": str(tmp_path / "preprocessor.joblib"),
+                                                      "name": "constant", "version": "2"}, timeout=30).json()
+        assert loaded["status"] == "Model loaded successfully"
+        deployed = httpx.post(f"{base_url}/deploy", json={"model_name": "constant", "model_version": "2"},
+                              timeout=30).json()
+        assert deployed["status"] == "Model deployed successfully"
+        assert asyncio.run(predict_many(base_url, 40)) == {1.0}
+
+        # A replacement worker replays the log and ends up serving the same model
+        old_pids = worker_pids(process.pid)
+        os.kill(old_pids[0], signal.SIGKILL)
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline and (len(worker_pids(process.pid)) < 2
+                                               or old_pids[0] in worker_pids(process.pid)):
+            time.sleep(0.05)
+        assert asyncio.run(predict_many(base_url, 40)) == {1.0}
+    finally:
+        process.terminate()
+        process.join(30)
+    assert process.exitcode == 0
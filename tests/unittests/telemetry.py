@@ -0,0 +1,129 @@
+import threading
+import time
+
+from prometheus_client import REGISTRY
+
+from app.loggers.extensions.base import LoggingExtension
+from app.loggers.telemetry import BatchRecord, SinkConsumer, TelemetryBus
+
+
+class DummyHistory:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.records = []
+        self.closed = False
+
+    def insert_history(self, **kwargs):
+        time.sleep(self.delay)
+        self.records.append(kwargs)
+
+    def close(self):
+        self.closed = True
+
+class DummyLogger(LoggingExtension):
+    def __init__(self):
+        self.rows = []
+        self.batch_sizes = []
+
+    def new_experiment(self, experiment_name):
+        pass
+
+    def log(self, **kwargs):
+        self.rows.append(kwargs)
+
+    def log_batch_size(self, model_name, model_version, variant, batch_size):
+        self.batch_sizes.append(batch_size)
+
+
+def make_record(n: int = 4, prediction: float = 1.0) -> BatchRecord:
+    return BatchRecord("titanic", "1", "deploy", inputs=[{"Age": i} for i in range(n)], outputs=[prediction] * n,
+                       latencies=[2.0] * n, wait_times=[1.0] * n, inference_time=0.5)
+
+
+def test_bus_fans_out_batches_to_every_sink():
+    logger, history = DummyLogger(), DummyHistory()
+    bus = TelemetryBus([logger], [history])
+    bus.publish(make_record(4))
+    bus.publish(make_record(2))
+    assert bus.flush(5)
+    assert len(logger.rows) == 6 and logger.batch_sizes == [4, 2]
+    assert logger.rows[0]["latency"] == 2.0 and logger.rows[0]["inference_time"] == 0.5
+    assert [r["input_data"] for r in history.records[:4]] == [{"Age": i} for i in range(4)]
+    bus.close()
+    assert history.closed
+
+def test_slow_sink_does_not_block_publish_or_other_sinks():
+    slow, fast = DummyHistory(delay=0.5), DummyHistory()
+    bus = TelemetryBus(histories=[slow, fast])
+    start = time.perf_counter()
+    for _ in range(100):
+        bus.publish(make_record(1))
+    assert time.perf_counter() - start < 0.1
+    assert bus.consumers[1].flush(5)
+    assert len(fast.records) == 100
+    assert len(slow.records) < 100
+
+def test_full_buffer_drops_oldest():
+    release = threading.Event()
+    handled = []
+
+    def handler(record):
+        return [lambda: (release.wait(5), handled.append(record.outputs[0]))]
+
+    consumer = SinkConsumer("blocked-sink", handler, max_records=4, batch_records=1, flush_interval=0.001)
+    consumer.publish(make_record(1, prediction=-1))
+    time.sleep(0.05)   # the consumer is now stuck on the first record
+    for i in range(10):
+        consumer.publish(make_record(1, prediction=i))
+    assert consumer.dropped == 6
+    assert REGISTRY.get_sample_value("telemetry_queue_depth", {"sink": "blocked-sink"}) == 4
+    release.set()
+    consumer.flush(5)
+    consumer.close()
+    assert handled == [-1, 6, 7, 8, 9]
+    assert REGISTRY.get_sample_value("telemetry_dropped_events_total",
+                                     {"sink": "blocked-sink", "reason": "overflow"}) == 6
+
+def test_failed_batches_are_retried_then_dropped():
+    attempts = []
+
+    def flaky(record):
+        def write():
+            attempts.append(len(record.outputs))
+            if len(attempts) < 3:
+                raise ConnectionError("sink unavailable")
+        return [write]
+
+    consumer = SinkConsumer("flaky-sink", flaky, max_retries=3, retry_backoff=0.001)
+    consumer.publish(make_record())
+    consumer.flush(5)
+    assert len(attempts) == 3 and consumer.failed == 0
+
+    def broken(record):
+        def write():
+            raise ConnectionError("sink unavailable")
+        return [write]
+
+    consumer = SinkConsumer("broken-sink", broken, max_retries=2, retry_backoff=0.001)
+    consumer.publish(make_record())
+    consumer.flush(5)
+    assert consumer.failed == 1
+    consumer.close()
+
+def test_only_the_failed_write_is_retried():
+    class FlakyLogger(DummyLogger):
+        def log(self, **kwargs):
+            if len(self.rows) == 2 and not getattr(self, "failed", False):
+                self.failed = True
+                raise ConnectionError("sink unavailable")
+            super().log(**kwargs)
+
+    logger, history = FlakyLogger(), DummyHistory()
+    bus = TelemetryBus([logger], [history], max_retries=2, retry_backoff=0.001)
+    bus.publish(make_record(4))
+    bus.publish(make_record(2))
+    assert bus.flush(5)
+    assert [row["input_data"] for row in logger.rows] == [{"Age": i} for i in range(4)] + [{"Age": 0}, {"Age": 1}]
+    assert logger.batch_sizes == [4, 2]
+    assert len(history.records) == 6
+    bus.close()
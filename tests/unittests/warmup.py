@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.api.models import PredictRequest
+from app.loggers.history.lite import HistorySQLite
+from app.serve.executor import ExecutorMode, InferenceExecutor
+from app.serve.inference import InferenceRunner
+from app.serve.model import Model
+from app.serve.warmup import replayed_rows, synthetic_rows, warm_up, warmup_rows
+
+
+class DummyModel:
+    def __init__(self, output: float = 1.0, slowdown: float = 0.0):
+        self.output = output
+        self.slowdown = slowdown
+        self.delay = 0.0
+        self.rows = 0
+
+    def predict(self, data):
+        self.rows += len(data)
+        # A model whose latency keeps growing never settles
+        self.delay += self.slowdown
+        time.sleep(self.delay)
+        return [self.output] * len(data)
+
+class DummyHistory:
+    def __init__(self, records=()):
+        self.records = list(records)
+
+    def insert_history(self, **kwargs):
+        pass
+
+    def recent_history(self, limit):
+        return self.records[-limit:]
+
+class DummyProcessor:
+    def transform(self, data):
+        return data
+
+
+def make_model(output: float = 1.0, version: str = "1", slowdown: float = 0.0) -> Model:
+    return Model(DummyModel(output, slowdown), DummyProcessor(), version, "dummy", histories=[DummyHistory()])
+
+
+def test_synthetic_rows_cover_categories():
+    rows = synthetic_rows(18)
+    assert {(r.Pclass, r.Sex, r.Embarked) for r in rows} == {(p, s, e) for p in (1, 2, 3)
+                                                             for s in ("male", "female") for e in "CQS"}
+
+def test_replayed_rows_come_first():
+    row = synthetic_rows(1)[0].model_dump()
+    history = DummyHistory([{"input_data": json.dumps(row)}, {"input_data": "not json"}])
+    assert replayed_rows([history], 10) == [PredictRequest(**row)]
+    rows = warmup_rows([history], 4)
+    assert len(rows) == 4 and rows[0] == PredictRequest(**row)
+
+def test_replayed_rows_are_the_newest(tmp_path):
+    history = HistorySQLite(str(tmp_path / "history.db"))
+    history.create_table()
+    rows = synthetic_rows(30)
+    for row in rows:
+        history.insert_history(model_name="dummy", variant="deploy", model_version="1", input_data=row, prediction=1.0)
+    history.flush()
+    assert replayed_rows([history], 8) == rows[-8:]
+    history.close_connection()
+
+def test_warm_up_settles():
+    model = make_model()
+    report = warm_up(model, synthetic_rows(32), batch_size=8)
+    assert report.stable
+    assert model.model.rows == report.rounds * 9
+
+def test_warm_up_gives_up_on_unstable_latency():
+    report = warm_up(make_model(slowdown=0.0002), synthetic_rows(8), batch_size=4, max_rounds=20,
+                     tolerance=0.05, min_delta=0.0)
+    assert not report.stable and report.rounds == 20
+
+def test_swap_models_without_dropping_requests():
+    runner = InferenceRunner()
+    runner.set_configs(batch_size=4, batch_timeout=0.005, warmup_rows=8)
+    old, new = make_model(output=0.0), make_model(output=1.0, version="2")
+
+    async def scenario():
+        runner.new_batcher(old)
+        retired = runner.get_active_deploy_batcher()
+        request = synthetic_rows(1)[0]
+        traffic = [asyncio.ensure_future(runner.run_inference(request)) for _ in range(50)]
+        reports = await runner.swap_models([new])
+        after = await runner.run_inference(request)
+        before = await asyncio.gather(*traffic)
+        for batcher in runner._running_models.values():
+            batcher.close()
+        return reports, retired, before, after
+
+    reports, retired, before, after = asyncio.run(scenario())
+    assert reports[0].stable
+    assert retired._task.done()
+    assert all(r.survived == 0.0 for r in before)
+    assert after.survived == 1.0
+    assert list(runner._running_models) == ["dummy(2)-deploy"]
+
+def test_unstable_model_is_not_deployed():
+    runner = InferenceRunner()
+    runner.set_configs(warmup_rows=4, warmup_max_rounds=20, warmup_tolerance=0.0, batch_size=4)
+
+    async def scenario():
+        runner.new_batcher(make_model())
+        with pytest.raises(ValueError):
+            await runner.swap_models([make_model(version="2", slowdown=0.0002)])
+        keys = list(runner._running_models)
+        for batcher in runner._running_models.values():
+            batcher.close()
+        return keys
+
+    assert asyncio.run(scenario()) == ["dummy(1)-deploy"]
+
+def test_process_workers_are_warmed_before_the_switch(monkeypatch):
+    warmed = []
+    warm = InferenceExecutor.warm
+    monkeypatch.setattr(InferenceExecutor, "warm", lambda self, rows: warmed.append(self) or warm(self, rows))
+    runner = InferenceRunner()
+    runner.set_configs(executor_mode=ExecutorMode.process, executor_workers=2, warmup_rows=8, batch_size=4,
+                       batch_timeout=0.001)
+    model = make_model()
+
+    async def scenario():
+        reports = await runner.swap_models([model])
+        batcher = runner.get_active_deploy_batcher()
+        response = await runner.run_inference(synthetic_rows(1)[0])
+        batcher.close()
+        return reports, batcher, response
+
+    reports, batcher, response = asyncio.run(scenario())
+    assert reports[0].stable and response.survived == 1.0
+    assert set(warmed) == {batcher.executor}
+    # Scored by the pool workers that went on to serve, not by this process
+    assert model.model.rows == 0